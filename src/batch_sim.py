@@ -0,0 +1,173 @@
+'''
+Lockstep simulation of several design configurations in one process.
+
+All configurations of a sweep (e.g. the rows of sample_plan_300.csv) share the time axis and the input
+profiles, they only differ in capacities, tank volume, supply_config and set points. The BatchWorld
+advances all of them with one time loop, in every step the evaluation order of the native engine is walked
+once, each node is stepped for all configurations together (native_sim.Node.step_batch):
+
+* the input nodes (heat load and pv) are built once and stepped once per time step for all configurations,
+  configurations with the same pv parameters share one pv profile,
+* the CHPs and the boilers of all configurations are units of one TransformerBank per unit type (vectorized from
+  TransformerBank.vectorize_from configurations on),
+* the controllers are bound to a ControllerBank: the generator states, tank ports and sensor temperatures are
+  (n_configs, ...) arrays, the rule table and the tank balance are evaluated as array operations over the
+  configurations (from ControllerBank.vectorize_from configurations on); the demands and consumer flows
+  (Controller.step_supply) are still computed per configuration,
+* the recorded outputs are kept as struct of arrays, one (n_configs, n_steps) NumPy array per attribute,
+  instead of one nested dict per configuration.
+
+The heat pump and hot water tank models (mosaik_components) keep one object per configuration, the tank
+uses adaptive sub steps and layer flips which differ between configurations. The values are copied between the
+models per configuration (the connections of the native engine).
+
+A configuration that raises an exception is stopped, the others continue; the error is kept in
+BatchWorld.errors and its result is None. A configuration that meets an abort criterion (collector.AbortCriteria)
+is stopped as well, its result is a collector.AbortedRun with the data recorded until then.
+'''
+import numpy as np
+from tqdm import tqdm
+
+from src.models.collector import AbortedRun, SimulationAborted
+from src.native_sim import NativeWorld, CSVNode, SENTINEL, add_scenario
+
+
+class Column():
+    '''
+    Recorded values of one attribute for all configurations. Numbers are stored in a float array, the
+    column switches to an object array, if the attribute provides anything else (strings, bools, None).
+    '''
+    def __init__(self, n_configs, n_steps):
+        self.values = np.zeros((n_configs, n_steps))
+        self.present = np.zeros((n_configs, n_steps), dtype=bool) # False where the source did not provide a value
+
+    def set(self, config, step, val):
+        if self.values.dtype != object and (type(val) is bool or not isinstance(val, (float, int))):
+            self.values = self.values.astype(object)
+        self.values[config, step] = val
+        self.present[config, step] = True
+
+
+class BatchWorld():
+    '''
+    Runs the NativeWorlds of the configurations in lockstep, the worlds need the same scenario (the same nodes in the
+    same evaluation order, see build_batch). The nodes in `shared` are part of every world, but are stepped only once
+    per time step.
+    '''
+    def __init__(self, worlds, shared, step_size):
+        self.worlds = worlds
+        self.shared = shared
+        self.step_size = step_size
+        self.columns = {}  # (full_id, attr) : Column
+        self.times = None
+        self.errors = {}   # config : exception
+        self.aborted = {}  # config : SimulationAborted
+
+    def run(self, until, progress=True, criteria=None):
+        '''Runs all configurations until the given time, criteria are the AbortCriteria of every configuration (or None).'''
+        n_configs = len(self.worlds)
+        self.times = np.arange(0, until, self.step_size)
+        n_steps = len(self.times)
+
+        shared = set(self.shared)
+        plans, compiled = [], []
+        for config, world in enumerate(self.worlds):
+            plan, buffer, buffered, recorded = world.compile()
+            plans.append([step for step in plan if step[0] not in shared])
+            columns = []
+            for full_id, attr, get in recorded:
+                if (full_id, attr) not in self.columns:
+                    self.columns[(full_id, attr)] = Column(n_configs, n_steps)
+                columns.append((self.columns[(full_id, attr)], (full_id, attr), get))
+            check = criteria[config].check if criteria is not None else None
+            compiled.append((config, buffer, buffered, columns, check))
+        if len({len(plan) for plan in plans}) > 1:
+            raise ValueError('The worlds of a batch need the same nodes in the same evaluation order.')
+        stages = list(zip(*plans)) # (node, live, shifted) of every configuration, per position in the evaluation order
+        owner = {node : config for config, plan in enumerate(plans) for node, _, _ in plan}
+
+        for step, time in enumerate(tqdm(self.times.tolist(), disable=not progress)):
+            for node in self.shared:
+                node.step(time)
+
+            for stage in stages:
+                nodes = []
+                for config, (node, live, shifted) in enumerate(stage):
+                    if config in self.errors or config in self.aborted:
+                        continue
+                    try:
+                        for setter, slot in shifted:
+                            val = compiled[config][1][slot]
+                            if val is not SENTINEL:
+                                setter(val)
+                        for setter, getter in live:
+                            val = getter()
+                            if val is not SENTINEL:
+                                setter(val)
+                    except Exception as e:
+                        self.errors[config] = e
+                        continue
+                    nodes.append(node)
+                if nodes:
+                    for node, e in type(nodes[0]).step_batch(nodes, time).items():
+                        self.errors[owner[node]] = e
+
+            for config, buffer, buffered, columns, check in compiled:
+                if config in self.errors or config in self.aborted:
+                    continue
+                try:
+                    for slot, getter in buffered:
+                        buffer[slot] = getter()
+                    for column, key, get in columns:
+                        val = get()
+                        if val is not SENTINEL:
+                            column.set(config, step, val)
+                            if check is not None:
+                                check(key, time, val)
+                except SimulationAborted as aborted:
+                    self.aborted[config] = aborted
+                except Exception as e:
+                    self.errors[config] = e
+
+        results = []
+        for config in range(n_configs):
+            if config in self.errors:
+                results.append(None)
+            elif config in self.aborted:
+                results.append(AbortedRun(self.result(config), self.aborted[config]))
+            else:
+                results.append(self.result(config))
+        return results
+
+    def result(self, config):
+        '''
+        Recorded data of one configuration in the shape of the collector dump, {full_id : {attr : {time : value}}}.
+        '''
+        times = self.times.tolist()
+        data = {}
+        for (full_id, attr), column in self.columns.items():
+            present = column.present[config]
+            if not present.any():
+                continue # the collector only knows attributes it received at least once
+            values = column.values[config].tolist()
+            data.setdefault(full_id, {})[attr] = {time: val for time, val, ok in zip(times, values, present) if ok}
+        return data
+
+
+def build_batch(params_list, pv_results_list, heat_load_data, start, until, step_size):
+    '''
+    One world per configuration, built like native_sim.build_world. The heat load node is shared by all,
+    pv nodes by all configurations with the same pv profile (the same object in pv_results_list).
+    The same node of all worlds is bound for stepping together (Node.bind_batch), e.g. the CHPs into one TransformerBank.
+    '''
+    heat_load = CSVNode('CSV-1.HEATLOAD_0', heat_load_data, start, step_size, until)
+    pv_nodes = {}
+    for pv_results in pv_results_list:
+        if id(pv_results) not in pv_nodes:
+            pv_nodes[id(pv_results)] = CSVNode('CSV-0.Data_0', pv_results, start, step_size, until)
+
+    worlds = [add_scenario(NativeWorld(step_size), params, pv_nodes[id(pv_results)], heat_load)
+              for params, pv_results in zip(params_list, pv_results_list)]
+    for nodes in zip(*(world.nodes for world in worlds)):
+        type(nodes[0]).bind_batch(nodes)
+    return BatchWorld(worlds, [heat_load, *pv_nodes.values()], step_size)
@@ -25,10 +25,36 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_PATH = os.path.join(current_dir, "..", 'data/outputs')
 sys.path.append(os.path.join(current_dir, ".."))
 
-from src.models import pvlib_model
+from src.models import hp_lookup, pvlib_model
+from src.models import collector as collector_module
+from src import native_sim
+from src import batch_sim
 #______________________________moved outside method, to be accessible from other scripts(visu.ipynb)
 #TODO use the param file in visu
 STEP_SIZE = 60*15 # step size 15 minutes
+START = '2022-01-01 00:00:00'
+END =  365*24*60*60 # one year in seconds
+HEAT_LOAD_DATA = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', 'data', 'inputs', 'Input_kfw55_2_el.csv'))
+# example recording config of run_DES(params, recording=RECORDING): all recorded attributes in memory and in the
+# run file data/outputs/DES_data/, energies in Wh computed during the run (see collector.Recorder.from_config)
+RECORDING = {
+    'columns' : {},
+    'file' : {'path' : os.path.join(OUTPUT_PATH, 'DES_data')},
+    'kpis' : {
+        'hp_el' : ['HeatPumpSim-0.HeatPump_0-P_Required', 'energy'],
+        'hp_th' : ['HeatPumpSim-0.HeatPump_0-Q_Supplied', 'energy'],
+        'chp_el' : ['Chpsim_v2-0.CHP0-P_el', 'energy'],
+        'chp_th' : ['Chpsim_v2-0.CHP0-P_th', 'energy'],
+        'boiler_th' : ['Boilersim_v2-0.Boiler0-P_th', 'energy'],
+        'pv_el' : ['ControllerSim-0.Controller_0-pv_gen', 'energy'],
+    },
+}
+# example abort criteria of run_DES(params, abort=ABORT): a configuration, whose ideal heater supplies more than
+# 5 MWh in January, is stopped (see collector.AbortCriteria; the configurations of the sample plan that meet their
+# demand stay below 1 MWh in January, the others reach ~15 MWh)
+ABORT = {
+    'aux_heat' : ['ControllerSim-0.Controller_0-IdealHrodsum', 'energy', 5e6, '2022-02-01 00:00:00'],
+}
 HV = 10833.3 #Heating value of natural gas in Wh/m^3; standard cubic meter
 
 ref_param_filename = 'ref_params.json'
@@ -72,7 +98,75 @@ def hash_encrypt(changes):
         # json.dump(changes, f, indent=4)
     return hash_str
 
-def run_DES(params, collect=True, plot_graph=False):
+_templates = {} # until : native_sim.WorldTemplate, kept for the life of the process
+
+def native_template(until=END):
+    '''Compiled world of the native engine (see native_sim.WorldTemplate), built once per process and until.'''
+    if until not in _templates:
+        _templates[until] = native_sim.WorldTemplate(HEAT_LOAD_DATA, START, until, STEP_SIZE, pvlib_model.profile)
+    return _templates[until]
+
+@hp_lookup.cached() # the lookup files of the heat pump are parsed once, not in every step
+def run_DES_batch(params_list, until=END, progress=True, abort=None):
+    '''
+    Simulates several configurations in lockstep in one process (see batch_sim.py), with the same
+    results as run_DES(params, engine='native') for each of them.
+    The pv model runs once per distinct set of pv parameters.
+    abort: abort criteria (see run_DES), checked for every configuration, a stopped configuration returns a
+           collector.AbortedRun with its data until then.
+    Returns (list of collector data per configuration, None for crashed ones; dict of errors per index).
+    '''
+
+    pv_results = {}
+    pv_results_list = []
+    for params in params_list:
+        params['ctrl']['tank'] = params['tank']
+        params['params_chp']['step_size'] = STEP_SIZE
+        params['ctrl']['signals'] = {'datafile' : HEAT_LOAD_DATA, 'start' : START, 'until' : until}
+        key = json.dumps(params['pv'], sort_keys=True)
+        if key not in pv_results:
+            pv_results[key] = pvlib_model.profile(params['pv'])
+        pv_results_list.append(pv_results[key])
+
+    batch_world = batch_sim.build_batch(params_list, pv_results_list, HEAT_LOAD_DATA, START, until, STEP_SIZE)
+    criteria = None
+    if abort is not None:
+        criteria = [collector_module.AbortCriteria(START, until, STEP_SIZE, abort) for _ in params_list]
+    data = batch_world.run(until, progress=progress, criteria=criteria)
+    return data, batch_world.errors
+
+@hp_lookup.cached()
+def run_DES(params, collect=True, plot_graph=False, engine='mosaik', until=END, columnar=False, spill=None,
+            output='binary', output_compression=None, recording=None, abort=None):
+    '''
+    Simulates the DES for the given params.
+
+    engine: 'mosaik' (default) runs the scenario in a mosaik World, 'native' steps the same models
+            in-process (see native_sim.py), without the DES_data output; the world is instantiated from the
+            template of the process (native_template), only the models are created per call.
+    until: end of the simulation in seconds, defaults to one year.
+    columnar: record into preallocated arrays (collector.ColumnStore) and return a DataFrame with one
+              column '<full_id>-<attr>' per recorded attribute and a DatetimeIndex.
+    spill: directory of a run file (see utils/run_file.py); implies columnar, completed months are written to disk
+           during the run instead of being kept in memory, and a RunFile handle is returned.
+    output: DES_data output of the mosaik engine, 'binary' (default) writes the run file data/outputs/DES_data/
+            (see models/output_writer.py, utils.run_file.export_csv for a csv), 'csv' data/outputs/DES_data.csv
+            with mosaik_csv_writer, None none.
+    output_compression: 'zlib' compresses the columns of the binary output.
+    recording: recording config (see collector.Recorder.from_config, e.g. RECORDING), replaces columnar, spill and
+               output: every recorded attribute (in the mosaik scenario including the output attributes of the tanks)
+               is sent once to the collector, which passes it to the configured sinks (columns, file, kpis).
+               A collector.Recording is returned.
+    abort: abort criteria (see collector.AbortCriteria, e.g. ABORT), implies columnar: the recorded values are
+           checked during the run, if a criterion is met, the run is stopped and a collector.AbortedRun with the data
+           recorded until then is returned.
+    Returns the data of the collector, {full_id : {attr : {time : value}}} (or the DataFrame/RunFile), if collect is True.
+    '''
+    if engine not in ('mosaik', 'native'):
+        raise ValueError(f"Unknown engine '{engine}', use 'mosaik' or 'native'.")
+    if output not in ('binary', 'csv', None):
+        raise ValueError(f"Unknown output '{output}', use 'binary', 'csv' or None.")
+
     sim_config = {
         'EnergyTransformer' : {
             'python' : 'src.models.EnergyTransformer_frame:TransformerSimulator',
@@ -85,11 +179,14 @@ def run_DES(params, collect=True, plot_graph=False):
         },
         
         'CSV': {
-            'python': 'mosaik_csv:CSV',
+            'python': 'src.models.cached_csv:CSV', # drop-in for mosaik_csv:CSV with a binary cache of the file
         },
         'CSV_writer': {
             'python': 'mosaik_csv_writer:CSVWriter'
         },
+        'Output_writer': {
+            'python': 'src.models.output_writer:OutputWriter', # binary DES_data output
+        },
         'HeatPumpSim': {
             'python': 'mosaik_components.heatpump.Heat_Pump_mosaik:HeatPumpSimulator',
         },
@@ -121,10 +218,6 @@ def run_DES(params, collect=True, plot_graph=False):
     
     # Create World
     
-    world = mosaik.World(sim_config, mosaik_config={'addr':('127.0.0.1', 0)})
-    START = '2022-01-01 00:00:00'
-    END =  365*24*60*60 # one year in seconds
-
     # unpacking input params
     
     params_hp = params['hp']
@@ -139,12 +232,32 @@ def run_DES(params, collect=True, plot_graph=False):
     params_chp['step_size'] = STEP_SIZE
     params_pv = params['pv']
 
-   
+    params['ctrl']['signals'] = {'datafile' : HEAT_LOAD_DATA, 'start' : START, 'until' : until} # precomputed controller inputs
+
+    if engine == 'native':
+        native_world = native_template(until).instantiate(params)
+        store = None
+        if recording is not None:
+            store = collector_module.Recorder.from_config(START, until, STEP_SIZE, recording)
+        elif spill is not None:
+            store = collector_module.SpillingStore(START, until, STEP_SIZE, spill)
+        elif columnar or abort is not None:
+            store = collector_module.ColumnStore(START, until, STEP_SIZE)
+        if abort is not None:
+            store = collector_module.AbortingStore(store, collector_module.AbortCriteria(START, until, STEP_SIZE, abort))
+        try:
+            data = native_world.run(until, store=store)
+        except collector_module.SimulationAborted as aborted:
+            data = collector_module.AbortedRun(store.result(), aborted)
+        return data if collect else None
+
+    world = mosaik.World(sim_config, mosaik_config={'addr':('127.0.0.1', 0)})
+
 
     # -----------------------------------------pv-------------------------------------------------------------------------------------
     #Standalone pvmodel-------------------------------------------------
-    pv_results = pvlib_model.sim(params_pv)
-    pv_csv = world.start('CSV', sim_start = START, datafile = pv_results)
+    pv_results = pvlib_model.profile(params_pv)
+    pv_csv = world.start('CSV', sim_start = START, datafile = pv_results) # pv profile served from memory
 
     pv_mod = pv_csv.Data.create(1)
         
@@ -179,7 +292,6 @@ def run_DES(params, collect=True, plot_graph=False):
     #------------------------------------------PV END-----------------------------------------------------------------------------------------------------------------  
 
     # ----------------------Input data csv------------------------
-    HEAT_LOAD_DATA = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', 'data', 'inputs', 'Input_kfw55_2_el.csv'))
     # configure the simulator
     csv = world.start('CSV', sim_start=START, datafile=HEAT_LOAD_DATA)
     # Instantiate model
@@ -190,12 +302,28 @@ def run_DES(params, collect=True, plot_graph=False):
     # prefix, hash_prefix = '',''
     
     # configure the simulator
-    csv_sim_writer = world.start('CSV_writer', start_date= START, date_format='%Y-%m-%d %H:%M:%S',
-                                output_file=os.path.join(OUTPUT_PATH, 'DES_data.csv'))
-
-    collector = world.start('Collector')
+    if recording is not None:
+        output = None
+    if output == 'csv':
+        csv_sim_writer = world.start('CSV_writer', start_date= START, date_format='%Y-%m-%d %H:%M:%S',
+                                    output_file=os.path.join(OUTPUT_PATH, 'DES_data.csv'))
+    elif output == 'binary':
+        csv_sim_writer = world.start('Output_writer', start_date=START, end=until, step_size=STEP_SIZE,
+                                     output_dir=os.path.join(OUTPUT_PATH, 'DES_data'), compression=output_compression)
+
+    columnar = columnar or spill is not None or recording is not None or abort is not None
+    if columnar:
+        collector = world.start('Collector', start_date=START, end=until, step_size=STEP_SIZE, spill=spill, recording=recording,
+                                abort=abort)
+    else:
+        collector = world.start('Collector')
     # Instantiate model
-    csv_writer = csv_sim_writer.CSVWriter(buff_size=15 * 60 * 60)
+    if output == 'csv':
+        csv_writer = csv_sim_writer.CSVWriter(buff_size=15 * 60 * 60)
+    elif output == 'binary':
+        csv_writer = csv_sim_writer.OutputWriter()
+    else:
+        csv_writer = None
     col = collector.Collector()
     #-------------------------------------------------------------
 
@@ -365,39 +493,37 @@ def run_DES(params, collect=True, plot_graph=False):
 
     """__________________________________________ CSV ___________________________________________________________________""" 
     # connect everything to the csv writer
-    world.connect(heat_load[0], csv_writer, 'T_amb', 'Heat Demand [kW]')
-    world.connect(heatpump[0], csv_writer, 'Q_Demand', 'Q_Supplied', 'T_amb', 'heat_source_T', 'cons_T',
+    output_attrs = [
+        (heat_load[0], ['T_amb', 'Heat Demand [kW]']),
+        (heatpump[0], ['Q_Demand', 'Q_Supplied', 'T_amb', 'heat_source_T', 'cons_T',
                 'P_Required',
-                'COP', 'cond_m', 'cond_in_T', 'on_fraction','Q_evap')
-
-    world.connect(ctrls[0], csv_writer, 'heat_demand', 'heat_supply', 'generators.hp_demand', 'generators.hp_supply',
+                'COP', 'cond_m', 'cond_in_T', 'on_fraction','Q_evap']),
+        (ctrls[0], ['heat_demand', 'heat_supply', 'generators.hp_demand', 'generators.hp_supply',
                 'generators.chp_demand', 'generators.chp_supply', 'sh_supply', 'dhw_supply', 
                  'pv_gen',
-                 'IdealHrodsum', 'generators.boiler_demand', 'chp_uptime', 'req_shTsup')
-
-    world.connect(hwts0[0], csv_writer, 'sensor_00.T', 'sensor_01.T', 'sensor_02.T', 
+                 'IdealHrodsum', 'generators.boiler_demand', 'chp_uptime', 'req_shTsup']),
+        (hwts0[0], ['sensor_00.T', 'sensor_01.T', 'sensor_02.T', 
                 'heat_out.T', 'heat_out.F', 'hp_in.T', 'hp_in.F', 'hp_out.T',
                 'hp_out.F', 'heat_in.T', 'heat_in.F','heat_out2.F', 'heat_out2.T',
-                'T_mean')
-
-    world.connect(hwts1[0], csv_writer, 'sensor_00.T', 'sensor_01.T', 'sensor_02.T', 
+                'T_mean']),
+        (hwts1[0], ['sensor_00.T', 'sensor_01.T', 'sensor_02.T', 
                 'heat_out.T', 'heat_out.F', 'hp_in.T', 'hp_in.F', 'hp_out.T',
                 'hp_out.F', 'heat_in.T', 'heat_in.F', 'heat_out2.F', 'heat_out2.T',
-                'T_mean')
-
-    world.connect(hwts2[0], csv_writer, 'sensor_00.T', 'sensor_01.T', 'sensor_02.T', 
+                'T_mean']),
+        (hwts2[0], ['sensor_00.T', 'sensor_01.T', 'sensor_02.T', 
                 'heat_out.T', 'heat_out.F', 'hp_in.T', 'hp_in.F', 'hp_out.T',
                 'hp_out.F', 'heat_in.T', 'heat_in.F',
-                'T_mean', 'hr_1.P_th', 'heat_out2.F', 'heat_out2.T')
-
-    # world.connect(chp[0], csv_writer, 'eff_el', 'nom_P_th', 'mdot', 'mdot_neg', 'temp_in', 'Q_Demand', 'temp_out',
-    #                'P_th', 'P_el', 'fuel_m3', 'chp_uptime'
-    #               )  
-    world.connect(chp[0], csv_writer,  'P_th', 'mdot', 'mdot_neg', 'temp_in', 'Q_demand', 'temp_out',
-                    'P_el', 'uptime'
-                  )  
-    # world.connect(boiler[0], csv_writer, 'P_th', 'Q_Demand', 'temp_out', 'fuel_m3', 'mdot')   
-    world.connect(boiler[0], csv_writer, 'P_th', 'Q_demand', 'temp_out', 'mdot')   
+                'T_mean', 'hr_1.P_th', 'heat_out2.F', 'heat_out2.T']),
+        # (chp[0], ['eff_el', 'nom_P_th', 'mdot', 'mdot_neg', 'temp_in', 'Q_Demand', 'temp_out',
+        #           'P_th', 'P_el', 'fuel_m3', 'chp_uptime']),
+        (chp[0], ['P_th', 'mdot', 'mdot_neg', 'temp_in', 'Q_demand', 'temp_out',
+                    'P_el', 'uptime']),
+        # (boiler[0], ['P_th', 'Q_Demand', 'temp_out', 'fuel_m3', 'mdot']),
+        (boiler[0], ['P_th', 'Q_demand', 'temp_out', 'mdot']),
+    ]
+    if csv_writer is not None:
+        for entity, attrs in output_attrs:
+            world.connect(entity, csv_writer, *attrs)
 
     # auto-connect *all* source attributes to collector
     def connect_all_attrs(world, src_sim, src_entities, collector_ent):
@@ -415,6 +541,12 @@ def run_DES(params, collect=True, plot_graph=False):
     # connect_all_attrs(world, hwtsim1, hwts1, col)
     # connect_all_attrs(world, hwtsim2, hwts2, col)    
     connect_all_attrs(world, csv, heat_load, col)
+    if recording is not None:
+        # the recorder replaces the output writer: the output attributes of the other models are sent to it once
+        collected = {e.full_id for e in boiler + chp + ctrls + heatpump + heat_load}
+        for entity, attrs in output_attrs:
+            if entity.full_id not in collected:
+                world.connect(entity, col, *attrs)
     
     """__________________________________________ world run _______________________________________________________________________________________________________________"""
 
@@ -424,10 +556,18 @@ def run_DES(params, collect=True, plot_graph=False):
     
     data = None
     if collect == True:
-        data = collector.dump() 
+        data = collector.store() if columnar else collector.dump() # filled during the run
 
     # Run simulation
-    world.run(until=END)
+    aborted = None
+    try:
+        world.run(until=until)
+    except collector_module.SimulationAborted as e:
+        aborted = e
+    if columnar and collect:
+        data = data.result()
+        if aborted is not None:
+            data = collector_module.AbortedRun(data, aborted)
 
     # plot the data flow
     if plot_graph == True:
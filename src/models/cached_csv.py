@@ -0,0 +1,216 @@
+'''
+Cached csv input simulator, a drop-in replacement of mosaik_csv:CSV.
+
+Parsing the text of a csv time series (e.g. the heat load Input_kfw55_2_el.csv) is the largest part of the start
+of a run. load_table() converts a csv file once into a binary cache (data/cache/inputs/<name>-<hash>/, one .npy
+file per column and meta.json) keyed by the hash of the file content; later calls (in any process) only memory map
+the columns they need. The values are the ones mosaik_csv serves: numbers as python int/float, everything else
+as str, the row at time t is the last row with a timestamp <= t.
+
+The CSV simulator takes the same parameters as mosaik_csv plus
+* attrs : list of the columns to serve (column projection), default all,
+* cache : False reads the file without writing a cache (e.g. for files that are written for one run only).
+datafile may also be a DataFrame/Series in memory (see load_table), no file is written or read then.
+'''
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import mosaik_api_v3 as mosaik_api
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cache', 'inputs'))
+META_FILE = 'meta.json'
+
+
+class Table():
+    '''
+    Columns of a csv file as arrays (memory mapped, if loaded from the cache); numeric columns keep their
+    dtype, all others are str arrays. index holds the timestamps of the rows as datetime64[ns].
+    '''
+    def __init__(self, model_name, attrs, index, columns):
+        self.model_name = model_name
+        self.attrs = attrs
+        self.index = index
+        self.columns = columns # attr : array or function returning the array (loaded on first access)
+
+    def column(self, attr):
+        values = self.columns[attr]
+        if callable(values):
+            values = self.columns[attr] = values()
+        return values
+
+    def rows(self, times):
+        '''Row of every time (last row with a timestamp <= time, -1 before the first row).'''
+        return np.searchsorted(self.index, pd.to_datetime(times).values.astype('datetime64[ns]'), side='right') - 1
+
+    def values(self, attr, rows):
+        '''Values of the rows as python objects, like mosaik_csv.get_data.'''
+        return self.column(attr)[rows].tolist()
+
+    def frame(self, attrs=None):
+        '''DataFrame of the given columns (all by default), as read by pd.read_csv.'''
+        attrs = self.attrs if attrs is None else attrs
+        return pd.DataFrame({attr : np.asarray(self.column(attr)) for attr in attrs}, index=pd.DatetimeIndex(self.index))
+
+
+def read_csv(datafile):
+    '''Reads a csv file the same way mosaik_csv does, returns (model_name, DataFrame).'''
+    with open(datafile) as f:
+        first_line = f.readline().strip('\n')
+    if len(first_line.split(',')) == 1:
+        model_name, header = first_line, 1 # the file starts with the model name
+    else:
+        model_name, header = 'Data', 0
+
+    data = pd.read_csv(datafile, index_col=0, parse_dates=True, header=header)
+    data.columns = [col.strip().split('#')[0].strip() for col in data.columns]
+    return model_name, data
+
+def to_arrays(data):
+    columns = {}
+    for attr in data.columns:
+        if pd.api.types.is_numeric_dtype(data[attr]) and not pd.api.types.is_bool_dtype(data[attr]):
+            columns[attr] = data[attr].to_numpy()
+        else:
+            columns[attr] = np.array([str(val) for val in data[attr]], dtype=str)
+    return columns
+
+def file_digest(datafile):
+    with open(datafile, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+@lru_cache(maxsize=32)
+def _digest(datafile, mtime_ns, size):
+    return file_digest(datafile) # hashed once per process and version of the file
+
+def digest(datafile):
+    '''Hash of the content of datafile, computed once per process and version (mtime, size) of the file.'''
+    stat = os.stat(datafile)
+    return _digest(os.path.abspath(datafile), stat.st_mtime_ns, stat.st_size)
+
+def write_cache(datafile, path):
+    '''Converts datafile into the cache directory path, written to a temporary directory first and renamed.'''
+    model_name, data = read_csv(datafile)
+    tmp = '%s.tmp%d' % (path, os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    meta = {'model_name' : model_name, 'datafile' : os.path.basename(datafile), 'columns' : {}}
+    np.save(os.path.join(tmp, 'index.npy'), data.index.values.astype('datetime64[ns]'))
+    for i, (attr, values) in enumerate(to_arrays(data).items()):
+        meta['columns'][attr] = 'c%d.npy' % i
+        np.save(os.path.join(tmp, meta['columns'][attr]), values)
+    with open(os.path.join(tmp, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=4)
+    try:
+        os.rename(tmp, path)
+    except OSError: # written by another process in the meantime
+        for file in os.listdir(tmp):
+            os.remove(os.path.join(tmp, file))
+        os.rmdir(tmp)
+
+def load_table(datafile, cache=True, cache_dir=None):
+    '''
+    Table of a csv file. With cache, the file is converted into the binary cache on first use
+    and the columns are memory mapped from there. datafile may also be a DataFrame or a named Series
+    with a DatetimeIndex (e.g. the pv profile of pvlib_model.profile), served from memory as model 'Data'.
+    '''
+    if isinstance(datafile, (pd.DataFrame, pd.Series)):
+        data = datafile.to_frame() if isinstance(datafile, pd.Series) else datafile
+        return Table('Data', list(data.columns), data.index.values.astype('datetime64[ns]'), to_arrays(data))
+    if not cache:
+        model_name, data = read_csv(datafile)
+        return Table(model_name, list(data.columns), data.index.values.astype('datetime64[ns]'), to_arrays(data))
+
+    cache_dir = cache_dir or CACHE_DIR
+    name = os.path.splitext(os.path.basename(datafile))[0]
+    path = os.path.join(cache_dir, '%s-%s' % (name, digest(datafile)))
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        os.makedirs(cache_dir, exist_ok=True)
+        write_cache(datafile, path)
+
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    def loader(file):
+        return lambda: np.load(os.path.join(path, file), mmap_mode='r')
+    columns = {attr : loader(file) for attr, file in meta['columns'].items()}
+    return Table(meta['model_name'], list(meta['columns']), np.load(os.path.join(path, 'index.npy'), mmap_mode='r'), columns)
+
+
+class CSV(mosaik_api.Simulator):
+    def __init__(self):
+        super().__init__({'models': {}})
+        self.table = None
+        self.attrs = None
+        self.cache = None
+        self.sid = None
+        self.eids = []
+        self.start_date = None
+        self.time_res = None
+        self.model_name = None
+        self.next_index = None
+
+    def init(self, sid, time_resolution, sim_start, datafile, date_format=None, type="time-based", delimiter=',',
+             attrs=None, cache=True):
+        if type != "time-based" or delimiter != ',':
+            raise ValueError('The cached CSV simulator supports only time-based, comma separated files, use mosaik_csv.')
+        self.sid = sid
+        self.time_res = pd.Timedelta(time_resolution, unit='seconds')
+        self.start_date = pd.to_datetime(sim_start, format=date_format)
+
+        table = self.table = load_table(datafile, cache=cache)
+        self.model_name = table.model_name
+        self.attrs = table.attrs if attrs is None else list(attrs)
+        unknown = set(self.attrs) - set(table.attrs)
+        if unknown:
+            raise ValueError('Unknown columns %s in %s' % (sorted(unknown), self.model_name))
+
+        self.meta['type'] = type
+        self.meta['models'][self.model_name] = {
+            'public': True,
+            'params': [],
+            'attrs': self.attrs,
+        }
+        self.next_index = int(table.rows([self.start_date])[0]) # first relevant row
+        if self.next_index < 0:
+            raise ValueError(f"Start date {self.start_date} is before the first timestamp of {self.model_name} "
+                             f"({pd.Timestamp(table.index[0])})")
+        return self.meta
+
+    def create(self, num, model):
+        if model != self.model_name:
+            raise ValueError('Invalid model "%s"' % model)
+
+        start_idx = len(self.eids)
+        entities = []
+        for i in range(num):
+            eid = '%s_%s' % (model, i + start_idx)
+            entities.append({'eid': eid, 'type': model, 'rel': []})
+            self.eids.append(eid)
+        return entities
+
+    def step(self, time, inputs, max_advance):
+        table = self.table
+        self.cache = {attr : table.column(attr)[self.next_index].item() for attr in self.attrs}
+        self.next_index += 1
+        if self.next_index < len(table.index):
+            next_date = pd.Timestamp(table.index[self.next_index])
+            return int((next_date - self.start_date)/self.time_res)
+        return max_advance
+
+    def get_data(self, outputs):
+        data = {}
+        for eid, attrs in outputs.items():
+            if eid not in self.eids:
+                raise ValueError('Unknown entity ID "%s"' % eid)
+            data[eid] = {attr : self.cache[attr] for attr in attrs}
+        return data
+
+
+def main():
+    return mosaik_api.start_simulation(CSV(), 'cached csv simulator')
+
+
+if __name__ == '__main__':
+    main()
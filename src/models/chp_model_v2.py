@@ -1,5 +1,5 @@
 import mosaik_api
-from src.models.EnTransformer import Transformer_base
+from src.models.EnTransformer import Transformer_base, TransformerBank
 from src.models.boiler_model_v2 import Gboiler
 
 class CHP(Gboiler):
@@ -49,6 +49,8 @@ class TransformerSimulator(mosaik_api.Simulator):
         super().__init__(META)
         self.time_resolution = None
         self.models = dict()  # contains the model instances
+        self.bank = TransformerBank()  # steps all models at once, self.models holds its units
+        self.plans = dict()  # cached output plans of get_data, per requested outputs
         self.sid = None
         self.step_size = None
         self.eid_prefix = None
@@ -78,8 +80,9 @@ class TransformerSimulator(mosaik_api.Simulator):
         next_eid = len(self.models) #if create called a second time, eid will not repeat
         for i in range(next_eid, next_eid + num):
             eid = '%s%d' % (self.eid_prefix, i)
-            self.models[eid] = CHP(params)
+            self.models[eid] = self.bank.add(CHP(params))
             entities.append({'eid': eid, 'type': model})
+        self.plans.clear()
         return entities
             
     def step(self, time, inputs, max_advance):
@@ -96,28 +99,41 @@ class TransformerSimulator(mosaik_api.Simulator):
 
             self.models[eid].step_size = self.step_size
 
-        for eid, model in self.models.items():
-            model.step(time)
+        self.bank.step(time)
 
         if self.meta['type'] == 'event-based':
             return None
         else:
             return time + self.step_size
     
-    def get_data(self, outputs):
-        data = {}
+    def output_plan(self, outputs):
+        """
+        Validates the requested attributes once and binds a getter (BankUnit.getter) to each of them.
+        """
+        known = set(self.meta['models']['Transformer']['attrs'])
+        plan = []
         for eid, attrs in outputs.items():
-            data[eid] = {}
             for attr in attrs:
-                if attr not in self.meta['models']['Transformer'][
-                        'attrs']:
+                if attr not in known:
                     raise ValueError('Unknown output attribute: %s' % attr)
+            unit = self.models[eid]
+            plan.append((eid, [(attr, unit.getter(attr)) for attr in attrs]))
+        return plan
+
+    def get_data(self, outputs):
+        key = tuple((eid, tuple(attrs)) for eid, attrs in outputs.items())
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = self.plans[key] = self.output_plan(outputs)
+        data = {}
+        for eid, getters in plan:
+            data[eid] = values = {}
+            for attr, get in getters:
+                value = get()
+                if value is not None:
+                    values[attr] = value
+            if getters:
                 data['time'] = self.time
-                
-                value = getattr(self.models[eid], attr)
-                if isinstance(value, (float, int)):
-                    data[eid][attr] = float(value)
-                    
         return data
 
 def main():
@@ -2,9 +2,23 @@
 """
 A simple data collector that prints all data when the simulation finishes.
 
+By default the data is kept as {src : {attr : {time : value}}}. If start_date, end and step_size are passed
+to init, the collector is columnar: the values are written by step index into one preallocated array
+per (src, attr) (see ColumnStore) and dump() returns a pandas DataFrame with a DatetimeIndex.
+With spill (a directory), completed months are written to a run file on disk (see SpillingStore) and
+dump() returns a RunFile handle instead.
+With recording (a recording config, see Recorder.from_config), every received value is passed to several sinks
+(columns in memory, a run file, online KPIs) and dump() returns a Recording.
+With abort (abort criteria, see AbortCriteria), the received values are checked during the run and the run is
+stopped with SimulationAborted, if a criterion is met.
 """
 import collections
+from fnmatch import fnmatch
 import mosaik_api_v3 as api
+import numpy as np
+import pandas as pd
+
+from src.utils.run_file import RunFileWriter
 
 META = {
     "type": "event-based",
@@ -14,16 +28,365 @@ META = {
              "any_inputs": True, 
              "params": [], 
              "attrs": ['buffer']}},
-    "extra_methods": ["dump"],  # expose a method callable from the scenario
+    "extra_methods": ["dump", "store"],  # expose a method callable from the scenario
 }
 
+class ColumnStore():
+    '''
+    Recorded values of a run, one array per (src, attr) indexed by step number (time // step_size).
+    The array type follows the values: float for numbers, bool for booleans, object for anything else
+    (strings, None); a column switches to object, if a value of another type arrives.
+    Columns are created with their first value, so only attributes that were received at least once are kept.
+    '''
+    def __init__(self, start, end, step_size):
+        self.start = pd.Timestamp(start)
+        self.step_size = step_size
+        self.n_steps = len(range(0, end, step_size))
+        self.values = {}  # (src, attr) : array
+        self.present = {} # (src, attr) : bool array, False where the source did not provide a value
+
+    def index(self, time):
+        step, rest = divmod(time, self.step_size)
+        if rest or not 0 <= step < self.n_steps:
+            raise ValueError(f'Time {time} is not a step of the collector (step size {self.step_size}, {self.n_steps} steps).')
+        return step
+
+    def set(self, key, step, val):
+        values = self.values.get(key)
+        if type(val) is bool:
+            kind = bool
+        elif isinstance(val, (int, float)):
+            kind = float
+        else:
+            kind = object
+        if values is None:
+            values = self.values[key] = np.full(self.n_steps, np.nan if kind is float else None, dtype=kind)
+            self.present[key] = np.zeros(self.n_steps, dtype=bool)
+        elif values.dtype != kind and values.dtype != object:
+            values = self.values[key] = values.astype(object)
+        values[step] = val
+        self.present[key][step] = True
+
+    def chunk(self, n_rows):
+        '''
+        The first n_rows values of all columns, {'<src>-<attr>' : array}. Missing values are nan (None in object columns).
+        '''
+        columns = {}
+        for (src, attr), values in self.values.items():
+            values = values[:n_rows]
+            present = self.present[(src, attr)][:n_rows]
+            if not present.all() and values.dtype != float:
+                values = values.astype(float if values.dtype == bool else object)
+                values[~present] = np.nan if values.dtype == float else None
+            columns[f'{src}-{attr}'] = values
+        return columns
+
+    def frame(self):
+        '''
+        All columns as DataFrame with a DatetimeIndex, the column names are '<src>-<attr>'.
+        '''
+        index = pd.date_range(self.start, periods=self.n_steps, freq=pd.Timedelta(seconds=self.step_size))
+        return pd.DataFrame(self.chunk(self.n_steps), index=index)
+
+    def result(self):
+        return self.frame()
+
+
+class SpillingStore(ColumnStore):
+    '''
+    ColumnStore, which keeps only the current chunk of steps (one calendar month by default, freq is a pandas period
+    alias) in memory. Completed chunks are appended to a run file in path (see utils/run_file.py, compression 'zlib' or None);
+    result() writes the last chunk and returns a RunFile handle, which loads the columns lazily.
+    '''
+    def __init__(self, start, end, step_size, path, freq='M', compression=None):
+        super().__init__(start, end, step_size)
+        index = pd.date_range(self.start, periods=self.n_steps, freq=pd.Timedelta(seconds=step_size))
+        periods = index.to_period(freq).asi8
+        self.bounds = (np.flatnonzero(np.diff(periods)) + 1).tolist() + [self.n_steps] # end of every chunk
+        self.total_steps = self.n_steps
+        self.n_steps = int(np.diff([0] + self.bounds).max()) # buffer size, the columns are allocated for one chunk
+        self.chunk_start = 0
+        self.chunk_end = self.bounds[0]
+        self.writer = RunFileWriter(path, start, step_size, compression)
+        self.handle = None
+
+    def index(self, time):
+        step, rest = divmod(time, self.step_size)
+        if rest or not self.chunk_start <= step < self.total_steps:
+            raise ValueError(f'Time {time} is not a step of the collector (step size {self.step_size}, '
+                             f'{self.total_steps} steps, current chunk from step {self.chunk_start}).')
+        while step >= self.chunk_end:
+            self.spill()
+        return step - self.chunk_start
+
+    def spill(self):
+        '''
+        Writes the current chunk to disk and starts the next one.
+        '''
+        self.writer.append(self.chunk(self.chunk_end - self.chunk_start), self.chunk_end - self.chunk_start)
+        for key, values in self.values.items():
+            values.fill(np.nan if values.dtype == float else (False if values.dtype == bool else None))
+            self.present[key].fill(False)
+        self.chunk_start = self.chunk_end
+        self.chunk_end = next((bound for bound in self.bounds if bound > self.chunk_start), self.total_steps)
+
+    def frame(self):
+        return self.result().frame()
+
+    def result(self):
+        if self.handle is None:
+            while self.chunk_start < self.total_steps:
+                self.spill()
+            self.handle = self.writer.close()
+        return self.handle
+
+
+class KPIStore():
+    '''
+    Online reductions of recorded columns, without keeping the values: kpis maps a name to
+    ('<src>-<attr>', reducer), the reducers are 'sum', 'mean', 'min', 'max', 'last' and 'energy'
+    (sum * step_size / 3600, Wh for a power in W). Values that are no numbers (None, strings) are skipped.
+    '''
+    REDUCERS = ('sum', 'mean', 'min', 'max', 'last', 'energy')
+
+    def __init__(self, start, end, step_size, kpis):
+        self.step_size = step_size
+        self.n_steps = len(range(0, end, step_size))
+        self.kpis = dict(kpis)
+        self.reducers = collections.defaultdict(list) # '<src>-<attr>' : [(name, reducer)]
+        for name, (column, reducer) in kpis.items():
+            if reducer not in self.REDUCERS:
+                raise ValueError(f"Unknown reducer '{reducer}' of KPI '{name}', use one of {self.REDUCERS}.")
+            self.reducers[column].append((name, reducer))
+        self.acc = {name : None for name in kpis}
+        self.count = {name : 0 for name in kpis}
+
+    @property
+    def columns(self):
+        return list(self.reducers)
+
+    def index(self, time):
+        step, rest = divmod(time, self.step_size)
+        if rest or not 0 <= step < self.n_steps:
+            raise ValueError(f'Time {time} is not a step of the collector (step size {self.step_size}, {self.n_steps} steps).')
+        return step
+
+    def set(self, key, step, val):
+        if type(val) is bool or not isinstance(val, (int, float)):
+            return
+        for name, reducer in self.reducers.get(f'{key[0]}-{key[1]}', ()):
+            acc = self.acc[name]
+            if acc is None or reducer == 'last':
+                acc = val
+            elif reducer == 'min':
+                acc = min(acc, val)
+            elif reducer == 'max':
+                acc = max(acc, val)
+            else:
+                acc += val
+            self.acc[name] = acc
+            self.count[name] += 1
+
+    def value(self, name):
+        '''Current value of the KPI name.'''
+        acc = self.acc[name]
+        reducer = self.kpis[name][1]
+        if acc is None:
+            return np.nan
+        if reducer == 'mean':
+            return acc / self.count[name]
+        if reducer == 'energy':
+            return acc * self.step_size / 3600
+        return acc
+
+    def result(self):
+        return {name : self.value(name) for name in self.acc}
+
+
+class SimulationAborted(Exception):
+    '''Raised when an abort criterion (see AbortCriteria) is met, stops the run.'''
+    def __init__(self, criterion, time, value):
+        super().__init__(f"Abort criterion '{criterion}' met at {time} s (value {value})")
+        self.criterion = criterion
+        self.time = time
+        self.value = value
+
+
+class AbortedRun():
+    '''
+    Partial result of a run stopped by an abort criterion: data is the recorded data until time (DataFrame, RunFile or
+    Recording as without abort), criterion the name of the met criterion and value its value at time.
+    '''
+    def __init__(self, data, aborted):
+        self.data = data
+        self.criterion = aborted.criterion
+        self.time = aborted.time
+        self.value = aborted.value
+
+    def __repr__(self):
+        return f"AbortedRun(criterion={self.criterion!r}, time={self.time}, value={self.value})"
+
+
+class AbortCriteria():
+    '''
+    Abort criteria evaluated on the recorded values during the run: criteria maps a name to
+    ['<src>-<attr>', reducer, limit, by], the run is stopped (SimulationAborted) as soon as the reduction of the column
+    (see KPIStore) exceeds limit before the date by (None: during the whole run), e.g.
+
+        {'aux_heat' : ['ControllerSim-0.Controller_0-IdealHrodsum', 'energy', 5e6, '2022-02-01']}
+
+    stops a run, in which the ideal heater supplies more than 5 MWh in January.
+    '''
+    def __init__(self, start, end, step_size, criteria):
+        self.kpis = KPIStore(start, end, step_size, {name : criterion[:2] for name, criterion in criteria.items()})
+        self.limits = {name : criterion[2] for name, criterion in criteria.items()}
+        self.by = {}
+        for name, criterion in criteria.items():
+            by = criterion[3] if len(criterion) > 3 else None
+            self.by[name] = np.inf if by is None else (pd.Timestamp(by) - pd.Timestamp(start)).total_seconds()
+        self.watched = {} # (src, attr) : names of the criteria of the column, empty for other columns
+
+    def check(self, key, time, val):
+        names = self.watched.get(key)
+        if names is None:
+            names = self.watched[key] = [name for name, _ in self.kpis.reducers.get(f'{key[0]}-{key[1]}', ())]
+        if not names:
+            return
+        self.kpis.set(key, None, val)
+        for name in names:
+            if time < self.by[name]:
+                value = self.kpis.value(name)
+                if value > self.limits[name]:
+                    raise SimulationAborted(name, time, value)
+
+
+class AbortingStore():
+    '''Store (ColumnStore, SpillingStore, Recorder) that checks every recorded value against AbortCriteria.'''
+    def __init__(self, store, criteria):
+        self.store = store
+        self.criteria = criteria
+        self.time = None
+
+    def index(self, time):
+        self.time = time
+        return self.store.index(time)
+
+    def set(self, key, step, val):
+        self.store.set(key, step, val)
+        self.criteria.check(key, self.time, val)
+
+    def result(self):
+        return self.store.result()
+
+
+class Recording():
+    '''
+    Results of the sinks of a Recorder, recording['columns'] (DataFrame), recording['file'] (RunFile),
+    recording['kpis'] (dict). frame() returns the recorded time series like RunFile.frame.
+    '''
+    def __init__(self, results):
+        self.results = results
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def __contains__(self, name):
+        return name in self.results
+
+    @property
+    def kpis(self):
+        return self.results.get('kpis', {})
+
+    def frame(self, numeric=False):
+        if 'columns' in self.results:
+            df = self.results['columns']
+            if numeric:
+                df = df[[col for col, dtype in df.dtypes.items() if pd.api.types.is_numeric_dtype(dtype)]]
+            return df
+        if 'file' in self.results:
+            return self.results['file'].frame(numeric=numeric)
+        raise KeyError('The recording has no time series (columns or file sink).')
+
+
+class Recorder():
+    '''
+    Passes every received value to several sinks (ColumnStore, SpillingStore, KPIStore, ...). Each sink
+    gets only the columns '<src>-<attr>' matching its include patterns (fnmatch, None: all); the routes are
+    resolved once per column. Used as the store of the Collector or NativeWorld.run.
+    '''
+    def __init__(self, sinks):
+        self.sinks = sinks # name : (store, include patterns or None)
+        self.routes = {}   # (src, attr) : [(index of the sink, store)]
+        self.steps = []    # step of every sink at the current time
+        self.recording = None
+
+    @classmethod
+    def from_config(cls, start, end, step_size, config):
+        '''
+        Recorder of a recording config, e.g.
+
+            {'columns' : {'include' : ['HeatPumpSim-0.*']},   # in memory (ColumnStore)
+             'file' : {'path' : 'data/outputs/DES_data', 'compression' : 'zlib'}, # run file (SpillingStore)
+             'kpis' : {'hp_el_Wh' : ['HeatPumpSim-0.HeatPump_0-P_Required', 'energy']}}  # KPIStore
+
+        All sinks are optional, include defaults to all columns (the kpis take their columns).
+        '''
+        unknown = set(config) - {'columns', 'file', 'kpis'}
+        if unknown:
+            raise ValueError(f'Unknown sinks {sorted(unknown)} in the recording config, use columns, file and kpis.')
+        sinks = {}
+        if 'columns' in config:
+            sinks['columns'] = (ColumnStore(start, end, step_size), config['columns'].get('include'))
+        if 'file' in config:
+            file = config['file']
+            store = SpillingStore(start, end, step_size, file['path'], freq=file.get('freq', 'M'), compression=file.get('compression'))
+            sinks['file'] = (store, file.get('include'))
+        if 'kpis' in config:
+            store = KPIStore(start, end, step_size, config['kpis'])
+            sinks['kpis'] = (store, store.columns)
+        return cls(sinks)
+
+    def route(self, key):
+        name = f'{key[0]}-{key[1]}'
+        targets = self.routes[key] = [(i, store) for i, (store, include) in enumerate(self.sinks.values())
+                                      if include is None or any(fnmatch(name, pattern) for pattern in include)]
+        return targets
+
+    def index(self, time):
+        '''Moves all sinks to time (the step of each sink is kept, the returned time is passed back to set).'''
+        self.steps = [store.index(time) for store, _ in self.sinks.values()]
+        return time
+
+    def set(self, key, step, val):
+        targets = self.routes.get(key)
+        if targets is None:
+            targets = self.route(key)
+        for i, store in targets:
+            store.set(key, self.steps[i], val)
+
+    def result(self):
+        if self.recording is None:
+            self.recording = Recording({name : store.result() for name, (store, _) in self.sinks.items()})
+        return self.recording
+
+
 class Collector(api.Simulator):
     def __init__(self):
         super().__init__(META)
         self.eid = None
         self.data = collections.defaultdict(lambda: collections.defaultdict(dict))
+        self.columns = None # ColumnStore in columnar mode
 
-    def init(self, sid, time_resolution):
+    def init(self, sid, time_resolution, start_date=None, end=None, step_size=None, spill=None, recording=None, abort=None):
+        if start_date is not None and end is not None and step_size is not None:
+            if recording is not None:
+                self.columns = Recorder.from_config(start_date, end, step_size, recording)
+            elif spill is not None:
+                self.columns = SpillingStore(start_date, end, step_size, spill)
+            else:
+                self.columns = ColumnStore(start_date, end, step_size)
+            if abort is not None:
+                self.columns = AbortingStore(self.columns, AbortCriteria(start_date, end, step_size, abort))
         return self.meta
 
     def create(self, num, model):
@@ -31,10 +394,27 @@ class Collector(api.Simulator):
         return [{"eid": self.eid, "type": model}]
 
     def step(self, time, inputs, max_advance):
+        if self.columns is not None:
+            step = self.columns.index(time)
+            for attr, by_src in inputs.get("Monitor", {}).items():
+                for src, value in by_src.items():
+                    self.columns.set((src, attr), step, value)
+            return
         for attr, by_src in inputs.get("Monitor", {}).items():
             for src, value in by_src.items():
                 self.data[src][attr][time] = value
 
+    def finalize(self):
+        store = self.columns.store if isinstance(self.columns, AbortingStore) else self.columns
+        if isinstance(store, (SpillingStore, Recorder)):
+            store.result() # writes the last chunk
+
     # extra method to pull everything after the run
     def dump(self):
+        if self.columns is not None:
+            return self.columns.result()
         return self.data
+
+    # extra method, the ColumnStore is filled during the run (the simulators are stopped after world.run)
+    def store(self):
+        return self.columns
@@ -23,9 +23,46 @@ from tqdm import tqdm
 import os
 import json
 from collections import defaultdict
+from collections.abc import MutableMapping
 from src.utils import helpers
+from src.models import exogenous
 
 import operator
+
+OPERATORS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge
+}
+
+SH_BUILDING = 'radiator_high_insulation' # heating curve of the space heating circuit, see exogenous.HEATING_CURVES #TODO move this to the params
+
+# Default rules of control strategy '1', can be overwritten by params['logic'].
+# 'turn_off' defaults to the tank/layer of 'turn_on' and turn_on_temp + 5;
+# 'add_conditions' have a higher priority and can override the turn on/off temps: {'attr' : [operator(default = '<='), thresh_val]}
+DEFAULT_LOGIC = {
+    'boiler' : {
+        'turn_on' : {
+            'tank' : 'tank2',
+            'layer' : 'sensor_2',
+            'turn_on_temp' : 60
+        },
+        'turn_off' :{
+            'turn_off_temp' : 68
+        }
+    },
+    'hp' : {
+        'turn_on' : {
+            'tank' : 'tank1',
+            'layer' : 'sensor_1',
+            'turn_on_temp' : 50
+        },
+        'add_conditions' : {
+            'turn_off' : {'T_amb' : ['<=', 0]}
+        }
+    }
+}
 # %%
 class Controller():
     """
@@ -58,6 +95,11 @@ class Controller():
         * **operation_mode**: The operation mode of the heating system, either 'heating' or 'cooling'
         * **control_strategy**: The control strategy to be used for the heat pump operation. Currently, two
           strategies have been implemented ('1' & '2')
+        * **signals**: Optional, {'datafile', 'start', 'until'} of the heat load csv. If given, the calendar flags,
+          demands (in W) and the SH supply temperature are precomputed for all steps (see exogenous.py) and indexed
+          by step number instead of being derived from the inputs in every step.
+        * **logic**: Optional, the turn on/off rules of the generators for control strategy '1' (defaults to
+          DEFAULT_LOGIC). The rules are compiled once at instantiation, see :meth:`compile_logic`.
 
         """
         
@@ -94,22 +136,38 @@ class Controller():
         
         # --------------------------------Initialising attributes----------------------------------------------
         
-        self.generators = {
-            f'{gen}_{suffix}' : init for gen in self.gens for suffix, init in zip(['status', 'demand', 'supply'], ['off', 0, 0])
-        }
+        # The state read by the rules and the tank balance is kept in arrays, the dicts below are views into them
+        # (see bind_state): generators['<gen>_status'/'_demand'/'_supply'] (per generator), tank_connections[tank]['<port>_T'/'<port>_F']
+        # (tank x port) and tank_temps[tank][sensor] (tank x sensor). A ControllerBank binds them to rows of its arrays.
+        self.generators = None
         self.tanks = [f"tank{i}" for i in range(0,self.no_tanks)]
-        
-        self.tank_connections = {}
-        for tank in self.tanks:
-            self.tank_connections[tank] = {
-                f'{port}_{suffix}' : 0 for port in params['tank']['connections'].keys() for suffix in ['T', 'F']
-            }
-
+        self.tank_connections = None
         self.sensors = [f'sensor_{i}' for i in range(0, params['tank']['n_sensors'])]
-        self.tank_temps = {
-            tank : {sensor : 0 for sensor in self.sensors} for tank in self.tanks
-            }
-        
+        self.tank_temps = None
+
+        self._port_names = list(params['tank']['connections'].keys())
+        self._tank_index = {tank : i for i, tank in enumerate(self.tanks)}
+        self._port_index = {port : j for j, port in enumerate(self._port_names)}
+        self._gen_index = {gen : k for k, gen in enumerate(self.gens)}
+        self.bind_state(
+            gen_status=np.full(len(self.gens), 'off', dtype=object),
+            gen_demand=np.zeros(len(self.gens)),
+            gen_supply=np.zeros(len(self.gens)),
+            port_T=np.zeros((len(self.tanks), len(self._port_names))),
+            port_F=np.zeros((len(self.tanks), len(self._port_names))),
+            sensor_T=np.zeros((len(self.tanks), len(self.sensors))),
+        )
+
+        # TankbalanceSetup links as (src tank, src port, dst tank, dst port) indices
+        self._links = []
+        for link in self.tank_setup or []:
+            src, dst = link.split(':')
+            src_tank, src_port = src.split('.')
+            dst_tank, dst_port = dst.split('.')
+            self._links.append((self._tank_index[src_tank], self._port_index[src_port],
+                                self._tank_index[dst_tank], self._port_index[dst_port]))
+
+
         # other attrs---------------------
         self.req_shTsup = None # ONLY for debugging, to see the required supply temp for SH circuit.
 
@@ -157,14 +215,49 @@ class Controller():
 
         self.HP3wv_out1_share = 1 #Share of flow from the first output of the 3 way valve in heat pump condenser circuit.
 
+        # Control strategy '1' : rules from params['logic'], compiled once (private, not exposed as output attributes)
+        self._rules = self.compile_logic(params.get('logic', DEFAULT_LOGIC))
+
+        # Precomputed per step signals (calendar, demands in W, SH supply temp) of the heat load file, see exogenous.py
+        signals = params.get('signals')
+        self._signals = None
+        if signals:
+            self._signals = exogenous.load_signals(signals['datafile'], signals['start'], signals['until'],
+                                                   signals.get('step_size', self.stepsize), SH_BUILDING)
+        self._step_index = None
+
     def get_init_attrs(self):
         '''
         Simply returns a list of all user defined attributes in this class. 
-        Useful to add to the attrs list in META.
+        Useful to add to the attrs list in META. Private attributes (leading underscore) are skipped.
         '''
-        attr_list = helpers.flatten_attrs(self, list(vars(self).keys()))
+        attr_list = helpers.flatten_attrs(self, [attr for attr in vars(self).keys() if not attr.startswith('_')])
         return attr_list
     
+    def bind_state(self, gen_status, gen_demand, gen_supply, port_T, port_F, sensor_T):
+        """
+        Keeps the generator, tank port and sensor state in the given arrays (the current values are copied into them)
+        and builds the views generators, tank_connections and tank_temps on them.
+        gen_status, gen_demand, gen_supply: arrays (generator), in the order of params['gens']
+        port_T, port_F: arrays (tank x port), in the order of params['tank']['connections']
+        sensor_T: array (tank x sensor)
+        """
+        if self.generators is not None:
+            gen_status[:], gen_demand[:], gen_supply[:] = self._gen_status, self._gen_demand, self._gen_supply
+            port_T[:], port_F[:], sensor_T[:] = self._port_T, self._port_F, self._sensor_T
+        self._gen_status, self._gen_demand, self._gen_supply = gen_status, gen_demand, gen_supply
+        self._port_T, self._port_F, self._sensor_T = port_T, port_F, sensor_T
+
+        self.generators = ArrayView({f'{gen}_{suffix}' : (array, k) for k, gen in enumerate(self.gens)
+                                     for suffix, array in zip(['status', 'demand', 'supply'], [gen_status, gen_demand, gen_supply])})
+        self.tank_connections = {
+            tank : TankPorts(port_T[i], port_F[i], self._port_names) for tank, i in self._tank_index.items()
+        }
+        self.tank_temps = {
+            tank : ArrayView({sensor : (sensor_T[i], j) for j, sensor in enumerate(self.sensors)}) for tank, i in self._tank_index.items()
+        }
+        self._ports = {} # compiled paths of the tank ports, see port()
+
     def step(self, time):
         """
         Perform a simulation step.
@@ -181,38 +274,63 @@ class Controller():
         - Generator minimum runtime
         """
         # tqdm.write(f'controller step run at time:{time}')
-        
-        # Convert the heat demand available in kW to W
-        if self.heat_demand is None or self.heat_demand < 0:
-            self.heat_demand = 0
-        else:
-            self.heat_demand *= 1000
+        self.step_supply(time)
+        if self.uses_rules:
+            self.apply_rules()
+        self.balance_tanks()
 
-        if self.sh_demand is None or self.sh_demand < 0:
-            self.sh_demand = 0
-        else:
-            self.sh_demand *= 1000
+    @property
+    def uses_rules(self):
+        """True if the generators are switched by the rules of control strategy '1' (apply_rules)."""
+        return self.operation_mode.lower() == 'heating' and self.control_strategy == '1'
 
-        if self.dhw_demand is None or self.dhw_demand < 0:
-            self.dhw_demand = 0
+    def step_supply(self, time):
+        """
+        The part of step before the rules and the tank balance (a ControllerBank runs those for many controllers at once):
+        the demands, the consumer flows, the heating rods and the heat pump flows.
+        """
+        if self._signals is not None:
+            # calendar and demands (already in W) precomputed from the heat load file
+            k = self._step_index = time // self.step_size
+            signals = self._signals
+            self.heat_demand = signals.heat_demand[k]
+            self.sh_demand = signals.sh_demand[k]
+            self.dhw_demand = signals.dhw_demand[k]
+            self.timestamp = signals.timestamp[k]
+            self.season = signals.season[k]
+            self.isday = signals.isday[k]
         else:
-            self.dhw_demand *= 1000
+            # Convert the heat demand available in kW to W
+            if self.heat_demand is None or self.heat_demand < 0:
+                self.heat_demand = 0
+            else:
+                self.heat_demand *= 1000
+
+            if self.sh_demand is None or self.sh_demand < 0:
+                self.sh_demand = 0
+            else:
+                self.sh_demand *= 1000
+
+            if self.dhw_demand is None or self.dhw_demand < 0:
+                self.dhw_demand = 0
+            else:
+                self.dhw_demand *= 1000
         
-        self.timestamp = pd.to_datetime(self.timestamp)
+            self.timestamp = pd.to_datetime(self.timestamp)
         
-        if self.timestamp.month <= 8 and self.timestamp.month >= 6 :
-            self.season = 'summer'
-        elif self.timestamp.month: #just checking if timestamp exists and month is a valid value.
-            self.season = 'winter'
-        else:
-            self.season = None
+            if self.timestamp.month <= 8 and self.timestamp.month >= 6 :
+                self.season = 'summer'
+            elif self.timestamp.month: #just checking if timestamp exists and month is a valid value.
+                self.season = 'winter'
+            else:
+                self.season = None
 
-        if self.timestamp.hour <= 18 and self.timestamp.hour >= 8:
-            self.isday = True
-        elif self.timestamp.hour:
-            self.isday = False
-        else:
-            self.isday = None
+            if self.timestamp.hour <= 18 and self.timestamp.hour >= 8:
+                self.isday = True
+            elif self.timestamp.hour:
+                self.isday = False
+            else:
+                self.isday = None
 
         
         # ------------------HP surplus mode def-----------------------------------------
@@ -238,168 +356,126 @@ class Controller():
 
         self.hwt1_hr_1, self.hwt0_hr_1 = 0,0 
 
-        # ------------------------------------------Control strategies for the operation of heat pump in heating mode
-        if self.operation_mode.lower() == 'heating':
-            #Datasheet logic control
-            if self.control_strategy == '1':
-
-                # new nested logi dict
-                '''
-                logic = {
-                    'comp' : {
-                        'turn-on' : {
-                            'tank' :
-                            'layer' :
-                            't_low' :
-                            't_high' :} },
-                        'turn-off' :{
-                            default = turn-on + 5C}},
-                        'add_conds' :{ #this would have higher priority, can override the turn on/off temps.
-                            'turn_on' : {'attr' : [sign(default = '<='), thresh_val]},
-                            'turn_off' : , 
-                        }
-                '''
-                # Could move these as well, somewhere common, the logic dict could be defined in main_sim, but later
-                operatormapping = {
-                    '<': operator.lt,
-                    '>': operator.gt,
-                    '<=': operator.le,
-                    '>=': operator.ge
-                }
-                logic = {
-                    'boiler' : {
-                        'turn_on' : {
-                            'tank' : 'tank2',
-                            'layer' : 'sensor_2',
-                            'turn_on_temp' : 60
-                        },
-                        'turn_off' :{
-                            'turn_off_temp' : 68
-                        }
-                    },
-                    'hp' : {
-                        'turn_on' : {
-                            'tank' : 'tank1',
-                            'layer' : 'sensor_1',
-                            'turn_on_temp' : 50
-                        },
-                        # 'turn_off' :{ 
-                        #     'tank' : 'tank1',
-                        #     'layer' : 'sensor_1',
-                        #     'turn_off_temp' : 60
-                        # },
-                        'add_conditions' : {
-                            'turn_off' : {'T_amb' : ['<=', 0]}
-                        }
-                    }
-                }
-
-
-                # could move these methods to __init__, but would decrease readability, with very little to no performance impact.
-                def turn_on():
-                    '''
-                    Turns on the generator by setting the appropriate status and demand values.
-                    '''
-                    self.generators[f'{gen}_status'] = 'on'
-                    self.generators[f'{gen}_demand'] = self.hwt_mass * 4184 * (temp_sp_low - self.tank_temps[tank_id][tank_layer]) / self.step_size
-                def turn_off():
-                    '''
-                    Turns off the generator by setting the appropriate status and demand values.
-                    '''
-                    self.generators[f'{gen}_status'] = 'off'
-                    self.generators[f'{gen}_demand'] = 0
-
-                def check_add_conditions(add_cond_dict, key):
-                    '''
-                    Checks the additional conditions. Returns true if the condition is satisfied.
-                    add_cond_dict: dict containing the additional conditions
-                    key: 'turn_on' or 'turn_off'
-                    Returns:
-                        bool: True if the additional condition is satisfied, False otherwise.
-
-                    '''
-                    if key not in add_cond_dict.keys():
-                        return False
-                    
-                    if len(add_cond_dict[key].keys()) > 2:
-                        print("More than 2 additional conditions not supported yet!!")
-                    for cond_2, thresh in add_cond_dict[key].items():
-                        if isinstance(thresh, list):
-                            op_str, thresh_val = thresh
-                        else:
-                            op_str, thresh_val = '<=', thresh
-                        
-                        op_func = operatormapping.get(op_str)
-                        if op_func is None:
-                            raise ValueError(f"Invalid operator '{op_str}' in additional conditions")
-                        if op_func(getattr(self, cond_2), thresh_val): # operator.le(self.T_amb, thresh_val):
-                            return True
-                    return False
-
-
-                for gen_, cond in logic.items():
-                    #gen_ will be the exact key in the dict, with the dhw, sh suffix and such.
-
-                    turn_on_cfg = cond.get('turn_on')
-                    tank_id = turn_on_cfg.get('tank')
-                    tank_layer = turn_on_cfg.get('layer')
-                    temp_sp_low = turn_on_cfg.get('turn_on_temp')
-
-                    turn_off_tank_id = cond.get('turn_off', {}).get('tank', tank_id) # defaults to the same tank as turn-on condition
-                    turn_off_tank_layer = cond.get('turn_off', {}).get('layer', tank_layer)
-                    temp_sp_high = cond.get('turn_off', {}).get('turn_off_temp', temp_sp_low + 5)
-
-                    add_conditions = cond.get('add_conditions', {})
-
-                    gen = next((base for base in self.gens if gen_.startswith(base)), None)
-                    #To find the generator name from the unique list. Finds the first match.
-                    
-                    if gen is None:
-                        raise RuntimeError(f"Generator '{gen_}' not found in self.gens list")
-                    
-                    # Turn on logic
-                    if self.tank_temps[tank_id][tank_layer] <= temp_sp_low:
-                        turn_on()
-                    elif check_add_conditions(add_conditions, 'turn_on'): # this can overwrite the previous temp setpoints
-                        turn_on()
-                                
-                    # Turn off logic
-                    if self.tank_temps[turn_off_tank_id][turn_off_tank_layer] >= temp_sp_high:
-                        turn_off()
-                    elif check_add_conditions(add_conditions, 'turn_off'):
-                        turn_off()
-
-            
         # Adjusting the mass flow rates for hot water tank in the heat pump circuit, when heat pump operates for only
         # a fraction of the time step
         if self.hp_on_fraction is not None and self.hp_cond_m is not None:
             self.hp_in_F = self.hp_on_fraction * self.hp_cond_m
             self.hp_out_F = -self.hp_on_fraction * self.hp_cond_m
- 
-        # ----------------- Tank balancing flows -----------------------
+
+    def balance_tanks(self):
+        """
+        Calculates the balancing flows between the tanks (TankbalanceSetup links) and checks the netflow of every tank.
+        """
+        port_T, port_F = self._port_T, self._port_F
         if self.no_tanks > 1:
-            for link in self.tank_setup:
-                src, dst = link.split(':')
-                src_tank, src_port = src.split('.')
-                dst_tank, dst_port = dst.split('.')
-                self.tank_connections[src_tank][f'{src_port}_F'] = 0
-                self.residual_flow = sum([flow for port, flow in self.tank_connections[src_tank].items() if '_F' in port ])
+            for src_tank, src_port, dst_tank, dst_port in self._links:
+                port_F[src_tank, src_port] = 0
+                self.residual_flow = port_F[src_tank].sum().item()
                 
                 if self.residual_flow > 0:
                     # Flow from src to dst
-                    self.tank_connections[dst_tank][f'{dst_port}_T'] = self.tank_connections[src_tank][f'{src_port}_T']
-                    self.tank_connections[dst_tank][f'{dst_port}_F'] = self.residual_flow #inflow
-                    self.tank_connections[src_tank][f'{src_port}_F'] = -self.residual_flow #outflow
+                    port_T[dst_tank, dst_port] = port_T[src_tank, src_port]
+                    port_F[dst_tank, dst_port] = self.residual_flow #inflow
+                    port_F[src_tank, src_port] = -self.residual_flow #outflow
                 else:
                     # Flow from dst to src
-                    self.tank_connections[src_tank][f'{src_port}_T'] = self.tank_connections[dst_tank][f'{dst_port}_T']
-                    self.tank_connections[src_tank][f'{src_port}_F'] = -self.residual_flow #inflow
-                    self.tank_connections[dst_tank][f'{dst_port}_F'] = self.residual_flow #outflow
+                    port_T[src_tank, src_port] = port_T[dst_tank, dst_port]
+                    port_F[src_tank, src_port] = -self.residual_flow #inflow
+                    port_F[dst_tank, dst_port] = self.residual_flow #outflow
+
+        netflow = port_F.sum(axis=1)
+        self.netflow = netflow[-1].item()
+        errors = np.flatnonzero(np.abs(netflow) > 1e-5)
+        if errors.size:
+            raise ValueError(f"{self.tanks[errors[0]]} netflow error!")
+
+    def compile_logic(self, logic):
+        """
+        Compiles the logic dict of control strategy '1' into a flat rule table, evaluated in every step.
+        Each rule is a tuple (status_key, demand_key, on_tank, on_layer, turn_on_temp, off_tank, off_layer,
+        turn_off_temp, on_conds, off_conds); the additional conditions are tuples of (attr, operator function, threshold).
+        Generator names and operators are checked once here.
+        logic: dict, see DEFAULT_LOGIC for the format.
+        """
+        def compile_conditions(add_cond_dict, key):
+            conds = add_cond_dict.get(key, {})
+            if len(conds) > 2:
+                logger_controller.warning(f"More than 2 additional conditions ({key}), all of them are checked")
+            compiled = []
+            for attr, thresh in conds.items():
+                if isinstance(thresh, list):
+                    op_str, thresh_val = thresh
+                else:
+                    op_str, thresh_val = '<=', thresh
+                op_func = OPERATORS.get(op_str)
+                if op_func is None:
+                    raise ValueError(f"Invalid operator '{op_str}' in additional conditions")
+                compiled.append((attr, op_func, thresh_val))
+            return tuple(compiled)
+
+        rules = []
+        for gen_, cond in logic.items():
+            #gen_ will be the exact key in the dict, with the dhw, sh suffix and such.
+            gen = next((base for base in self.gens if gen_.startswith(base)), None)
+            #To find the generator name from the unique list. Finds the first match.
+            if gen is None:
+                raise RuntimeError(f"Generator '{gen_}' not found in self.gens list")
+
+            turn_on_cfg = cond.get('turn_on')
+            tank_id = turn_on_cfg.get('tank')
+            tank_layer = turn_on_cfg.get('layer')
+            temp_sp_low = turn_on_cfg.get('turn_on_temp')
+
+            turn_off_cfg = cond.get('turn_off', {})
+            turn_off_tank_id = turn_off_cfg.get('tank', tank_id) # defaults to the same tank as turn-on condition
+            turn_off_tank_layer = turn_off_cfg.get('layer', tank_layer)
+            temp_sp_high = turn_off_cfg.get('turn_off_temp', temp_sp_low + 5)
+
+            add_conditions = cond.get('add_conditions', {})
+            rules.append((f'{gen}_status', f'{gen}_demand', tank_id, tank_layer, temp_sp_low,
+                          turn_off_tank_id, turn_off_tank_layer, temp_sp_high,
+                          compile_conditions(add_conditions, 'turn_on'), compile_conditions(add_conditions, 'turn_off')))
+        return rules
+
+    def apply_rules(self):
+        """
+        Sets the status and demand of the generators with the compiled rules of control strategy '1'.
+        """
+        generators, tank_temps = self.generators, self.tank_temps
+        for status_key, demand_key, on_tank, on_layer, temp_sp_low, off_tank, off_layer, temp_sp_high, on_conds, off_conds in self._rules:
 
-        for tank, vals in self.tank_connections.items():
-            self.netflow = sum([flow for port, flow in vals.items() if '_F' in port ])
-            if abs(self.netflow) > 1e-5:
-                raise ValueError(f"{tank} netflow error!")
+            # Turn on logic, the additional conditions can overwrite the temp setpoints
+            if tank_temps[on_tank][on_layer] <= temp_sp_low or (on_conds and self.check_conditions(on_conds)):
+                generators[status_key] = 'on'
+                generators[demand_key] = self.hwt_mass * 4184 * (temp_sp_low - tank_temps[on_tank][on_layer]) / self.step_size
+
+            # Turn off logic
+            if tank_temps[off_tank][off_layer] >= temp_sp_high or (off_conds and self.check_conditions(off_conds)):
+                generators[status_key] = 'off'
+                generators[demand_key] = 0
+
+    def check_conditions(self, conds):
+        """
+        Returns True if one of the compiled additional conditions (attr, operator function, threshold) is satisfied.
+        """
+        for attr, op_func, thresh_val in conds:
+            if op_func(getattr(self, attr), thresh_val):
+                return True
+        return False
+
+    def port(self, name, suffix):
+        """
+        Returns the compiled path (helpers.AttrPath) of tank_connections.<name>_<suffix>, compiled on first use.
+        name: tank port, e.g. 'tank1.heat_out2'
+        suffix: 'T' or 'F'
+        """
+        try:
+            return self._ports[name, suffix]
+        except KeyError:
+            if name is None:
+                raise IncompleteConfigError(f"Tank port for '{suffix}' not defined in the supply configuration.")
+            path = self._ports[name, suffix] = helpers.compile_path(self, f"tank_connections.{name}_{suffix}")
+            return path
 
     def supply_temp(self, out_temp, buildingtype):
         """
@@ -411,12 +487,7 @@ class Controller():
             Tsupply: Supply temperature (in °C) 
             delta_T: Temperature difference between supply and return (in °C)
         """
-        self.heating_curves = {
-            "radiator_low_insulation": {"T_out": [-10, 15], "T_supply": [75, 45], "delta_T": 20},
-            "radiator_high_insulation": {"T_out": [-10, 15], "T_supply": [55, 35], "delta_T": 15},
-            "floor_low_insulation": {"T_out": [-10, 15], "T_supply": [45, 25], "delta_T": 5},
-            "floor_high_insulation": {"T_out": [-10, 15], "T_supply": [35, 20], "delta_T": 5}
-        }
+        self.heating_curves = exogenous.HEATING_CURVES
 
         curve = self.heating_curves[buildingtype]
         Tsupply = np.interp(out_temp, curve['T_out'], curve['T_supply'])
@@ -455,13 +526,11 @@ class Controller():
         if config == '3-runner' or config == '4-runner':
             
             # Space heating :
-            sh_out = f"tank_connections.{self.sh_out}"
-            if self.sh_out2: 
-                sh_out2 = f"tank_connections.{self.sh_out2}" #using the dhw tank as the hotter tank!
+            sh_out2 = self.sh_out2 #using the dhw tank as the hotter tank!
+            if self._signals is not None:
+                Tsup, Tdelta = self._signals.sh_supply_T[self._step_index], self._signals.sh_dT #precomputed from heating curve
             else:
-                sh_out2 = None
-            building = 'radiator_high_insulation' #TODO move this to the params
-            Tsup, Tdelta = self.supply_temp(self.T_amb, building) #from heating curve
+                Tsup, Tdelta = self.supply_temp(self.T_amb, SH_BUILDING) #from heating curve
             # using Tdelta to calculate Tretun, and then updating it if incase T supply changes
             self.heat_dT_sh = Tdelta
 
@@ -472,8 +541,8 @@ class Controller():
             except ZeroDivisionError:
                 sh_F = 0 #unlikely in current setup, but if return temp delta not fixed, then maybe
 
-            sh_T = helpers.get_nested_attr(self, sh_out+'_T')   #temp of the colder tank
-            sh2_T = helpers.get_nested_attr(self, sh_out2+'_T') if sh_out2 else None
+            sh_T = self.port(self.sh_out, 'T').get()   #temp of the colder tank
+            sh2_T = self.port(sh_out2, 'T').get() if sh_out2 else None
 
             fhot, fcold, Tsup = self.tcvalve1.get_flows(sh2_T, sh_T, Tsup, sh_F, Tdelta) #required flow rates from each of the tanks
             # tqdm.write(f'fhot:{fhot}, fcold:{fcold}')
@@ -495,16 +564,15 @@ class Controller():
                 tqdm.write(f'Deficit : {self.sh_supply - self.sh_demand}')
 
             #setting corresponding flow rates
-            helpers.set_nested_attr(self, sh_out+'_F', -fcold)
-            helpers.set_nested_attr(self, sh_out2+'_F', -fhot)
+            self.port(self.sh_out, 'F').set(-fcold)
+            self.port(sh_out2, 'F').set(-fhot)
 
             # helpers.set_nested_attr(self, sh_out+'_T', sh_T)
             # helpers.set_nested_attr(self, sh_out2+'_T', sh2_T)
 
 
             #dhw
-            dhw_out = f"tank_connections.{self.dhw_out}"
-            self.dhw_out_T = helpers.get_nested_attr(self,dhw_out+'_T')
+            self.dhw_out_T = self.port(self.dhw_out, 'T').get()
 
             try:
                 dhw_F = self.dhw_demand/(4184 * self.dhw_Tdelta)
@@ -524,25 +592,224 @@ class Controller():
 
 
             self.IdealHrodsum += self.P_hr_sh
-            helpers.set_nested_attr(self, dhw_out+'_F', -dhw_F)
-            helpers.set_nested_attr(self, dhw_out+'_T', self.dhw_out_T)
+            self.port(self.dhw_out, 'F').set(-dhw_F)
+            self.port(self.dhw_out, 'T').set(self.dhw_out_T)
 
             self.dhw_rT = self.dhw_out_T - self.dhw_Tdelta
 
             if config == '3-runner':
-                helpers.set_nested_attr(self, f"tank_connections.{self.ret_tank}_F", dhw_F + sh_F)
-                helpers.set_nested_attr(self, f"tank_connections.{self.ret_tank}_T", (self.dhw_rT*dhw_F + Tret*sh_F)/(dhw_F+sh_F) if (dhw_F+sh_F) != 0 else 0)
+                self.port(self.ret_tank, 'F').set(dhw_F + sh_F)
+                self.port(self.ret_tank, 'T').set((self.dhw_rT*dhw_F + Tret*sh_F)/(dhw_F+sh_F) if (dhw_F+sh_F) != 0 else 0)
             elif config == '4-runner':
-                helpers.set_nested_attr(self, f"tank_connections.{self.sh_ret}_F", sh_F)
-                helpers.set_nested_attr(self, f"tank_connections.{self.sh_ret}_T", Tret)
+                self.port(self.sh_ret, 'F').set(sh_F)
+                self.port(self.sh_ret, 'T').set(Tret)
 
-                helpers.set_nested_attr(self, f"tank_connections.{self.dhw_ret}_F", dhw_F)
-                helpers.set_nested_attr(self, f"tank_connections.{self.dhw_ret}_T", self.dhw_rT)
+                self.port(self.dhw_ret, 'F').set(dhw_F)
+                self.port(self.dhw_ret, 'T').set(self.dhw_rT)
             # tqdm.write(f'calculated  temps : {Tsup}, return {Tret}')
             # tqdm.write(f'calculated  flows tank2 : {fhot}, tank1 {fcold}')
 
             
 
+class ControllerBank():
+    """
+    Steps many controllers at once, e.g. the controller of every configuration of a batch (see batch_sim.py).
+
+    The generator, tank port and sensor state of controller k is bound to row k of (n_controllers, ...) arrays
+    (see Controller.bind_state), the controllers need the same generators, tanks, ports and sensors. A step runs
+    Controller.step_supply of every controller, then the rules of control strategy '1' and the tank balance
+    as array operations over all controllers:
+    * the rule table is held as arrays: per rule the generator, tank and layer indices, and the turn on/off
+      temperatures per controller (grouped by controllers with the same rules apart from the temperatures),
+    * the balancing flows of the TankbalanceSetup links are computed for all controllers with the same links at
+      once, the netflow check gives the error of each controller separately.
+    The additional conditions of the rules are still checked per controller (Controller.check_conditions).
+
+    A bank with fewer than `vectorize_from` controllers steps them one by one (Controller.step), the results of both
+    modes are identical.
+    """
+    vectorize_from = 8
+
+    def __init__(self, controllers, vectorize=None):
+        layout = self.layout(controllers[0])
+        if any(self.layout(ctrl) != layout for ctrl in controllers):
+            raise ValueError('The controllers of a ControllerBank need the same generators, tanks, ports and sensors.')
+        n = len(controllers)
+        first = controllers[0]
+        self.controllers = controllers
+        self.vectorized = n >= self.vectorize_from if vectorize is None else vectorize
+
+        self.gen_status = np.empty((n, len(first.gens)), dtype=object)
+        self.gen_demand = np.zeros((n, len(first.gens)))
+        self.gen_supply = np.zeros((n, len(first.gens)))
+        self.port_T = np.zeros((n,) + first._port_T.shape)
+        self.port_F = np.zeros((n,) + first._port_F.shape)
+        self.sensor_T = np.zeros((n,) + first._sensor_T.shape)
+        for k, ctrl in enumerate(controllers):
+            ctrl.bind_state(self.gen_status[k], self.gen_demand[k], self.gen_supply[k],
+                            self.port_T[k], self.port_F[k], self.sensor_T[k])
+
+        self._rule_groups = self._compile_rules()
+        links = defaultdict(list)
+        for k, ctrl in enumerate(controllers):
+            links[tuple(ctrl._links) if ctrl.no_tanks > 1 else ()].append(k)
+        self._link_groups = [(np.asarray(idx), links) for links, idx in links.items()]
+
+    @staticmethod
+    def layout(ctrl):
+        """The generators, tanks, ports and sensors of a controller, equal for all controllers of a bank."""
+        return tuple(ctrl.gens), tuple(ctrl.tanks), tuple(ctrl._port_names), tuple(ctrl.sensors)
+
+    def _compile_rules(self):
+        # groups of controllers with the same rules apart from the temperatures:
+        # (indices, [(gen, on_tank, on_layer, low, off_tank, off_layer, high, has_on_conds, has_off_conds)])
+        groups = defaultdict(list)
+        for k, ctrl in enumerate(self.controllers):
+            structure = tuple((status_key, on_tank, on_layer, off_tank, off_layer, bool(on_conds), bool(off_conds))
+                              for status_key, _, on_tank, on_layer, _, off_tank, off_layer, _, on_conds, off_conds in ctrl._rules)
+            groups[structure].append(k)
+
+        compiled = []
+        for structure, idx in groups.items():
+            ctrl = self.controllers[idx[0]]
+            rules = []
+            for r, (status_key, on_tank, on_layer, off_tank, off_layer, on_conds, off_conds) in enumerate(structure):
+                low = np.array([self.controllers[k]._rules[r][4] for k in idx], dtype=float)
+                high = np.array([self.controllers[k]._rules[r][7] for k in idx], dtype=float)
+                rules.append((ctrl._gen_index[status_key[:-len('_status')]],
+                              ctrl._tank_index[on_tank], ctrl.sensors.index(on_layer), low,
+                              ctrl._tank_index[off_tank], ctrl.sensors.index(off_layer), high, on_conds, off_conds))
+            compiled.append((np.asarray(idx), rules))
+        return compiled
+
+    def step(self, time, errors=None, indices=None):
+        """
+        Steps the controllers (all, or the given indices). errors: optional dict, the exception of a controller is
+        stored as errors[index] and the others are still stepped (without, the first exception is raised).
+        """
+        failed = {} if errors is None else errors
+        indices = range(len(self.controllers)) if indices is None else indices
+        for k in indices:
+            ctrl = self.controllers[k]
+            try:
+                if self.vectorized:
+                    ctrl.step_supply(time)
+                else:
+                    ctrl.step(time)
+            except Exception as e:
+                failed[k] = e
+        if self.vectorized:
+            self.apply_rules(failed)
+            self.balance_tanks(failed)
+        if errors is None and failed:
+            raise next(iter(failed.values()))
+
+    def apply_rules(self, errors):
+        """Controller.apply_rules for all controllers that use the rules (Controller.uses_rules)."""
+        for idx, rules in self._rule_groups:
+            ctrls = [self.controllers[k] for k in idx]
+            active = np.array([ctrl.uses_rules for ctrl in ctrls])
+            if not active.any():
+                continue
+            mass = np.array([ctrl.hwt_mass for ctrl in ctrls], dtype=float)
+            step_size = np.array([ctrl.step_size for ctrl in ctrls], dtype=float)
+            temps = self.sensor_T[idx]
+            status, demand = self.gen_status[idx], self.gen_demand[idx]
+
+            for r, (gen, on_tank, on_layer, low, off_tank, off_layer, high, on_conds, off_conds) in enumerate(rules):
+                # Turn on logic, the additional conditions can overwrite the temp setpoints
+                T_on = temps[:, on_tank, on_layer]
+                on = active & (T_on <= low)
+                if on_conds:
+                    on |= self._check_conditions(ctrls, idx, r, 8, active & ~on, errors)
+                status[on, gen] = 'on'
+                demand[on, gen] = (mass * 4184 * (low - T_on) / step_size)[on]
+
+                # Turn off logic
+                off = active & (temps[:, off_tank, off_layer] >= high)
+                if off_conds:
+                    off |= self._check_conditions(ctrls, idx, r, 9, active & ~off, errors)
+                status[off, gen] = 'off'
+                demand[off, gen] = 0
+
+            self.gen_status[idx], self.gen_demand[idx] = status, demand
+
+    @staticmethod
+    def _check_conditions(ctrls, idx, r, field, mask, errors):
+        # the additional conditions (field 8 turn on, 9 turn off of rule r) of the controllers in mask
+        hit = np.zeros(len(ctrls), dtype=bool)
+        for i in np.flatnonzero(mask):
+            try:
+                hit[i] = ctrls[i].check_conditions(ctrls[i]._rules[r][field])
+            except Exception as e:
+                errors.setdefault(idx[i].item(), e)
+        return hit
+
+    def balance_tanks(self, errors):
+        """Controller.balance_tanks for all controllers, a netflow error is stored in errors."""
+        port_T, port_F = self.port_T, self.port_F
+        for idx, links in self._link_groups:
+            residual = None
+            for src_tank, src_port, dst_tank, dst_port in links:
+                port_F[idx, src_tank, src_port] = 0
+                residual = port_F[idx, src_tank].sum(axis=1)
+                # flow from src to dst if the residual flow is positive, else from dst to src
+                T_link = np.where(residual > 0, port_T[idx, src_tank, src_port], port_T[idx, dst_tank, dst_port])
+                port_T[idx, dst_tank, dst_port] = T_link
+                port_T[idx, src_tank, src_port] = T_link
+                port_F[idx, dst_tank, dst_port] = residual
+                port_F[idx, src_tank, src_port] = -residual
+            if residual is not None:
+                for k, val in zip(idx.tolist(), residual.tolist()):
+                    self.controllers[k].residual_flow = val
+
+        netflow = port_F.sum(axis=2)
+        for ctrl, val in zip(self.controllers, netflow[:, -1].tolist()):
+            ctrl.netflow = val
+        for k in np.flatnonzero((np.abs(netflow) > 1e-5).any(axis=1)).tolist():
+            tank = np.flatnonzero(np.abs(netflow[k]) > 1e-5)[0]
+            errors.setdefault(k, ValueError(f"{self.controllers[k].tanks[tank]} netflow error!"))
+
+class ArrayView(MutableMapping):
+    """
+    Dict-like view of elements of arrays, keys maps each key to (array, index). Values of numeric arrays are
+    returned as floats, of object arrays as they are; the set of keys is fixed.
+    """
+    def __init__(self, keys):
+        self._keys = {key : (array, j, array.dtype != object) for key, (array, j) in keys.items()}
+
+    def __getitem__(self, key):
+        array, j, numeric = self._keys[key]
+        return float(array[j]) if numeric else array[j]
+
+    def __setitem__(self, key, val):
+        array, j, _ = self._keys[key]
+        array[j] = val
+
+    def __delitem__(self, key):
+        raise TypeError('Keys of an ArrayView can not be removed.')
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class TankPorts(ArrayView):
+    """
+    View of the ports of one tank (keys '<port>_T' and '<port>_F', e.g. 'heat_out2_F') into the rows
+    of the port temperature and flow arrays of the controller.
+    """
+    def __init__(self, temps, flows, ports):
+        keys = {}
+        for j, port in enumerate(ports):
+            keys[f'{port}_T'] = (temps, j)
+            keys[f'{port}_F'] = (flows, j)
+        super().__init__(keys)
+
 class TCValve():
     def __init__(self, max):
         """
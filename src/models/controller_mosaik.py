@@ -2,6 +2,8 @@
 Mosaik interface for controller model
 
 """
+from functools import partial
+
 import mosaik_api
 from src.models.controller import Controller
 from tqdm import tqdm
@@ -64,11 +66,16 @@ class ControllerSimulator(mosaik_api.Simulator):
         super().__init__(META)
 
         self.models = dict()  # contains the model instances
+        self.paths = dict()  # compiled attribute paths per model (helpers.PathCache)
+        self.plans = dict()  # cached output plans of get_data, per requested outputs
+        self.tracers = dict()  # helpers.DebugTracer per model, if debug is on
+        self.trace_options = dict()
         self.sid = None
         self.eid_prefix = 'Controller_'
         self.step_size = None
         self.async_requests = dict()
         self.time = None
+        self.step_time = None
         self.step_executed = False
         self.first_iteration = None
         self.final_iteration = False
@@ -86,6 +93,7 @@ class ControllerSimulator(mosaik_api.Simulator):
         dummy_obj = Controller(params)
         self.meta['models']['Controller']['attrs'] = dummy_obj.get_init_attrs()
         self.debug = params.get('debug', 'off').lower()
+        self.trace_options = params.get('debug_trace', {}) # every, sample, include, start, end, buffer_size of the DebugTracer
         return self.meta
 
     def create(self, num, model, params=None):
@@ -102,10 +110,13 @@ class ControllerSimulator(mosaik_api.Simulator):
                 self.models[eid] = Controller()
                 auto_attrs = self.models[eid].get_init_attrs()
                 self.meta['models']['Controller']['attrs'] = auto_attrs
+            self.paths[eid] = helpers.PathCache(self.models[eid])
             entities.append({'eid': eid, 'type': model})
+        self.plans.clear()
         return entities
 
     def step(self, time, inputs, max_advance):
+        self.step_time = time # time of the last step, also for time-based runs (self.time is set only for same time loops)
         if self.meta['type'] == 'event-based':
             if self.time != time:
                 self.first_iteration = True
@@ -123,7 +134,7 @@ class ControllerSimulator(mosaik_api.Simulator):
                 if len(src_ids) > 1:
                     raise ValueError('Two many inputs for attribute %s' % attr)
                 for val in src_ids.values():
-                    helpers.set_nested_attr(self.models[eid], attr, val)
+                    self.paths[eid][attr].set(val)
                     # tqdm.write(f'Setting inputs in controller {attr} : {val}')
             if self.meta['type'] == 'event-based':
                 if not self.step_executed:
@@ -139,30 +150,59 @@ class ControllerSimulator(mosaik_api.Simulator):
         else:
             return time + self.step_size
 
-    def get_data(self, outputs):
-        data = {}
-        data['time'] = self.time
+    def output_plan(self, outputs):
+        """
+        Validates the requested attributes once and binds a getter to each of them. For same time loops, the
+        iteration in which an attribute is sent is stored with it : (attr, getter, first_iteration, final_iteration).
+        """
+        known = set(self.meta['models']['Controller']['attrs'])
+        first_attrs = set(hp_attrs + db_attrs + chp_attrs)
+        final_attrs = set(hwt_attrs)
+        plan = []
         for eid, attrs in outputs.items():
-            data[eid] = {}
+            getters = []
             for attr in attrs:
-                if attr not in self.meta['models']['Controller'][
-                        'attrs']:
+                if attr not in known:
                     raise ValueError('Unknown output attribute: %s' % attr)
                 if self.meta['type'] == 'event-based':
-                    if self.first_iteration and (attr in hp_attrs or attr in db_attrs or attr in chp_attrs):
-                        data[eid][attr] = getattr(self.models[eid], attr)
-                    elif self.final_iteration and attr in hwt_attrs:
-                        if attr == 'T_amb_hwt':
-                            data[eid][attr] = getattr(self.models[eid], 'T_amb')
-                        else:
-                            data[eid][attr] = getattr(self.models[eid], attr)
+                    if attr in first_attrs or attr in final_attrs:
+                        name = 'T_amb' if attr == 'T_amb_hwt' else attr
+                        getters.append((attr, partial(getattr, self.models[eid], name), attr in first_attrs, attr in final_attrs))
                 else:
-                    # data[eid][attr] = getattr(self.models[eid], attr)
-                    data[eid][attr] = helpers.get_nested_attr(self.models[eid], attr) #Modified only this, same time loops not yet!
-                    # tqdm.write(f'Getting data from ctrl {attr} : {data[eid][attr]}')
+                    getters.append((attr, self.paths[eid][attr].get, True, True))
+            plan.append((eid, attrs, getters))
+        return plan
+
+    def get_data(self, outputs):
+        key = tuple((eid, tuple(attrs)) for eid, attrs in outputs.items())
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = self.plans[key] = self.output_plan(outputs)
+        data = {}
+        data['time'] = self.time
+        event_based = self.meta['type'] == 'event-based'
+        for eid, attrs, getters in plan:
+            data[eid] = values = {}
+            if event_based:
+                for attr, get, first, final in getters:
+                    if self.first_iteration and first:
+                        values[attr] = get()
+                    elif self.final_iteration and final:
+                        values[attr] = get()
+            else:
+                for attr, get, _, _ in getters:
+                    values[attr] = get()
+                    # tqdm.write(f'Getting data from ctrl {attr} : {values[attr]}')
             if self.debug == 'on':
-                helpers.debug_trace(self.time, attrs, self.models[eid], 'Controller_trace.csv')
+                tracer = self.tracers.get(eid)
+                if tracer is None:
+                    tracer = self.tracers[eid] = helpers.DebugTracer(f'{eid}_trace.csv', attrs, self.models[eid], **self.trace_options)
+                tracer.record(self.step_time)
         return data
+
+    def finalize(self):
+        for tracer in self.tracers.values():
+            tracer.close()
 #models[eid] : eid is a unique ID, and the value of this key is an object our controller class, so all attributes in init seen here.
 
 def main():
@@ -0,0 +1,78 @@
+'''
+Precomputation of the exogenous signals of the controller.
+
+The calendar flags, the heat demands and the required supply temperature of the space heating circuit only depend
+on the heat load csv (e.g. Input_kfw55_2_el.csv), so they are derived once for all steps of the run with vectorized
+pandas/NumPy operations instead of in every Controller.step. The controller indexes them by step number
+(time // step_size), see Controller.step.
+
+The rows are selected like mosaik_csv does it (the last row with a timestamp <= the step time), so the values are the
+same the controller would receive through the connections of the csv simulator.
+'''
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from src.models.cached_csv import load_table
+
+# Generic heating curves, Source : npro
+HEATING_CURVES = {
+    "radiator_low_insulation": {"T_out": [-10, 15], "T_supply": [75, 45], "delta_T": 20},
+    "radiator_high_insulation": {"T_out": [-10, 15], "T_supply": [55, 35], "delta_T": 15},
+    "floor_low_insulation": {"T_out": [-10, 15], "T_supply": [45, 25], "delta_T": 5},
+    "floor_high_insulation": {"T_out": [-10, 15], "T_supply": [35, 20], "delta_T": 5}
+}
+
+class ExogenousSignals():
+    '''
+    Per step signals of one heat load file. Every attribute is a list indexed by step number, the values are
+    python objects (float, bool, str, pd.Timestamp), as the controller would have computed them:
+
+    * timestamp : pd.Timestamp of the csv row
+    * season : 'summer' (June - August) or 'winter'
+    * isday : True from 8:00 to 18:59, False otherwise, None at hour 0 (as in Controller.step)
+    * heat_demand, sh_demand, dhw_demand : demands in W, negative values set to 0
+    * T_amb : ambient temperature (°C)
+    * sh_supply_T : required supply temperature of the space heating circuit (°C) from the heating curve
+    * sh_dT : temperature difference of the heating curve (°C), a scalar
+    '''
+    def __init__(self, data, times, building):
+        rows = data.index.get_indexer(times, method='ffill')
+        if (rows < 0).any():
+            raise ValueError(f"Start date {times[0]} is before the first timestamp of the heat load data ({data.index[0]})")
+        data = data.iloc[rows]
+
+        timestamp = pd.to_datetime(data['Timestamp'])
+        month = timestamp.dt.month.to_numpy()
+        hour = timestamp.dt.hour.to_numpy()
+
+        self.timestamp = list(timestamp)
+        self.season = np.where((month >= 6) & (month <= 8), 'summer', 'winter').tolist()
+        isday = np.where((hour >= 8) & (hour <= 18), True, False).astype(object)
+        isday[hour == 0] = None
+        self.isday = isday.tolist()
+
+        def in_watts(col):
+            kW = data[col].to_numpy(dtype=float)
+            return np.where(kW < 0, 0.0, kW * 1000).tolist()
+        self.heat_demand = in_watts('Heat Demand [kW]')
+        self.sh_demand = in_watts('Space heating (kW)')
+        self.dhw_demand = in_watts('Domestic hot water (kW)')
+
+        curve = HEATING_CURVES[building]
+        T_amb = data['T_amb'].to_numpy(dtype=float)
+        self.T_amb = T_amb.tolist()
+        self.sh_supply_T = np.interp(T_amb, curve['T_out'], curve['T_supply']).tolist()
+        self.sh_dT = curve['delta_T']
+
+@lru_cache(maxsize=8)
+def load_signals(datafile, start, until, step_size, building='radiator_high_insulation'):
+    '''
+    Reads the heat load csv (from the binary cache, see cached_csv.py) and returns the ExogenousSignals for the steps range(0, until, step_size) after start.
+    Cached, so all controllers of a process (and of a batch) share one instance; the result must not be modified.
+    '''
+    data = load_table(datafile).frame(['Timestamp', 'Heat Demand [kW]', 'Space heating (kW)', 'Domestic hot water (kW)', 'T_amb'])
+
+    times = pd.to_datetime(start) + pd.to_timedelta(range(0, until, step_size), unit='s')
+    return ExogenousSignals(data, times, building)
@@ -0,0 +1,65 @@
+'''
+Lookup data of the heat pump model (mosaik_components.heatpump), parsed once per process.
+
+Heat_Pump_Design reads eta_s_data.json (operating limits and design points of the heat pump models, 145 kB) in
+every step, and every created heat pump reads cop_m_data.json (3.7 MB, calc_mode 'fast'), which takes about 40 %
+of a native run. The json module in Heat_Pump_Design and Heat_Pump_mosaik is replaced by a CachedJson, which parses
+every file once and returns the same object afterwards (the models only read the data, the results do not change):
+* cached() only while in the context (or in the decorated function, e.g. run_DES), the modules are restored afterwards,
+* install() for the rest of the process, called explicitly by the sweep workers (preload() parses both files in
+  advance, in the initializer of a worker).
+The native engine passes the COP data to the heat pump (cop_data), so it only needs the patch for eta_s_data.json.
+'''
+import json
+import os
+from contextlib import contextmanager
+
+from mosaik_components.heatpump import Heat_Pump_Design, Heat_Pump_mosaik
+
+FILES = [Heat_Pump_Design.JSON_DATA_FILE, Heat_Pump_mosaik.JSON_COP_DATA]
+
+
+class CachedJson():
+    '''Stands in for the json module: load() parses every file (by path) once.'''
+    def __init__(self):
+        self.data = {} # path : parsed content
+
+    def load(self, f, **kwargs):
+        name = getattr(f, 'name', None)
+        if not isinstance(name, str) or kwargs:
+            return json.load(f, **kwargs)
+        path = os.path.abspath(name)
+        if path not in self.data:
+            self.data[path] = json.load(f)
+        return self.data[path]
+
+    def __getattr__(self, attr):
+        return getattr(json, attr)
+
+_JSON = CachedJson()
+
+def install():
+    Heat_Pump_Design.json = _JSON
+    Heat_Pump_mosaik.json = _JSON
+
+@contextmanager
+def cached():
+    '''Parses the lookup files once while in the context (also a decorator), the previous json modules are restored afterwards.'''
+    saved = Heat_Pump_Design.json, Heat_Pump_mosaik.json
+    install()
+    try:
+        yield
+    finally:
+        Heat_Pump_Design.json, Heat_Pump_mosaik.json = saved
+
+def preload():
+    '''Installs the cache and parses the lookup files.'''
+    install()
+    for file in FILES:
+        with open(file) as f:
+            _JSON.load(f)
+
+def cop_data(hp_model):
+    '''COP and mass flow table of hp_model (calc_mode 'fast').'''
+    with open(Heat_Pump_mosaik.JSON_COP_DATA) as f:
+        return _JSON.load(f)[hp_model]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Output simulator, writes all inputs to a run file (see utils/run_file.py) instead of a csv file.
+
+Replaces mosaik_csv_writer:CSVWriter for DES_data: the values are kept in typed columns (collector.SpillingStore)
+and every completed month is appended to one binary file per column, optionally compressed ('zlib').
+The column names are '<src>-<attr>' as in the csv file; utils.run_file.export_csv writes the csv for reading.
+"""
+import mosaik_api_v3 as api
+
+from src.models.collector import SpillingStore
+
+META = {
+    "type": "event-based",
+    "models":
+        {"OutputWriter":
+            {"public": True,
+             "any_inputs": True,
+             "params": [],
+             "attrs": []}},
+}
+
+class OutputWriter(api.Simulator):
+    def __init__(self):
+        super().__init__(META)
+        self.eid = None
+        self.store = None
+
+    def init(self, sid, time_resolution, start_date, end, step_size, output_dir, compression=None, freq='M'):
+        self.store = SpillingStore(start_date, end, step_size, output_dir, freq=freq, compression=compression)
+        return self.meta
+
+    def create(self, num, model):
+        if num > 1 or self.eid is not None:
+            raise RuntimeError('Can only create one instance of OutputWriter.')
+        self.eid = "OutputWriter"
+        return [{"eid": self.eid, "type": model}]
+
+    def step(self, time, inputs, max_advance):
+        step = self.store.index(time)
+        for attr, by_src in inputs.get(self.eid, {}).items():
+            for src, value in by_src.items():
+                self.store.set((src, attr), step, value)
+
+    def finalize(self):
+        self.store.result() # writes the last chunk
@@ -1,15 +1,62 @@
-import pvlib
 import pandas as pd
 import numpy as np
 import os
 import json
 import uuid
-
-def sim(params):
+import hashlib
+from functools import lru_cache
+from importlib.metadata import version
+
+from src.models import cached_csv
+from src.models.weather import load_weather
+
+MODULE_INFO = ['SandiaMod','SunPower_128_Cell_Module__2009__E__']
+INVERTER_INFO = ['cecinverter', 'AEconversion_GMbH__INV500_90US_xxxxx__208V_']
+NSNP = [1,1]
+TEMPERATURE_MODEL = ['sapm', 'open_rack_glass_glass']
+P_REF = 500 # nominal power of the above config in W, the output is scaled linearly to nom_power
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cache', 'pv'))
+_PROFILES = {} # key : reference profile, loaded in this process
+_RECORDS = {} # (library, name) : parameters of the module/inverter, loaded in this process
+
+@lru_cache(maxsize=None)
+def pvlib_version():
+    return version('pvlib') # without importing pvlib
+
+def sam_record(library, name, cache_dir=None):
+    '''
+        Parameters of one module/inverter of a SAM library (pvlib.pvsystem.retrieve_sam(library)[name]).
+        The library is parsed once, the record is stored in data/cache/pv/sam/<library>-<name>-<pvlib version>.json
+        and later loaded from there (pvlib is not imported for it).
+    '''
+    record = _RECORDS.get((library, name))
+    if record is not None:
+        return record
+
+    path = os.path.join(cache_dir or os.path.join(CACHE_DIR, 'sam'), '%s-%s-%s.json' % (library, name, pvlib_version()))
+    if os.path.exists(path):
+        with open(path) as f:
+            record = pd.Series(json.load(f), name=name, dtype=object)
+    else:
+        import pvlib
+        record = pvlib.pvsystem.retrieve_sam(library)[name]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.tmp%d' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({key : getattr(val, 'item', lambda: val)() for key, val in record.items()}, f, indent=4)
+        os.replace(tmp, path)
+    _RECORDS[(library, name)] = record
+    return record
+
+def weather_file(params):
+    return os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', params.get('irradiation_data'))) #Relative to the main_sim dir
+
+def run_model(params, scale=True):
     # module library at https://github.com/pvlib/pvlib-python/blob/main/pvlib/data/sam-library-sandia-modules-2015-6-30.csv
     # local dataset at pvlib/data (see comments of retrieve_sam method for more details!)
     '''
-        Standalone pvlib model.
+        Runs the pvlib model chain, returns the weather data with the pv power 'Power[w]'.
+        scale=False returns the power of the P_REF reference system.
     '''
     params_sample= {
         'calc_mode' : 'simple',
@@ -21,27 +68,24 @@ def sim(params):
         # longitude = params.get('longitude')
         nom_power = params.get('nom_power')
         coordinates = params.get('coordinates')
-        data_path = params.get('irradiation_data') #Relative to the main_sim dir
 
-        module_info = ['SandiaMod','SunPower_128_Cell_Module__2009__E__']
-        inverter_info = ['cecinverter', 'AEconversion_GMbH__INV500_90US_xxxxx__208V_']
-        nSnP = [1,1]
-        power_ratio = nom_power/500 #The above config has a Pnom of 500 watts, scaling output according to user requested power.
+        module_info = MODULE_INFO
+        inverter_info = INVERTER_INFO
+        nSnP = NSNP
+        power_ratio = nom_power/P_REF if scale else 1 #The above config has a Pnom of 500 watts, scaling output according to user requested power.
     else:
         print('PV calc_mode not defined! NO PV for you!!!')
         
     
     # coordinates = [(49.1, 8.5, 'Stutensee', 110, 'Etc/GMT-1')]
 
-    modules_db = pvlib.pvsystem.retrieve_sam(module_info[0])
-
-    sapm_inverters = pvlib.pvsystem.retrieve_sam(inverter_info[0])
+    from pvlib.temperature import TEMPERATURE_MODEL_PARAMETERS
 
-    module = modules_db[module_info[1]] #replace BAD_CHARS = ' -.()[]:+/",' ; with simply _
+    module = sam_record(*module_info) #replace BAD_CHARS = ' -.()[]:+/",' ; with simply _
 
-    inverter = sapm_inverters[inverter_info[1]]
+    inverter = sam_record(*inverter_info)
 
-    temperature_model_parameters = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_glass']
+    temperature_model_parameters = TEMPERATURE_MODEL_PARAMETERS[TEMPERATURE_MODEL[0]][TEMPERATURE_MODEL[1]]
 
     latitude, longitude, name, altitude, timezone = coordinates
 
@@ -51,26 +95,7 @@ def sim(params):
     # --------------------------npro weather-----------------------------------------
     # raw = pd.read_csv(os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', '..', 'data', 'inputs', '2025-04-07-Project1-weather.csv')), 
     #                   sep=';', index_col='Time', encoding='cp1252')
-    raw = pd.read_csv(os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', data_path)), 
-                      sep=';', index_col='Time', encoding='cp1252')
-
-    weather = pd.DataFrame({
-        'ghi' : raw['Global horizontal irradiance (W/m²)'],
-        'dni' : raw['Direct normal irradiance (W/m²)'],
-        'dhi' : raw['Horizontal infrared radiation (W/m²)'],
-        'temp_air' : raw['Air temperature (°C)'],
-        'wind_speed' : raw['Wind speed (m/s)']
-    })
-
-    
-    weather.index = pd.to_datetime(raw.index, format = "%d.%m. %H:%M")
-    weather.index = weather.index.tz_localize(timezone)
-    weather.index.name=None
-
-    weather.index = weather.index.map(lambda x:x.replace(year = 2022))
-
-    weather = weather.resample('15min').interpolate(method='linear')
-    
+    weather = load_weather(weather_file(params), timezone) # tz aware, resampled to 15 min (cached, see models/weather.py)
 
     from pvlib.pvsystem import PVSystem, Array, FixedMount
     from pvlib.modelchain import ModelChain
@@ -107,6 +132,76 @@ def sim(params):
     weather['Power[w]'] = mc.results.ac * power_ratio
 
     weather.index = weather.index.tz_localize(None)
+    return weather
+
+def profile_key(params):
+    '''
+        Hash of everything the reference profile depends on: location, weather file content, module, inverter,
+        mount and the pvlib version (not nom_power, the output scales linearly with it).
+    '''
+    latitude = params['coordinates'][0]
+    key = {
+        'coordinates' : list(params['coordinates']),
+        'weather' : cached_csv.digest(weather_file(params)),
+        'module' : MODULE_INFO,
+        'inverter' : INVERTER_INFO,
+        'nSnP' : NSNP,
+        'mount' : [latitude, 180], # surface tilt, azimuth
+        'temperature_model' : TEMPERATURE_MODEL,
+        'pvlib' : pvlib_version(),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+def reference_profile(params, cache_dir=None):
+    '''
+        Power of the P_REF reference system. Computed once per key (see profile_key) and stored in
+        data/cache/pv/<key>.npz, later calls (in any process) load it from there.
+    '''
+    key = profile_key(params)
+    power = _PROFILES.get(key)
+    if power is not None:
+        return power
+
+    path = os.path.join(cache_dir or CACHE_DIR, key + '.npz')
+    if os.path.exists(path):
+        with np.load(path) as data:
+            power = pd.Series(data['power'], index=pd.DatetimeIndex(data['index']), name='Power[w]')
+    else:
+        power = run_model(params, scale=False)['Power[w]']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.tmp%d' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, index=power.index.values.astype('datetime64[ns]'), power=power.to_numpy())
+        os.replace(tmp, path)
+        print('PVlib simulation finished!')
+    _PROFILES[key] = power
+    return power
+
+def reference_profiles(params_list):
+    '''Reference profiles of all distinct pv params, {key : profile}, e.g. to publish them to sweep workers.'''
+    return {profile_key(params) : reference_profile(params) for params in params_list}
+
+def register_profiles(profiles):
+    '''Makes reference profiles ({key : profile}, see reference_profiles) available to profile() in this process.'''
+    _PROFILES.update(profiles)
+
+def profile(params, cache=True):
+    '''
+        PV power profile 'Power[w]' (pd.Series with the 15 min index), passed to run_DES in memory.
+        With cache, the reference profile is scaled to nom_power instead of running pvlib again.
+    '''
+    if params['calc_mode'] != 'simple' or not cache:
+        power = run_model(params)['Power[w]']
+        print('PVlib simulation finished!')
+        return power
+    return reference_profile(params) * (params['nom_power']/P_REF)
+
+def sim(params):
+    '''
+        Standalone pvlib model, writes the weather data and the pv power to data/outputs/pv/PVlib_output<id>.csv
+        and returns the path.
+    '''
+    weather = run_model(params)
     unique_id = str(uuid.uuid4())[:8]
     script_dir = os.path.dirname(os.path.abspath(__file__))
     output_path = os.path.abspath(os.path.join(script_dir, '..', '..', 'data', 'outputs', 'pv', f'PVlib_output{unique_id}.csv'))
@@ -0,0 +1,74 @@
+'''
+Weather input of the pv model (e.g. data/inputs/2025-04-07-Project1-weather.csv).
+
+The file holds hourly values of one year with timestamps without year ('%d.%m. %H:%M', ';' separated, cp1252).
+load_weather() parses it, sets the year, localizes the timestamps and resamples to the target resolution
+(linear interpolation) once; the result is stored in data/cache/weather/<name>-<key>.npz, keyed by the hash of
+the file content, the resolution, year and time zone, and later calls (in any process) load it from there.
+
+The frame has the pvlib column names: ghi, dni, dhi, temp_air (ambient temperature in °C), wind_speed.
+'''
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.models import cached_csv
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cache', 'weather'))
+COLUMNS = {
+    'ghi' : 'Global horizontal irradiance (W/m²)',
+    'dni' : 'Direct normal irradiance (W/m²)',
+    'dhi' : 'Horizontal infrared radiation (W/m²)',
+    'temp_air' : 'Air temperature (°C)',
+    'wind_speed' : 'Wind speed (m/s)',
+}
+_FRAMES = {} # key : frame, loaded in this process
+
+def read_weather(datafile, timezone, resolution='15min', year=2022):
+    '''Parses and resamples the weather file, returns the tz aware frame.'''
+    raw = pd.read_csv(datafile, sep=';', index_col='Time', encoding='cp1252')
+    weather = pd.DataFrame({name : raw[col] for name, col in COLUMNS.items()})
+
+    times = pd.to_datetime(raw.index, format="%d.%m. %H:%M") # year 1900
+    times = pd.to_datetime(pd.DataFrame({'year' : year, 'month' : times.month, 'day' : times.day,
+                                         'hour' : times.hour, 'minute' : times.minute})) # vectorized year replacement
+    weather.index = pd.DatetimeIndex(times).tz_localize(timezone)
+    weather.index.name = None
+
+    return weather.resample(resolution).interpolate(method='linear')
+
+def weather_key(datafile, timezone, resolution='15min', year=2022):
+    key = [cached_csv.digest(datafile), str(pd.Timedelta(resolution)), year, timezone]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()[:16]
+
+def load_weather(datafile, timezone, resolution='15min', year=2022, cache=True, cache_dir=None):
+    '''
+    Weather frame (see read_weather) of datafile. With cache, it is read from the binary cache, if present.
+    '''
+    if not cache:
+        return read_weather(datafile, timezone, resolution, year)
+
+    key = weather_key(datafile, timezone, resolution, year)
+    weather = _FRAMES.get(key)
+    if weather is not None:
+        return weather.copy()
+
+    name = os.path.splitext(os.path.basename(datafile))[0]
+    path = os.path.join(cache_dir or CACHE_DIR, '%s-%s.npz' % (name, key))
+    if os.path.exists(path):
+        with np.load(path) as data:
+            index = pd.DatetimeIndex(data['index']).tz_localize('UTC').tz_convert(timezone)
+            weather = pd.DataFrame({name : data[name] for name in COLUMNS}, index=index)
+    else:
+        weather = read_weather(datafile, timezone, resolution, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.tmp%d' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, index=weather.index.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ns]'),
+                     **{name : weather[name].to_numpy() for name in COLUMNS})
+        os.replace(tmp, path)
+    _FRAMES[key] = weather
+    return weather.copy()
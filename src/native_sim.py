@@ -0,0 +1,557 @@
+'''
+In-process stepping engine for the DES scenario.
+
+`run_DES(params, engine='native')` uses this module instead of a mosaik World. All models already live in the
+same process, so the entities are wired directly: the evaluation order is computed once from the connections
+(time shifted connections are cut, the rest is sorted topologically) and every step simply copies the values
+from the source to the destination models before stepping them. The time shifted semantics of mosaik are kept,
+i.e. a time shifted input at time t is the output of the source at t - step_size, or the initial data at t = 0.
+
+The result has the same shape as the dump of the mosaik Collector ({full_id : {attr : {time : value}}}, or a DataFrame
+for the columnar collector).
+'''
+import json
+from collections import defaultdict
+
+import pandas as pd
+from tqdm import tqdm
+
+from mosaik_components.heatpump.Heat_Pump_Model import Heat_Pump
+from mosaik_components.heatpump.Heat_Pump_mosaik import META as HP_META
+from mosaik_components.heatpump.hotwatertank.hotwatertank import HotWaterTank
+
+from src.models.controller import Controller, ControllerBank
+from src.models.EnTransformer import TransformerBank
+from src.models.boiler_model_v2 import Gboiler
+from src.models.chp_model_v2 import CHP
+from src.models import cached_csv, hp_lookup
+from src.utils import helpers
+
+SENTINEL = object() # returned by a getter, if the source does not provide the attribute (mosaik would skip it as well)
+
+class CyclicDataflowError(Exception) : pass
+
+#-------------------------Nodes-------------------------------
+# A node wraps one model and mimics the step/get_data/set-input behaviour of its mosaik simulator.
+# getter()/setter() are resolved once, when the world is compiled, and return plain callables.
+
+class Node():
+    def __init__(self, full_id, model):
+        self.full_id = full_id # same id as in the mosaik scenario, e.g. 'ControllerSim-0.Controller_0'
+        self.model = model
+        self.attrs = []        # attributes recorded by the collector
+
+    def step(self, time):
+        raise NotImplementedError
+
+    def getter(self, attr):
+        model = self.model
+        return lambda: getattr(model, attr)
+
+    def setter(self, attr):
+        model = self.model
+        return lambda val: setattr(model, attr, val)
+
+    # The batch engine (batch_sim.py) steps the same node of all configurations together:
+    # bind_batch(nodes) is called once before the first step, step_batch(nodes, time) in every step.
+
+    @classmethod
+    def bind_batch(cls, nodes):
+        '''Prepares the same node of several configurations to be stepped together (nothing to do by default).'''
+
+    @classmethod
+    def step_batch(cls, nodes, time):
+        '''Steps the same node of several configurations, returns {node : exception} of the nodes that raised.'''
+        errors = {}
+        for node in nodes:
+            try:
+                node.step(time)
+            except Exception as e:
+                errors[node] = e
+        return errors
+
+
+class CSVNode(Node):
+    '''
+    Serves the rows of a csv file the same way mosaik_csv does, the row at time t is the last row with a
+    timestamp <= t. The values of all steps are gathered once in advance from the cached columns
+    (cached_csv.load_table, datafile may be a DataFrame/Series in memory), as in mosaik_csv.get_data
+    (numbers as python numbers, everything else as strings). A start before the first row raises a ValueError.
+    '''
+    def __init__(self, full_id, datafile, start, step_size, until, attrs=None, cache=True):
+        table = cached_csv.load_table(datafile, cache=cache)
+        times = pd.to_datetime(start) + pd.to_timedelta(range(0, until, step_size), unit='s')
+        rows = table.rows(times)
+        if (rows < 0).any():
+            raise ValueError(f"Start date {times[0]} is before the first timestamp of {full_id} ({pd.Timestamp(table.index[0])})")
+        self.columns = {attr : table.values(attr, rows) for attr in (table.attrs if attrs is None else attrs)}
+
+        super().__init__(full_id, None)
+        self.attrs = list(self.columns)
+        self.step_size = step_size
+        self.step_index = None
+
+    def step(self, time):
+        self.step_index = time // self.step_size
+
+    def getter(self, attr):
+        column = self.columns[attr]
+        return lambda: column[self.step_index]
+
+
+class ControllerNode(Node):
+    def __init__(self, full_id, params, step_size):
+        super().__init__(full_id, Controller(params))
+        self.attrs = self.model.get_init_attrs()
+        self.step_size = step_size
+        self.bank = None # (ControllerBank, index) in a batch, see bind_batch
+
+    def step(self, time):
+        self.model.step_size = self.step_size
+        self.model.step(time)
+
+    def getter(self, attr):
+        return helpers.compile_path(self.model, attr).get
+
+    def setter(self, attr):
+        return helpers.compile_path(self.model, attr).set
+
+    @classmethod
+    def bind_batch(cls, nodes):
+        '''One ControllerBank per layout (generators, tanks, ports and sensors) of the controllers.'''
+        groups = defaultdict(list)
+        for node in nodes:
+            groups[ControllerBank.layout(node.model)].append(node)
+        for group in groups.values():
+            bank = ControllerBank([node.model for node in group])
+            for index, node in enumerate(group):
+                node.bank = (bank, index)
+
+    @classmethod
+    def step_batch(cls, nodes, time):
+        if any(node.bank is None for node in nodes): # not bound by bind_batch
+            return super().step_batch(nodes, time)
+        errors = {}
+        banks = defaultdict(dict) # bank : {index : node}
+        for node in nodes:
+            node.model.step_size = node.step_size
+            bank, index = node.bank
+            banks[bank][index] = node
+        for bank, members in banks.items():
+            failed = {}
+            bank.step(time, failed, list(members))
+            errors.update({members[index] : e for index, e in failed.items() if index in members})
+        return errors
+
+
+class TransformerNode(Node):
+    '''
+    Boiler and CHP, stepped by a TransformerBank of its own like in TransformerSimulator.
+    Only numeric outputs are provided (as floats), like in TransformerSimulator.get_data.
+    '''
+    def __init__(self, full_id, model, step_size):
+        super().__init__(full_id, model)
+        self.unit = TransformerBank().add(model)
+        self.unit.step_size = step_size
+        self.attrs = model.get_init_attrs()
+
+    def step(self, time):
+        self.unit.bank.step(time)
+
+    def getter(self, attr):
+        return self.unit.getter(attr, SENTINEL)
+
+    def setter(self, attr):
+        return self.unit.setter(attr)
+
+    @classmethod
+    def bind_batch(cls, nodes):
+        '''The units of all nodes are moved into one TransformerBank (vectorized from TransformerBank.vectorize_from units).'''
+        bank = TransformerBank()
+        for node in nodes:
+            node.unit = bank.add(node.model)
+
+    @classmethod
+    def step_batch(cls, nodes, time):
+        errors = {}
+        banks = defaultdict(dict) # bank : {index : node}
+        for node in nodes:
+            banks[node.unit.bank][node.unit.index] = node
+        for bank, members in banks.items():
+            failed = {}
+            bank.step(time, failed)
+            errors.update({members[index] : e for index, e in failed.items() if index in members})
+        return errors
+
+
+class TankNode(Node):
+    def __init__(self, full_id, params, init_vals, step_size):
+        super().__init__(full_id, HotWaterTank(params, init_vals))
+        self.step_size = step_size
+
+    def step(self, time):
+        self.model.step(self.step_size)
+
+    def _resolve(self, attr):
+        # same lookup as hotwatertank_mosaik.get_nested_attr, but done only once
+        name, part = attr.split('.')
+        for group in ('sensors', 'connections', 'heating_rods'):
+            container = getattr(self.model, group)
+            if name in container:
+                return group, container[name], part
+        raise ValueError('Unknown attribute: %s' % attr)
+
+    def getter(self, attr):
+        if '.' not in attr:
+            return super().getter(attr)
+        group, obj, part = self._resolve(attr)
+        if group == 'connections':
+            return lambda: float(getattr(obj, part))
+        return lambda: getattr(obj, part)
+
+    def setter(self, attr):
+        if '.' not in attr:
+            return super().setter(attr)
+        _, obj, part = self._resolve(attr)
+        return lambda val: setattr(obj, part, val)
+
+
+class HeatPumpNode(Node):
+    def __init__(self, full_id, params, step_size):
+        COP_m_data = None
+        if params['calc_mode'] == 'fast':
+            COP_m_data = hp_lookup.cop_data(params['hp_model'])
+        super().__init__(full_id, Heat_Pump(params, COP_m_data))
+        self.attrs = HP_META['models']['HeatPump']['attrs']
+        self.step_size = step_size
+
+    def step(self, time):
+        self.model.inputs.step_size = self.step_size
+        self.model.step()
+
+    def getter(self, attr):
+        state = self.model.state
+        if attr == 'step_executed':
+            return lambda: state.step_executed
+        return lambda: float(getattr(state, attr))
+
+    def setter(self, attr):
+        inputs = self.model.inputs
+        return lambda val: setattr(inputs, attr, val)
+
+#-------------------------World-------------------------------
+
+class NativeWorld():
+    '''
+    Minimal replacement of mosaik.World for in-process models. Usage mirrors the mosaik scenario::
+
+        world = NativeWorld(STEP_SIZE)
+        ctrl = world.add(ControllerNode(...))
+        world.connect(tank, ctrl, ('sensor_00.T', 'tank_temps.tank0.sensor_0'), time_shifted=True, initial_data={...})
+        world.collect(ctrl)
+        data = world.run(until=END)
+    '''
+    def __init__(self, step_size):
+        self.step_size = step_size
+        self.nodes = []
+        self.connections = [] # (src, dest, [(src_attr, dest_attr)], time_shifted, initial_data)
+        self.collected = []
+        self.order = None # evaluation order, computed from the connections if None (given by a WorldTemplate)
+
+    def add(self, node):
+        self.nodes.append(node)
+        return node
+
+    def connect(self, src, dest, *attr_pairs, time_shifted=False, initial_data=None):
+        attrs = [pair if isinstance(pair, tuple) else (pair, pair) for pair in attr_pairs]
+        self.connections.append((src, dest, attrs, time_shifted, initial_data or {}))
+
+    def collect(self, *nodes):
+        self.collected.extend(nodes)
+
+    def evaluation_order(self):
+        '''
+        Topological order of the nodes, using only connections without time shift (a time shifted input
+        is already known at the start of the step). Ties are resolved by the order in which nodes were added.
+        '''
+        if self.order is not None:
+            return self.order
+        preds = {node: set() for node in self.nodes}
+        for src, dest, _, time_shifted, _ in self.connections:
+            if not time_shifted:
+                preds[dest].add(src)
+
+        order = []
+        done = set()
+        while len(order) < len(self.nodes):
+            ready = [node for node in self.nodes if node not in done and preds[node] <= done]
+            if not ready:
+                raise CyclicDataflowError('Connections without time shift form a loop.')
+            order.append(ready[0])
+            done.add(ready[0])
+        return order
+
+    def compile(self):
+        '''
+        Resolves every connection into (setter, getter) pairs once. Time shifted values are read from
+        a buffer, which is filled at the end of each step (initial data at t=0).
+        '''
+        # Like in mosaik, the initial data belongs to the source attribute, not to the connection;
+        # if two connections define it, the later one wins.
+        initial = defaultdict(dict)
+        for src, _, _, _, initial_data in self.connections:
+            initial[src].update(initial_data)
+
+        live = defaultdict(list)
+        shifted = defaultdict(list)
+        buffer = []
+        buffered = [] # (slot, getter)
+        for src, dest, attrs, time_shifted, _ in self.connections:
+            for src_attr, dest_attr in attrs:
+                setter = dest.setter(dest_attr)
+                getter = src.getter(src_attr)
+                if time_shifted:
+                    slot = len(buffer)
+                    buffer.append(initial[src].get(src_attr, SENTINEL))
+                    buffered.append((slot, getter))
+                    shifted[dest].append((setter, slot))
+                else:
+                    live[dest].append((setter, getter))
+
+        plan = [(node, live[node], shifted[node]) for node in self.evaluation_order()]
+        recorded = [(node.full_id, attr, node.getter(attr)) for node in self.collected for attr in node.attrs]
+        return plan, buffer, buffered, recorded
+
+    def run(self, until, progress=True, store=None):
+        '''
+        Runs the world until the given time. The recorded values are returned as {full_id : {attr : {time : value}}},
+        or written into store (a collector.ColumnStore) and returned as store.result() (DataFrame or RunFile).
+        '''
+        plan, buffer, buffered, recorded = self.compile()
+        data = defaultdict(lambda: defaultdict(dict))
+        if store is None:
+            columns = [(data[full_id][attr], get) for full_id, attr, get in recorded]
+        else:
+            columns = [((full_id, attr), get) for full_id, attr, get in recorded]
+
+        for time in tqdm(range(0, until, self.step_size), disable=not progress):
+            for node, live, shifted in plan:
+                for setter, slot in shifted:
+                    val = buffer[slot]
+                    if val is not SENTINEL:
+                        setter(val)
+                for setter, getter in live:
+                    val = getter()
+                    if val is not SENTINEL:
+                        setter(val)
+                node.step(time)
+
+            for slot, getter in buffered:
+                buffer[slot] = getter()
+            if store is None:
+                for column, get in columns:
+                    val = get()
+                    if val is not SENTINEL:
+                        column[time] = val
+            else:
+                step = store.index(time)
+                for key, get in columns:
+                    val = get()
+                    if val is not SENTINEL:
+                        store.set(key, step, val)
+
+        if store is not None:
+            return store.result()
+        # the collector only knows attributes it received at least once
+        for full_id, attr, _ in recorded:
+            if not data[full_id][attr]:
+                del data[full_id][attr]
+        return data
+
+#-------------------------Scenario-------------------------------
+
+def build_world(params, pv_results, heat_load_data, start, until, step_size):
+    '''
+    Same entities and connections as main_sim.run_DES (without the csv writer). The ids of the nodes
+    match the mosaik full ids, so the result can be post processed the same way.
+    '''
+    pv_mod = CSVNode('CSV-0.Data_0', pv_results, start, step_size, until)
+    heat_load = CSVNode('CSV-1.HEATLOAD_0', heat_load_data, start, step_size, until)
+    return add_scenario(NativeWorld(step_size), params, pv_mod, heat_load)
+
+def scenario_models(params, step_size):
+    '''Nodes of the models of one configuration: heat pump, the three tanks, controller, CHP and boiler.'''
+    params_hwt = params['tank']
+    init_vals = params['init_vals_tank']
+    return [
+        HeatPumpNode('HeatPumpSim-0.HeatPump_0', params['hp'], step_size),
+        TankNode('HotWaterTankSim-0.HotWaterTank_0', params_hwt, init_vals['init_vals_hwt0'], step_size),
+        TankNode('HotWaterTankSim-1.HotWaterTank_0', params_hwt, init_vals['init_vals_hwt1'], step_size),
+        TankNode('HotWaterTankSim-2.HotWaterTank_0', params_hwt, init_vals['init_vals_hwt2'], step_size),
+        ControllerNode('ControllerSim-0.Controller_0', params['ctrl'], step_size),
+        TransformerNode('Chpsim_v2-0.%s0' % params['params_chp'].get('eid_prefix'), CHP(params['params_chp']), step_size),
+        TransformerNode('Boilersim_v2-0.%s0' % params['params_boiler'].get('eid_prefix'),
+                        Gboiler(params['params_boiler']), step_size),
+    ]
+
+def add_scenario(world, params, pv_mod, heat_load):
+    '''
+    Adds the models of one configuration to the world and connects them to the given input nodes
+    (pv and heat load), which may be shared with other worlds, see batch_sim.py.
+    '''
+    world.add(pv_mod)
+    world.add(heat_load)
+    heatpump, hwts0, hwts1, hwts2, ctrls, chp, boiler = [world.add(node) for node in scenario_models(params, world.step_size)]
+
+    world.connect(heat_load, ctrls, 'T_amb', ('Heat Demand [kW]', 'heat_demand'), ('Domestic hot water (kW)' ,  'dhw_demand'), ('Space heating (kW)', 'sh_demand')
+                  , ('Timestamp', 'timestamp'), ('offset_Electricy demand[kW]', 'pred_el_demand'))
+    world.connect(pv_mod, ctrls, ('Power[w]', 'pv_gen'))
+
+    """__________________________________________ hwts ___________________________________________________________________"""
+
+    world.connect(hwts0, ctrls, ('heat_out.T', 'tank_connections.tank0.heat_out_T'),
+              ('hp_out.T', 'hp_out_T'),('sensor_00.T', 'tank_temps.tank0.sensor_0'), ('heat_out2.T','tank_connections.tank0.heat_out2_T'),
+              ('sensor_01.T', 'tank_temps.tank0.sensor_1'),('heat_out2.F', 'tank_connections.tank0.heat_out2_F'),
+              ('sensor_02.T', 'tank_temps.tank0.sensor_2'),time_shifted=True,
+              initial_data={'heat_out.T':0, 'hp_out.T':0, 'sensor_00.T':0,
+                            'heat_out2.T' : 0, 'heat_out2.F':0})
+
+    world.connect(ctrls, hwts0,
+              ('tank_connections.tank0.heat_out_F', 'heat_out.F'),
+              ('tank_connections.tank0.heat_out_T', 'heat_out.T'),
+              ('tank_connections.tank0.heat_in_F', 'heat_in.F'),
+              ('tank_connections.tank0.heat_in_T', 'heat_in.T'),
+              ('tank_connections.tank0.heat_out2_F', 'heat_out2.F'),
+              ('hwt0_hr_1', 'hr_1.P_th_set'))
+
+    world.connect(hwts1, ctrls,
+              ('heat_out.T', 'tank_connections.tank1.heat_out_T'),('T_mean', 'T_mean_hwt'),
+              ('mass', 'hwt_mass'),('sensor_02.T', 'tank_temps.tank1.sensor_2'),
+              ('hp_out.T', 'tank_connections.tank1.hp_out_T'),('heat_out2.T','tank_connections.tank1.heat_out2_T'),
+              ('heat_out2.F', 'tank_connections.tank1.heat_out2_F'),('sensor_01.T', 'tank_temps.tank1.sensor_1'),
+              time_shifted=True,
+              initial_data={'heat_out.T':0, 'heat_out2.T':0,'T_mean':0, 'mass':0,
+                            'sensor_02.T':0, 'hp_out.T':0})
+
+    world.connect(ctrls, hwts1,
+              ('tank_connections.tank1.hp_out_F', 'hp_out.F'),('tank_connections.tank1.heat_out_T', 'heat_out.T'),
+              ('tank_connections.tank1.heat_out_F', 'heat_out.F'),('tank_connections.tank1.heat_out2_F', 'heat_out2.F'),
+              ('tank_connections.tank1.hp_out_T','hp_out.T'), ('hwt1_hr_1', 'hr_1.P_th_set'),
+              ('tank_connections.tank1.heat_in_F', 'heat_in.F'), ('tank_connections.tank1.heat_in_T', 'heat_in.T'))
+
+    world.connect(ctrls, hwts2,
+              ('tank_connections.tank2.hp_out_T', 'hp_out.T'),('tank_connections.tank2.hp_out_F', 'hp_out.F'),
+              ('tank_connections.tank2.heat_out_F', 'heat_out.F'),('tank_connections.tank2.heat_out2_F', 'heat_out2.F'),
+              ('T_amb', 'T_env'), ('hwt2_hr_1', 'hr_1.P_th_set'),('tank_connections.tank2.heat_in_F', 'heat_in.F'),
+              ('tank_connections.tank2.heat_in_T', 'heat_in.T'),
+              time_shifted=True,
+              initial_data={'tank_connections.tank2.heat_out_F': 0,
+                            'T_amb': 0,
+                            'tank_connections.tank2.hp_out_T':0,
+                            'tank_connections.tank2.hp_out_F':0,
+                            'tank_connections.tank2.heat_out2_F':0,
+                            'hwt2_hr_1':0,
+                            'tank_connections.tank2.heat_in_T':0,
+                            'tank_connections.tank2.heat_in_F':0
+                            })
+
+    world.connect(hwts2, ctrls, ('heat_out.T', 'tank_connections.tank2.heat_out_T'),
+              ('heat_out.F', 'tank_connections.tank2.heat_out_F'),
+              ('sensor_00.T', 'tank_temps.tank2.sensor_0'),('sensor_02.T', 'tank_temps.tank2.sensor_2'),
+              ('heat_out2.T','tank_connections.tank2.heat_out2_T'),('heat_out2.F', 'tank_connections.tank2.heat_out2_F'),
+              ('sensor_01.T', 'tank_temps.tank2.sensor_1'))
+
+    """__________________________________________Boiler_______________________________________________________________________"""
+
+    world.connect(hwts2, boiler, ('sensor_00.T', 'temp_in'))
+    world.connect(boiler, hwts2, ('temp_out', 'boiler_in.T'), ('mdot','boiler_in.F'), ('mdot_neg', 'boiler_out.F'),
+                    time_shifted=True, initial_data={'temp_out': 20, 'mdot':0, 'mdot_neg':0})
+    world.connect(boiler, ctrls, ('P_th', 'generators.boiler_supply'), ('uptime','boiler_uptime'))
+    world.connect(ctrls, boiler, ('generators.boiler_demand', 'Q_demand'), ('generators.boiler_status', 'status'),
+                time_shifted=True,
+                initial_data={'generators.boiler_demand': 0})
+
+    """__________________________________________CHP__________________________________"""
+
+    world.connect(hwts2, chp, ('sensor_00.T', 'temp_in'))
+    world.connect(chp, hwts2, ('temp_out', 'chp_in.T'), ('mdot','chp_in.F'), ('mdot_neg', 'chp_out.F'),
+                    time_shifted=True, initial_data={'temp_out': 20, 'mdot':0, 'mdot_neg':0})
+    world.connect(chp, ctrls, ('P_th', 'generators.chp_supply'), ('uptime', 'chp_uptime'), ('P_el', 'chp_el'))
+    world.connect(ctrls, chp, ('generators.chp_demand', 'Q_demand'), ('generators.chp_status' , 'status'),
+                time_shifted=True,
+                initial_data={'generators.chp_demand': 90000})
+
+    """__________________________________________ heat pump ___________________________________________________________________"""
+
+    world.connect(heatpump, ctrls, ('Q_Supplied', 'generators.hp_supply'), ('on_fraction', 'hp_on_fraction'),
+                ('cond_m', 'hp_cond_m'))
+    world.connect(ctrls, heatpump, ('generators.hp_demand', 'Q_Demand'),
+                'T_amb', 'heat_source_T', time_shifted=True,
+                initial_data={'generators.hp_demand': 0, 'T_amb': 5, 'heat_source_T': 5})
+    world.connect(hwts0, heatpump, ('hp_out.T', 'cond_in_T'),
+                time_shifted=True, initial_data={'hp_out.T':0})
+    world.connect(heatpump, hwts0, ('cond_m_neg', 'hp_out.F'))
+    world.connect(heatpump, hwts1, ('cons_T', 'hp_in.T'), ('cond_m', 'hp_in.F'))
+    world.connect(heatpump, ctrls, ('cond_m_neg', 'tank_connections.tank0.hp_out_F'), ('cond_m', 'tank_connections.tank1.hp_in_F'),)
+
+    # same entities as connect_all_attrs(..., col) in run_DES
+    world.collect(boiler, chp, ctrls, heatpump, heat_load)
+
+    return world
+
+
+class WorldTemplate():
+    '''
+    The scenario of add_scenario compiled once for a long lived process (e.g. a sweep worker), instead of building
+    every world from scratch:
+    * the connections (with time shift and initial data), the evaluation order and the collected nodes are captured
+      by position of the nodes from the first world,
+    * the input nodes are built once: the heat load and the pv node of every set of pv parameters.
+
+    instantiate(params) only creates the models of the configuration (they keep state, so every run needs new ones)
+    and wires them into a new NativeWorld with the captured topology; the results are the same as with build_world::
+
+        template = WorldTemplate(HEAT_LOAD_DATA, START, END, STEP_SIZE, pvlib_model.profile)
+        data = template.instantiate(params).run(END)
+    '''
+    def __init__(self, heat_load_data, start, until, step_size, pv_profile):
+        self.start = start
+        self.until = until
+        self.step_size = step_size
+        self.pv_profile = pv_profile # params['pv'] : pv profile (DataFrame/Series, see CSVNode)
+        self.heat_load = CSVNode('CSV-1.HEATLOAD_0', heat_load_data, start, step_size, until)
+        self.pv_nodes = {} # json of the pv params : CSVNode
+        self.topology = None # (connections, order, collected) with the positions of the nodes
+
+    def pv_node(self, params_pv):
+        key = json.dumps(params_pv, sort_keys=True)
+        if key not in self.pv_nodes:
+            self.pv_nodes[key] = CSVNode('CSV-0.Data_0', self.pv_profile(params_pv), self.start, self.step_size, self.until)
+        return self.pv_nodes[key]
+
+    @staticmethod
+    def capture(world):
+        '''Topology of world, with the positions of the nodes in world.nodes instead of the nodes.'''
+        position = {node : i for i, node in enumerate(world.nodes)}
+        connections = [(position[src], position[dest], attrs, time_shifted, initial_data)
+                       for src, dest, attrs, time_shifted, initial_data in world.connections]
+        order = [position[node] for node in world.evaluation_order()]
+        collected = [position[node] for node in world.collected]
+        return connections, order, collected
+
+    def instantiate(self, params):
+        '''New world of the configuration params (ready to run until self.until).'''
+        inputs = [self.pv_node(params['pv']), self.heat_load]
+        if self.topology is None:
+            world = add_scenario(NativeWorld(self.step_size), params, *inputs)
+            self.topology = self.capture(world)
+            return world
+
+        connections, order, collected = self.topology
+        world = NativeWorld(self.step_size)
+        nodes = world.nodes = inputs + scenario_models(params, self.step_size)
+        world.connections = [(nodes[src], nodes[dest], attrs, time_shifted, initial_data)
+                             for src, dest, attrs, time_shifted, initial_data in connections]
+        world.order = [nodes[i] for i in order]
+        world.collected = [nodes[i] for i in collected]
+        return world
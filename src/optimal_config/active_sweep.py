@@ -0,0 +1,211 @@
+'''
+Active-learning sweep over the configurations of all_configurations.csv.
+
+Instead of simulating a fixed sample plan (run_opti.py), the sweep is run in rounds:
+1. an initial space-filling batch is selected by greedy maximin (as in greedy_maximin.ipynb) and simulated,
+2. Gaussian process surrogates of costs, co2 and aux_heater (as in surrogate.ipynb) are fitted on the results,
+3. the next batch is the configurations with the best acquisition value: expected improvement ('ei') of the
+   objective (sum of the KPIs scaled by their standard deviation and weighted with WEIGHTS) or its
+   predicted uncertainty ('uncertainty'),
+until BUDGET simulations are spent. The simulations run in the process pool of run_opti and every result is
+appended to RESULTS_LOG (see src/utils/sweep_log.py), so the sweep can be resumed. At the end, the predicted
+KPIs of all configurations (simulated ones with their results) are written to PREDICTIONS.
+
+    python src/optimal_config/active_sweep.py --budget 120 --initial 40 --batch 16 --criterion ei [--resume]
+
+Requires scikit-learn (pip install .[opti]).
+'''
+from pathlib import Path
+import sys
+import os
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+from src.utils.sweep_log import SweepLog
+
+CANDIDATES = os.path.join(os.path.dirname(__file__), 'all_configurations.csv')
+RESULTS_LOG = os.path.join(os.path.dirname(__file__), '../../data/outputs/active_sweep_results.jsonl')
+PREDICTIONS = os.path.join(os.path.dirname(__file__), '../../data/outputs/active_sweep_predictions.csv')
+
+PARAMS = ['hp', 'chp', 'boiler', 'pv', 'supply_config', 'hr_mode', 'T_dhw_sp', 'hwt_volume']
+CATEGORICAL = ['hp', 'supply_config', 'hr_mode']
+NUMERIC = ['chp', 'boiler', 'pv', 'T_dhw_sp', 'hwt_volume']
+KPIS = ['costs', 'co2', 'aux_heater']
+WEIGHTS = {'costs' : 1.0, 'co2' : 1.0, 'aux_heater' : 1.0} # of the KPIs (scaled by their standard deviation) in the objective
+
+BUDGET = 120 # simulations in total
+INITIAL = 40 # simulations of the maximin batch
+BATCH = 16 # simulations per round
+CRITERION = 'ei' # 'ei' (expected improvement) or 'uncertainty'
+
+def load_candidates(path=CANDIDATES):
+    '''Distinct configurations (PARAMS columns) of path.'''
+    return pd.read_csv(path)[PARAMS].drop_duplicates().reset_index(drop=True)
+
+def encode(candidates):
+    '''Levels of every parameter, scaled to [0, 1] (as in greedy_maximin.ipynb).'''
+    encodings = np.zeros((len(candidates), len(PARAMS)))
+    for j, param in enumerate(PARAMS):
+        levels = sorted(candidates[param].unique())
+        if len(levels) > 1:
+            mapping = {level : i / (len(levels) - 1) for i, level in enumerate(levels)}
+            encodings[:, j] = candidates[param].map(mapping).to_numpy()
+    return encodings
+
+def maximin(encodings, n, selected=(), seed=42):
+    '''
+    Greedy maximin: indices of n further rows of encodings, each with the largest minimum distance to the selected
+    rows (the first one is random if nothing is selected).
+    '''
+    selected = list(selected)
+    min_dist = np.full(len(encodings), np.inf)
+    for i in selected:
+        min_dist = np.minimum(min_dist, np.linalg.norm(encodings - encodings[i], axis=1))
+    picked = []
+    for _ in range(min(n, len(encodings) - len(selected))):
+        if not selected and not picked:
+            i = int(np.random.default_rng(seed).integers(0, len(encodings)))
+        else:
+            i = int(np.argmax(min_dist))
+        picked.append(i)
+        min_dist = np.minimum(min_dist, np.linalg.norm(encodings - encodings[i], axis=1))
+        min_dist[i] = -np.inf
+    return picked
+
+
+class Surrogate():
+    '''Gaussian process regression of every KPI on the configuration (preprocessing as in surrogate.ipynb).'''
+    def __init__(self, kpis=KPIS, n_restarts=5):
+        self.kpis = kpis
+        self.n_restarts = n_restarts
+        self.models = {}
+
+    def fit(self, X, y):
+        from sklearn.compose import ColumnTransformer
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        from sklearn.gaussian_process.kernels import Matern, WhiteKernel, ConstantKernel as C
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        for kpi in self.kpis:
+            preprocessor = ColumnTransformer([
+                ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL),
+                ('num', StandardScaler(), NUMERIC)
+            ])
+            kernel = C(1.0, (1e-3, 1e4)) * Matern(length_scale=1.0, nu=1.5) + WhiteKernel(noise_level=1)
+            gpr = GaussianProcessRegressor(kernel=kernel, n_restarts_optimizer=self.n_restarts, normalize_y=True, random_state=0)
+            self.models[kpi] = Pipeline([("preprocess", preprocessor), ("gpr", gpr)]).fit(X[PARAMS], y[kpi])
+        return self
+
+    def predict(self, X):
+        '''Predicted mean and standard deviation of the KPIs (two frames).'''
+        mean, std = {}, {}
+        for kpi, model in self.models.items():
+            features = model.named_steps['preprocess'].transform(X[PARAMS])
+            mean[kpi], std[kpi] = model.named_steps['gpr'].predict(features, return_std=True)
+        return pd.DataFrame(mean, index=X.index), pd.DataFrame(std, index=X.index)
+
+def objective(values, scale, weights=WEIGHTS):
+    '''Weighted sum of the KPIs (frame) divided by scale (standard deviation of the KPIs), lower is better.'''
+    return sum(weights[kpi] * values[kpi] / scale[kpi] for kpi in weights)
+
+def expected_improvement(mean, std, best):
+    '''Expected improvement of a minimization below best for a normal prediction.'''
+    from scipy.stats import norm
+    std = np.maximum(std, 1e-12)
+    z = (best - mean) / std
+    return (best - mean) * norm.cdf(z) + std * norm.pdf(z)
+
+def acquisition(mean, std, y, criterion=CRITERION, weights=WEIGHTS):
+    '''
+    Acquisition value of the predictions (mean, std frames, see Surrogate.predict), given the simulated KPIs y.
+    The KPIs are assumed independent, the objective of y gives the best value so far.
+    '''
+    scale = y[list(weights)].std().replace(0, 1).fillna(1)
+    mu = objective(mean, scale, weights)
+    sigma = np.sqrt(sum((weights[kpi] * std[kpi] / scale[kpi])**2 for kpi in weights))
+    if criterion == 'uncertainty':
+        return sigma.to_numpy()
+    if criterion == 'ei':
+        return expected_improvement(mu.to_numpy(), sigma.to_numpy(), objective(y, scale, weights).min())
+    raise ValueError(f"Unknown acquisition criterion '{criterion}', use 'ei' or 'uncertainty'")
+
+def select(scores, n, evaluated=()):
+    '''Indices of the n best scores, without the evaluated ones.'''
+    scores = np.array(scores, dtype=float)
+    scores[list(evaluated)] = -np.inf
+    order = np.argsort(-scores, kind='stable')
+    return [int(i) for i in order[:min(n, len(scores) - len(set(evaluated)))]]
+
+def run(budget=BUDGET, initial=INITIAL, batch=BATCH, criterion=CRITERION, resume=False, candidates_file=CANDIDATES):
+    import run_opti
+
+    candidates = load_candidates(candidates_file)
+    encodings = encode(candidates)
+    rows = [row.to_dict() for _, row in candidates.iterrows()]
+    params = [run_opti.configure(row) for row in rows]
+    index = {run_opti.config_hash(config_params) : i for i, config_params in enumerate(params)}
+
+    log = SweepLog(RESULTS_LOG, resume=resume)
+    evaluated = {index[entry['config']] for entry in log.entries() if entry['config'] in index}
+
+    def results():
+        frame = log.frame()
+        if frame.empty:
+            return candidates.iloc[[]], pd.DataFrame(columns=KPIS)
+        frame = frame[(frame['status'] == 'ok') & frame['config'].isin(index)].dropna(subset=KPIS)
+        return candidates.loc[frame['config'].map(index)], frame[KPIS].set_axis(frame['config'].map(index))
+
+    scenario = run_opti.load_scenario()
+    one_per_pv = [(params[i], rows[i]) for i in candidates.drop_duplicates('pv').index]
+    store = run_opti.publish_inputs(one_per_pv, scenario) if run_opti.SHARED_INPUTS else None
+    with run_opti.pool(store) as executor:
+        while len(evaluated) < min(budget, len(candidates)):
+            n = min(batch, budget - len(evaluated))
+            X, y = results()
+            if len(evaluated) < initial:
+                picked = maximin(encodings, min(n, initial - len(evaluated)), evaluated)
+                method = 'maximin'
+            elif len(y) < 2: # too few successful simulations for the surrogates
+                picked = maximin(encodings, n, evaluated)
+                method = 'maximin'
+            else:
+                mean, std = Surrogate().fit(X, y).predict(candidates)
+                picked = select(acquisition(mean, std, y, criterion), n, evaluated)
+                method = criterion
+            logging.info(f"Active sweep: {len(picked)} configurations by {method}, {len(evaluated)} simulated")
+            print(f"Active sweep: simulating {len(picked)} configurations ({method}), {len(evaluated)}/{budget} simulated", flush=True)
+            run_opti.simulate(executor, [(params[i], rows[i]) for i in picked], log)
+            evaluated.update(picked)
+    if store is not None:
+        store.close()
+
+    X, y = results()
+    predictions = candidates.copy()
+    if len(y) >= 2:
+        mean, std = Surrogate().fit(X, y).predict(candidates)
+        for kpi in KPIS:
+            predictions[kpi] = mean[kpi]
+            predictions[kpi + '_std'] = std[kpi]
+    predictions['simulated'] = False
+    predictions.loc[y.index, KPIS] = y.to_numpy()
+    predictions.loc[y.index, [kpi + '_std' for kpi in KPIS if kpi + '_std' in predictions]] = 0.0
+    predictions.loc[y.index, 'simulated'] = True
+    predictions.to_csv(PREDICTIONS)
+    return predictions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Active-learning sweep over the configurations of all_configurations.csv.')
+    parser.add_argument('--budget', type=int, default=BUDGET, help='simulations in total')
+    parser.add_argument('--initial', type=int, default=INITIAL, help='simulations of the initial maximin batch')
+    parser.add_argument('--batch', type=int, default=BATCH, help='simulations per round')
+    parser.add_argument('--criterion', choices=['ei', 'uncertainty'], default=CRITERION, help='acquisition criterion')
+    parser.add_argument('--resume', action='store_true', help='continue the sweep in RESULTS_LOG')
+    args = parser.parse_args()
+    run(args.budget, args.initial, args.batch, args.criterion, args.resume)
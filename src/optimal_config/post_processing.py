@@ -5,19 +5,26 @@ import pickle
 
 def postprocessing(sim_data, input_params, scenario):
     
-    timestamps = list(sim_data['CSV-1.HEATLOAD_0']['Timestamp'].values())
-    df = pd.DataFrame(index=pd.to_datetime(timestamps))
-    df.index = pd.to_datetime(df.index)
-    new_cols = {}
-
-    for sim, headers in sim_data.items():
-        for h, v in headers.items():
-            vals = list(v.values())
-            if all(isinstance(x, (int, float)) for x in vals):
-                col_name = f"{sim}-{h}"
-                new_cols[col_name] = vals
-
-    df = pd.concat([df, pd.DataFrame(new_cols, index=df.index)], axis=1)
+    if hasattr(sim_data, 'frame'):
+        # RunFile of a spilled run (run_DES(spill=...)), only the numeric columns are loaded
+        df = sim_data.frame(numeric=True)
+    elif isinstance(sim_data, pd.DataFrame):
+        # columnar collector (run_DES(columnar=True)), numeric columns are already typed
+        df = sim_data[[col for col, dtype in sim_data.dtypes.items() if pd.api.types.is_numeric_dtype(dtype)]].copy()
+    else:
+        timestamps = list(sim_data['CSV-1.HEATLOAD_0']['Timestamp'].values())
+        df = pd.DataFrame(index=pd.to_datetime(timestamps))
+        df.index = pd.to_datetime(df.index)
+        new_cols = {}
+
+        for sim, headers in sim_data.items():
+            for h, v in headers.items():
+                vals = list(v.values())
+                if all(isinstance(x, (int, float)) for x in vals):
+                    col_name = f"{sim}-{h}"
+                    new_cols[col_name] = vals
+
+        df = pd.concat([df, pd.DataFrame(new_cols, index=df.index)], axis=1)
         
     # calculate costs
     """here I have to account for all investment and operational costs
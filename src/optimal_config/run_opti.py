@@ -10,16 +10,35 @@ import pandas as pd
 import json
 import pickle
 from post_processing import postprocessing
-from src.main_sim import run_DES
+from src.main_sim import run_DES, run_DES_batch, native_template, hash_encrypt, HEAT_LOAD_DATA, START, END, ABORT
+from src.models import cached_csv, hp_lookup, pvlib_model
+from src.models.collector import AbortedRun
+from src.utils.input_store import InputStore
+from src.utils.result_cache import ResultCache, config_key
+from src.utils.sweep_log import SweepLog
+import argparse
 import itertools
 import copy
 import logging
+import time
 import traceback
 from tqdm import tqdm
 import concurrent.futures
+import multiprocessing
 import numpy as np
 
 
+ENGINE = 'native' # engine of run_DES, 'mosaik' or 'native' (same results, without the mosaik overhead)
+BATCH_SIZE = 1 # configurations simulated in lockstep per worker (run_DES_batch), needs ~75 MB of memory per configuration
+RUNS_DIR = None # directory for the time series of every configuration (run files, see src/utils/run_file.py), None keeps them in memory only
+SHARED_INPUTS = True # publish the scenario and the pv profiles once for all workers (see src/utils/input_store.py)
+INPUTS_DIR = os.path.join(os.path.dirname(__file__), '../../data/cache/sweep') # every sweep publishes its inputs in a new directory in it
+RESULT_CACHE = True # reuse the results of configurations simulated before with the same inputs and code (see src/utils/result_cache.py)
+RESULTS_LOG = os.path.join(os.path.dirname(__file__), '../../data/outputs/optimal_config_results.jsonl') # every finished configuration is appended (see src/utils/sweep_log.py)
+KPIS = ("costs", "co2", "aux_heater")
+ABORT_CRITERIA = ABORT # stop clearly infeasible configurations early and record them as 'infeasible' (see main_sim.ABORT), None runs all to the end
+MAX_TASKS_PER_CHILD = None # tasks of a worker before it is replaced by a new one (e.g. against growing memory), None keeps the workers
+
 df_combinations = pd.read_csv(os.path.join(os.path.dirname(__file__), '../../data/inputs/sample_plan_300.csv'))
 
 current_dir = os.getcwd()
@@ -28,8 +47,8 @@ scenario_path = os.path.join(current_dir,'data/inputs/scenario.pkl')
 
 with open(input_params_path, 'r') as file:
     input_params = json.load(file)
-with open(scenario_path, "rb") as f:
-    scenario = pickle.load(f)
+scenario = None # loaded in main, the workers get it in init_worker
+worker = {'init_time' : None, 'tasks' : 0} # initialization time and number of tasks of this worker process
 
 # ------------------------------------------------------------------------------------------------------------------------------------------------------------
 logfile = Path("data/logs/run_opti.log")
@@ -46,66 +65,288 @@ logging.basicConfig(
 
 logging.info("Starting simulation...")
 
-# delete old pvlib output files (containing PVlib_output in the name)
-output_dir = os.path.join(os.path.dirname(__file__), '../../data/outputs/pv')
-for filename in os.listdir(output_dir):
-    if "PVlib_output" in filename:
-        os.remove(os.path.join(output_dir, filename))
+def publish_inputs(batch_params, scenario):
+    '''
+    Loads the inputs of the sweep once in the parent process: the heat load cache is built, the pv reference
+    profiles are computed and published with the scenario as memory mapped arrays, which the workers attach read-only.
+    '''
+    cached_csv.load_table(HEAT_LOAD_DATA)
+    profiles = pvlib_model.reference_profiles([config_params['pv'] for config_params, _ in batch_params])
+    return InputStore.create(INPUTS_DIR, {'scenario' : scenario, 'pv' : profiles})
+
+def warm_worker(shared=True):
+    '''
+    Loads the static inputs of run_DES once per worker instead of in its first task: the heat load table, the lookup
+    data of the heat pump, without shared inputs the pv reference profile and, for the native engine, the world
+    template (main_sim.native_template), from which every task only instantiates its models.
+    '''
+    cached_csv.load_table(HEAT_LOAD_DATA)
+    hp_lookup.preload() # parsed once for the life of the worker
+    if not shared:
+        pvlib_model.reference_profile(input_params['pv'])
+    if ENGINE == 'native' and BATCH_SIZE == 1:
+        native_template()
+
+def init_worker(inputs_dir):
+    global scenario
+    start = time.perf_counter()
+    if inputs_dir is None:
+        with open(scenario_path, "rb") as f:
+            scenario = pickle.load(f)
+    else:
+        store = InputStore(inputs_dir)
+        scenario = store['scenario']
+        pvlib_model.register_profiles(store['pv'])
+    warm_worker(shared=inputs_dir is not None)
+    worker['init_time'] = time.perf_counter() - start
+
+def result_key(config_params):
+    '''Key of the result cache: params, heat load, weather and scenario files, code version and simulated period.'''
+    inputs = [HEAT_LOAD_DATA, pvlib_model.weather_file(config_params['pv']), scenario_path]
+    return config_key(config_params, inputs, extra={'until' : END})
+
+def cached_result(config_params, des_config_i):
+    '''(key, result) of a configuration, result is None if it was not simulated before (key is None without cache).'''
+    if not RESULT_CACHE:
+        return None, None
+    key = result_key(config_params)
+    entry = ResultCache().get(key)
+    if entry is None:
+        return key, None
+    logging.info(f"Result taken from the cache: {des_config_i}")
+    result = {**des_config_i, **entry['kpis']}
+    if entry['run'] is not None:
+        result["run"] = entry['run']
+    return key, result
+
+def store_result(key, config_params, result, run_id=None):
+    if key is not None:
+        ResultCache().put(key, {kpi : result[kpi] for kpi in KPIS}, run=run_id, params=config_params)
+
+def config_hash(config_params):
+    '''Hash of the params as given to the worker (run_DES adds entries).'''
+    return hash_encrypt(config_params)
+
+def finished(config, result, status, start, sim_time=None):
+    '''
+    Result with the entries of the results log: config hash, status ('ok', 'error', 'infeasible'), runtime and time of
+    run_DES (sim_time, None if not simulated) in seconds, the rest of the runtime (overhead) and the worker (pid and
+    number of the task in it).
+    '''
+    runtime = time.perf_counter() - start
+    return {**result, "config": config, "status": status, "runtime": runtime, "sim_time": sim_time,
+            "overhead": runtime - sim_time if sim_time is not None else None,
+            "worker": os.getpid(), "worker_task": worker['tasks'], "worker_init": worker['init_time']}
+
+def failed(des_config_i):
+    return {**des_config_i, **{kpi : np.nan for kpi in KPIS}}
+
+def infeasible(des_config_i, sim_data):
+    '''Result of a configuration stopped by an abort criterion (sim_data is the AbortedRun), without KPIs.'''
+    logging.info(f"Simulation aborted ({sim_data.criterion}): {des_config_i}")
+    aborted_at = pd.Timestamp(START) + pd.Timedelta(seconds=sim_data.time)
+    return {**failed(des_config_i), "aborted": sim_data.criterion, "aborted_at": str(aborted_at), "abort_value": sim_data.value}
 
 def run_instance(args):
     config_params, des_config_i = args
+    start = time.perf_counter()
+    worker['tasks'] += 1
+    config = config_hash(config_params)
+    sim_time = None
     try:
+        key, result = cached_result(config_params, des_config_i)
+        if result is not None:
+            return finished(config, result, "ok", start)
         print(f"[Worker] Starting simulation for {des_config_i}", flush=True)
-        sim_data = run_DES(config_params)
+        sim_start = time.perf_counter()
+        if RUNS_DIR is not None:
+            run_id = hash_encrypt(des_config_i)
+            sim_data = run_DES(config_params, engine=ENGINE, spill=os.path.join(RUNS_DIR, run_id), abort=ABORT_CRITERIA)
+        else:
+            sim_data = run_DES(config_params, engine=ENGINE, columnar=True, abort=ABORT_CRITERIA)
+        sim_time = time.perf_counter() - sim_start
+        if isinstance(sim_data, AbortedRun):
+            return finished(config, infeasible(des_config_i, sim_data), "infeasible", start, sim_time)
         cost, co2, aux_heat = postprocessing(sim_data, config_params, scenario)
         print(f"[Worker] Finished simulation for {des_config_i}", flush=True)
         logging.info(f"Simulation finished successfully: {des_config_i}")
-        return {**des_config_i, "costs": cost, "co2": co2, "aux_heater": aux_heat}
+        result = {**des_config_i, "costs": cost, "co2": co2, "aux_heater": aux_heat}
+        if RUNS_DIR is not None:
+            result["run"] = run_id # time series in RunFile(os.path.join(RUNS_DIR, run_id))
+        store_result(key, config_params, result, run_id if RUNS_DIR is not None else None)
+        return finished(config, result, "ok", start, sim_time)
     except Exception as e:
         print(f"[Worker] ERROR for {des_config_i}: {e}", flush=True)
         traceback.print_exc()
         logging.exception(f"Simulation for {des_config_i} crashed: {e}")
-        return {**des_config_i, "costs": np.nan, "co2": np.nan, "aux_heater": np.nan}
+        return finished(config, failed(des_config_i), "error", start, sim_time)
 
-def main():
-    # load scenario once
+def run_batch(batch):
+    worker['tasks'] += 1
+    results = []
+    keys = []
+    configs = []
+    remaining = []
+    for config_params, des_config_i in batch:
+        start = time.perf_counter()
+        config = config_hash(config_params)
+        key, result = cached_result(config_params, des_config_i)
+        if result is not None:
+            results.append(finished(config, result, "ok", start))
+        else:
+            keys.append(key)
+            configs.append(config)
+            remaining.append((config_params, des_config_i))
+    if not remaining:
+        return results
+    params_list = [config_params for config_params, _ in remaining]
+    print(f"[Worker] Starting batch of {len(remaining)} simulations", flush=True)
+    start = time.perf_counter()
+    sims, errors = run_DES_batch(params_list, progress=False, abort=ABORT_CRITERIA)
+    sim_time = (time.perf_counter() - start) / len(remaining) # lockstep, the batch time is shared
+    for i, (sim_data, (config_params, des_config_i)) in enumerate(zip(sims, remaining)):
+        start = time.perf_counter() - sim_time
+        try:
+            if sim_data is None:
+                raise errors[i]
+            if isinstance(sim_data, AbortedRun):
+                results.append(finished(configs[i], infeasible(des_config_i, sim_data), "infeasible", start, sim_time))
+                continue
+            cost, co2, aux_heat = postprocessing(sim_data, config_params, scenario)
+            logging.info(f"Simulation finished successfully: {des_config_i}")
+            result = {**des_config_i, "costs": cost, "co2": co2, "aux_heater": aux_heat}
+            store_result(keys[i], config_params, result)
+            results.append(finished(configs[i], result, "ok", start, sim_time))
+        except Exception as e:
+            print(f"[Worker] ERROR for {des_config_i}: {e}", flush=True)
+            logging.exception(f"Simulation for {des_config_i} crashed: {e}")
+            results.append(finished(configs[i], failed(des_config_i), "error", start, sim_time))
+    return results
+
+def configure(des_config_i):
+    '''Params of a configuration (row of the sample plan).'''
+    config_params = copy.deepcopy(input_params)
+    config_params['hp']['hp_model'] = des_config_i['hp']
+    config_params['params_chp']['heat_out'] = [0, des_config_i['chp']]
+    config_params['params_boiler']['heat_out'] = [0, des_config_i['boiler']]
+    config_params['ctrl']['supply_config'] = des_config_i['supply_config']
+    config_params['tank']['heating_rods']['hr_1']['mode'] = des_config_i['hr_mode']
+    config_params['ctrl']['T_dhw_sp'] = des_config_i['T_dhw_sp']
+    config_params['tank']['volume'] = des_config_i['hwt_volume']
+    config_params['pv']['nom_power'] = des_config_i['pv']
+    return config_params
+
+def load_scenario():
+    global scenario
     with open(scenario_path, "rb") as f:
-        global scenario
         scenario = pickle.load(f)
+    return scenario
 
-    results = []
-    batch_size = os.cpu_count()
+class RecyclingPool(concurrent.futures.Executor):
+    '''
+    Executor on a multiprocessing.Pool, which replaces a worker after max_tasks_per_child tasks (the option of the
+    ProcessPoolExecutor needs Python >= 3.11 and hangs in 3.11 if more tasks than workers are submitted).
+    '''
+    def __init__(self, max_workers, initializer, initargs, max_tasks_per_child):
+        self._pool = multiprocessing.Pool(max_workers, initializer, initargs, maxtasksperchild=max_tasks_per_child)
 
-    batch_params = []
-    for _, des_config_i in df_combinations.iterrows():
-        config_params = copy.deepcopy(input_params)
-        config_params['hp']['hp_model'] = des_config_i['hp']
-        config_params['params_chp']['heat_out'] = [0, des_config_i['chp']]
-        config_params['params_boiler']['heat_out'] = [0, des_config_i['boiler']]
-        config_params['ctrl']['supply_config'] = des_config_i['supply_config']
-        config_params['tank']['heating_rods']['hr_1']['mode'] = des_config_i['hr_mode']
-        config_params['ctrl']['T_dhw_sp'] = des_config_i['T_dhw_sp']
-        config_params['tank']['volume'] = des_config_i['hwt_volume']
-        config_params['pv']['nom_power'] = des_config_i['pv']
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+        self._pool.apply_async(fn, args, kwargs, callback=future.set_result, error_callback=future.set_exception)
+        return future
 
-        batch_params.append((config_params, des_config_i.to_dict()))
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._pool.close()
+        if wait:
+            self._pool.join()
+
+def pool(store=None, max_tasks_per_child=MAX_TASKS_PER_CHILD):
+    '''
+    Process pool of the sweep, the workers attach to the published inputs (store, see publish_inputs) and are warmed
+    in init_worker. With max_tasks_per_child, a worker is replaced after that many tasks (RecyclingPool).
+    '''
+    initargs = (store.path if store is not None else None,)
+    if max_tasks_per_child is not None:
+        return RecyclingPool(os.cpu_count(), init_worker, initargs, max_tasks_per_child)
+    return concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker, initargs=initargs)
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=batch_size) as executor:
+def overhead_report(results):
+    '''
+    Mean runtime, sim_time (run_DES) and overhead (rest of the runtime) of the simulated results, for the first task
+    of every worker and the following (warm) ones, and the mean initialization time of the workers.
+    '''
+    frame = pd.DataFrame(results)
+    if frame.empty or 'sim_time' not in frame:
+        return None
+    frame = frame.dropna(subset=['sim_time'])
+    if frame.empty:
+        return None
+    task = np.where(frame['worker_task'] == 1, 'first', 'warm')
+    report = frame.groupby(task)[['runtime', 'sim_time', 'overhead']].mean()
+    report['tasks'] = frame.groupby(task).size()
+    report.attrs['worker_init'] = frame.drop_duplicates('worker')['worker_init'].mean()
+    return report
+
+def simulate(executor, batch_params, log, progress=True):
+    '''Simulates the (config_params, des_config_i) in the pool, appends every result to log and returns the results.'''
+    if BATCH_SIZE > 1:
+        batches = [batch_params[i:i + BATCH_SIZE] for i in range(0, len(batch_params), BATCH_SIZE)]
+        futures = [executor.submit(run_batch, batch) for batch in batches]
+    else:
         futures = [executor.submit(run_instance, args) for args in batch_params]
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
-            try:
-                results.append(future.result())
-            except Exception as e:
-                logging.error(f"Future failed: {e}")
+    collected = []
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), disable=not progress):
+        try:
+            results = future.result() if BATCH_SIZE > 1 else [future.result()]
+            for result in results:
+                log.append(result)
+            collected.extend(results)
+        except Exception as e:
+            logging.error(f"Future failed: {e}")
+    report = overhead_report(collected)
+    if report is not None:
+        summary = f"Worker initialization {report.attrs['worker_init']:.2f} s (mean), per task in s:\n{report.round(3).to_string()}"
+        logging.info(summary)
+        print(summary, flush=True)
+    return collected
+
+def main(resume=False):
+    '''
+    Simulates the configurations of the sample plan. Every finished configuration is appended to RESULTS_LOG,
+    with resume the configurations finished (successfully or as infeasible) in an interrupted sweep are skipped.
+    '''
+
+    # load scenario once
+    load_scenario()
+
+    log = SweepLog(RESULTS_LOG, resume=resume)
+    done = log.done(status=('ok', 'infeasible'))
 
-    # delete pvlib output files again
-    for filename in os.listdir(output_dir):
-        if "PVlib_output" in filename:
-            os.remove(os.path.join(output_dir, filename))
+    batch_params = []
+    for _, des_config_i in df_combinations.iterrows():
+        config_params = configure(des_config_i)
+        if config_hash(config_params) in done:
+            continue
+        batch_params.append((config_params, des_config_i.to_dict()))
+    if done:
+        logging.info(f"Resuming sweep: {len(done)} configurations done, {len(batch_params)} remaining")
+        print(f"Resuming sweep: {len(done)} configurations done, {len(batch_params)} remaining", flush=True)
+
+    store = publish_inputs(batch_params, scenario) if SHARED_INPUTS else None
+    try:
+        with pool(store) as executor:
+            simulate(executor, batch_params, log)
+    finally:
+        if store is not None:
+            store.close() # removes the published inputs, also if the sweep fails or is interrupted
 
-    data = pd.DataFrame(results)
+    data = log.frame()
 
     data.to_csv(os.path.join(os.path.dirname(__file__), '../../data/outputs/optimal_config_results.csv'), index=True)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Simulates the configurations of the sample plan.')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the configurations finished in a previous (interrupted) sweep, see RESULTS_LOG')
+    main(resume=parser.parse_args().resume)
@@ -0,0 +1,55 @@
+import pytest
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.optimal_config import active_sweep
+from src.optimal_config.active_sweep import encode, maximin, acquisition, select, load_candidates
+
+
+@pytest.fixture(scope='module')
+def candidates():
+    return load_candidates().head(400)
+
+def test_maximin(candidates):
+    encodings = encode(candidates)
+    assert encodings.min() == 0 and encodings.max() == 1
+
+    picked = maximin(encodings, 20)
+    assert len(set(picked)) == 20
+
+    # same selection as the full distance matrix of greedy_maximin.ipynb
+    dist = np.linalg.norm(encodings[:, None, :] - encodings[None, :, :], axis=2)
+    selected = [picked[0]]
+    while len(selected) < 20:
+        remaining = [i for i in range(len(encodings)) if i not in selected]
+        selected.append(remaining[int(np.argmax(dist[remaining][:, selected].min(axis=1)))])
+    assert picked == selected
+
+    assert maximin(encodings, 10, picked[:10]) == picked[10:20] # continues a selection
+
+def test_acquisition():
+    y = pd.DataFrame({'costs' : [10.0, 12.0, 14.0], 'co2' : [1.0, 1.0, 3.0], 'aux_heater' : [0.0, 0.0, 0.0]})
+    mean = pd.DataFrame({'costs' : [8.0, 8.0, 20.0, 12.0], 'co2' : [1.0, 1.0, 1.0, 1.0], 'aux_heater' : [0.0] * 4})
+    std = pd.DataFrame({'costs' : [0.1, 2.0, 0.1, 0.0], 'co2' : [0.0] * 4, 'aux_heater' : [0.0] * 4})
+
+    ei = acquisition(mean, std, y, 'ei')
+    assert ei[1] > ei[0] > 0 and ei[2] < 1e-6 and ei[3] < 1e-6 # better and more uncertain first
+    assert list(np.argsort(-acquisition(mean, std, y, 'uncertainty'))[:2]) == [1, 0]
+    assert select(ei, 1, evaluated=[1]) == [0]
+    assert sorted(select(ei, 5, evaluated=[1])) == [0, 2, 3]
+    with pytest.raises(ValueError):
+        acquisition(mean, std, y, 'random')
+
+def test_surrogate(candidates):
+    pytest.importorskip('sklearn')
+    X = candidates.head(30)
+    y = pd.DataFrame({'costs' : X['chp'] / 1000 + X['pv'] / 500, 'co2' : X['T_dhw_sp'] * 1.0,
+                      'aux_heater' : X['hwt_volume'] / 1000})
+    mean, std = active_sweep.Surrogate(n_restarts=0).fit(X, y).predict(candidates)
+    assert list(mean.columns) == ['costs', 'co2', 'aux_heater'] and (std.to_numpy() >= 0).all()
+    assert np.allclose(mean.loc[X.index, 'co2'], y['co2'], rtol=0.05)
@@ -0,0 +1,92 @@
+import pytest
+import sys
+import os
+from pathlib import Path
+
+import mosaik_csv
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models import cached_csv
+
+
+@pytest.fixture
+def datafile(tmp_path):
+    path = tmp_path / 'heatload.csv'
+    path.write_text('HEATLOAD\n'
+                    'Time,Heat Demand [kW],Timestamp,T_amb # °C,Electricity Demand [W]\n'
+                    '2022-01-01 00:00:00,12.5,2022-01-01 00:00:00,-2.0,4000\n'
+                    '2022-01-01 00:15:00,10.0,2022-01-01 00:15:00,-1.5,4100\n'
+                    '2022-01-01 01:00:00,8.0,2022-01-01 01:00:00,0.5,3900\n')
+    return str(path)
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cached_csv, 'CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+def run(sim, datafile, until, **params):
+    sim.init('CSV-0', 1, '2022-01-01 00:00:00', datafile, **params)
+    eid = sim.create(1, 'HEATLOAD')[0]['eid']
+    attrs = sim.meta['models']['HEATLOAD']['attrs']
+    data, time = [], 0
+    while time < until:
+        next_time = sim.step(time, {}, until)
+        data.append((time, sim.get_data({eid : attrs})))
+        time = next_time
+    return data
+
+def test_same_as_mosaik_csv(datafile, cache_dir):
+    ref = run(mosaik_csv.CSV(), datafile, 2*3600)
+    data = run(cached_csv.CSV(), datafile, 2*3600)
+
+    assert data == ref
+    assert type(data[0][1]['HEATLOAD_0']['Electricity Demand [W]']) is int
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_cache_and_projection(datafile, cache_dir):
+    table = cached_csv.load_table(datafile)
+    assert table.attrs == ['Heat Demand [kW]', 'Timestamp', 'T_amb', 'Electricity Demand [W]']
+    assert table.values('T_amb', table.rows(['2022-01-01 00:30:00', '2022-01-01 01:00:00'])) == [-1.5, 0.5]
+
+    os.utime(datafile) # new mtime, same content: same cache entry
+    assert cached_csv.load_table(datafile).values('Timestamp', [0]) == ['2022-01-01 00:00:00']
+    assert len(os.listdir(cache_dir)) == 1
+
+    data = run(cached_csv.CSV(), datafile, 900, attrs=['T_amb'])
+    assert data == [(0, {'HEATLOAD_0' : {'T_amb' : -2.0}})]
+    with pytest.raises(ValueError):
+        run(cached_csv.CSV(), datafile, 900, attrs=['unknown'])
+
+def test_start_before_data(datafile, cache_dir):
+    with pytest.raises(ValueError, match='before the first timestamp'):
+        cached_csv.CSV().init('CSV-0', 1, '2021-12-31 23:00:00', datafile)
+
+    with open(datafile, 'a') as f:
+        f.write('2022-01-01 01:15:00,7.0,2022-01-01 01:15:00,1.0,3800\n')
+    assert len(cached_csv.load_table(datafile).index) == 4 # changed content, new cache entry
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_in_memory_series(tmp_path, cache_dir):
+    import pandas as pd
+    profile = pd.Series([0.0, 120.5, 80.25], name='Power[w]',
+                        index=pd.date_range('2022-01-01 00:00:00', periods=3, freq='15min'))
+    path = tmp_path / 'pv.csv'
+    profile.to_frame().to_csv(path)
+
+    sims = []
+    for datafile in (str(path), profile):
+        sim = cached_csv.CSV()
+        sim.init('CSV-0', 1, '2022-01-01 00:00:00', datafile, cache=False)
+        eid = sim.create(1, 'Data')[0]['eid']
+        data, time = [], 0
+        while time < 3600:
+            next_time = sim.step(time, {}, 3600)
+            data.append((time, sim.get_data({eid : ['Power[w]']})))
+            time = next_time
+        sims.append(data)
+
+    assert sims[0] == sims[1]
+    assert sims[1][1] == (900, {'Data_0' : {'Power[w]' : 120.5}})
+    assert not os.path.exists(cache_dir)
@@ -0,0 +1,181 @@
+import pytest
+import sys
+import os
+import json
+import copy
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models.collector import Collector, ColumnStore, SpillingStore, KPIStore, Recorder, Recording, \
+    AbortCriteria, AbortedRun, SimulationAborted
+from src.utils.run_file import RunFile
+
+
+def test_column_store():
+    store = ColumnStore('2022-01-01 00:00:00', 4*900, 900)
+    for step, (num, flag, status) in enumerate([(1, True, 'on'), (2.5, False, 'off'), (3, True, None)]):
+        store.set(('Sim-0.a', 'num'), step, num)
+        store.set(('Sim-0.a', 'flag'), step, flag)
+        store.set(('Sim-0.a', 'status'), step, status)
+    store.set(('Sim-0.a', 'mixed'), 0, 1.0)
+    store.set(('Sim-0.a', 'mixed'), 3, 'on')
+
+    df = store.frame()
+    assert isinstance(df.index, pd.DatetimeIndex) and len(df) == 4
+    assert df.index[1] == pd.Timestamp('2022-01-01 00:15:00')
+    assert df['Sim-0.a-num'].dtype == float and math.isnan(df['Sim-0.a-num'].iloc[3])
+    assert df['Sim-0.a-num'].iloc[:3].tolist() == [1.0, 2.5, 3.0]
+    assert df['Sim-0.a-flag'].iloc[:3].tolist() == [1.0, 0.0, 1.0] # bool column with missing steps becomes float
+    assert df['Sim-0.a-status'].tolist() == ['on', 'off', None, None]
+    assert df['Sim-0.a-mixed'].tolist()[::3] == [1.0, 'on']
+
+    with pytest.raises(ValueError):
+        store.index(4*900)
+    with pytest.raises(ValueError):
+        store.index(100)
+
+def test_collector_modes():
+    inputs = {'Monitor' : {'P_th' : {'Boiler-0.boiler_0' : 10.0}, 'status' : {'Boiler-0.boiler_0' : 'on'}}}
+
+    collector = Collector()
+    collector.init('Collector-0', 1)
+    collector.create(1, 'Collector')
+    collector.step(900, inputs, None)
+    assert collector.dump()['Boiler-0.boiler_0']['P_th'] == {900 : 10.0}
+
+    collector = Collector()
+    collector.init('Collector-0', 1, start_date='2022-01-01 00:00:00', end=2*900, step_size=900)
+    collector.create(1, 'Collector')
+    collector.step(900, inputs, None)
+    df = collector.dump()
+    assert df.loc['2022-01-01 00:15:00', 'Boiler-0.boiler_0-P_th'] == 10.0
+    assert df['Boiler-0.boiler_0-status'].tolist() == [None, 'on']
+    assert collector.store() is collector.columns
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_spilling_store(tmp_path, compression):
+    # 8 steps of 15 min, 4 in January and 4 in February
+    store = SpillingStore('2022-01-31 23:00:00', 8*900, 900, str(tmp_path / 'run'), compression=compression)
+    assert store.n_steps == 4 # one month in memory
+
+    for time in range(0, 8*900, 900):
+        step = store.index(time)
+        store.set(('Sim-0.a', 'P'), step, time / 900)
+        store.set(('Sim-0.a', 'on'), step, time < 4*900)
+        store.set(('Sim-0.a', 'status'), step, 'on' if time % 1800 else None)
+        if time >= 5*900:
+            store.set(('Sim-0.a', 'late'), step, 1.5)
+        if time == 6*900:
+            store.set(('Sim-0.a', 'P'), step, 'error') # the float column becomes categorical
+    assert store.chunk_start == 4 # January was written
+
+    run = store.result()
+    assert isinstance(run, RunFile) and len(run) == 8
+    assert run.index[4] == pd.Timestamp('2022-02-01 00:00:00')
+    assert run['Sim-0.a-P'].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 'error', 7.0]
+    assert run['Sim-0.a-on'].tolist() == [True]*4 + [False]*4
+    assert run['Sim-0.a-status'].tolist() == [None, 'on']*4
+    assert np.isnan(run.values('Sim-0.a-late')[:5]).all() and run.values('Sim-0.a-late')[5] == 1.5
+
+    reloaded = RunFile(str(tmp_path / 'run'))
+    assert reloaded.columns == run.columns
+    assert list(reloaded.frame(numeric=True).columns) == ['Sim-0.a-on', 'Sim-0.a-late']
+
+def test_recorder(tmp_path):
+    config = {'columns' : {'include' : ['Sim-0.a-*']},
+              'file' : {'path' : str(tmp_path / 'run'), 'compression' : 'zlib'},
+              'kpis' : {'E' : ['Sim-0.b-P', 'energy'], 'P_max' : ['Sim-0.b-P', 'max'], 'T_mean' : ['Sim-0.a-T', 'mean']}}
+    recorder = Recorder.from_config('2022-01-01 00:00:00', 4*900, 900, config)
+    for time in range(0, 4*900, 900):
+        step = recorder.index(time)
+        recorder.set(('Sim-0.a', 'T'), step, 20 + time / 900)
+        recorder.set(('Sim-0.b', 'P'), step, 1000.0 if time else None)
+    assert [i for i, _ in recorder.routes[('Sim-0.b', 'P')]] == [1, 2] # file and kpis
+
+    recording = recorder.result()
+    assert recording is recorder.result()
+    assert list(recording['columns'].columns) == ['Sim-0.a-T']
+    assert recording['file']['Sim-0.b-P'].tolist()[1:] == [1000.0]*3
+    assert recording.kpis == {'E' : 750.0, 'P_max' : 1000.0, 'T_mean' : 21.5}
+    assert list(recording.frame(numeric=True).columns) == ['Sim-0.a-T']
+
+    with pytest.raises(ValueError):
+        Recorder.from_config('2022-01-01 00:00:00', 900, 900, {'kpis' : {'x' : ['Sim-0.a-T', 'median']}})
+
+def test_collector_recording(tmp_path):
+    collector = Collector()
+    collector.init('Collector-0', 1, start_date='2022-01-01 00:00:00', end=2*900, step_size=900,
+                   recording={'kpis' : {'P' : ['Boiler-0.boiler_0-P_th', 'sum']}})
+    collector.create(1, 'Collector')
+    for time in (0, 900):
+        collector.step(time, {'Monitor' : {'P_th' : {'Boiler-0.boiler_0' : 5.0}}}, 2*900)
+    collector.finalize()
+    assert isinstance(collector.dump(), Recording) and collector.dump().kpis == {'P' : 10.0}
+
+def test_native_columnar():
+    from src.main_sim import run_DES
+
+    with open(os.path.join(project_root, 'data', 'inputs', 'input_params.json'), 'r') as f:
+        params = json.load(f)
+    until = 24*60*60
+
+    ref = run_DES(copy.deepcopy(params), until=until, engine='native')
+    df = run_DES(copy.deepcopy(params), until=until, engine='native', columnar=True)
+
+    assert len(df) == until // 900
+    assert set(df.columns) == {f'{src}-{attr}' for src, attrs in ref.items() for attr in attrs}
+    for src, attrs in ref.items():
+        for attr, vals in attrs.items():
+            values = list(vals.values())
+            if all(isinstance(x, (int, float)) for x in values):
+                assert np.array_equal(df[f'{src}-{attr}'].to_numpy(dtype=float), np.array(values, dtype=float), equal_nan=True), (src, attr)
+
+def test_abort_criteria():
+    start, end = '2022-01-01 00:00:00', 8*900
+    criteria = {'E' : ['Sim-0.b-P', 'energy', 600.0, '2022-01-01 01:00:00'], 'T' : ['Sim-0.a-T', 'max', 30.0]}
+    collector = Collector()
+    collector.init('Collector-0', 1, start_date=start, end=end, step_size=900, abort=criteria)
+    collector.create(1, 'Collector')
+    collector.step(0, {'Monitor' : {'P' : {'Sim-0.b' : 1000.0}, 'T' : {'Sim-0.a' : 20.0}}}, end)
+    collector.step(900, {'Monitor' : {'P' : {'Sim-0.b' : 1000.0}, 'T' : {'Sim-0.a' : 20.0}}}, end)
+    with pytest.raises(SimulationAborted) as aborted:
+        collector.step(1800, {'Monitor' : {'P' : {'Sim-0.b' : 1000.0}, 'T' : {'Sim-0.a' : 20.0}}}, end)
+    assert (aborted.value.criterion, aborted.value.time, aborted.value.value) == ('E', 1800, 750.0)
+    run = AbortedRun(collector.dump(), aborted.value)
+    assert run.data['Sim-0.b-P'].tolist()[:3] == [1000.0]*3 and math.isnan(run.data['Sim-0.b-P'].iloc[3])
+
+    late = AbortCriteria(start, end, 900, {'E' : ['Sim-0.b-P', 'energy', 600.0, '2022-01-01 00:30:00']})
+    for time in range(0, end, 900):
+        late.check(('Sim-0.b', 'P'), time, 1000.0) # only checked before 00:30
+        late.check(('Sim-0.c', 'P'), time, 1e9) # not watched
+    with pytest.raises(SimulationAborted):
+        AbortCriteria(start, end, 900, criteria).check(('Sim-0.a', 'T'), 4*900, 31.0)
+
+def test_native_abort():
+    from src.main_sim import run_DES, run_DES_batch
+
+    with open(os.path.join(project_root, 'data', 'inputs', 'input_params.json'), 'r') as f:
+        params = json.load(f)
+    until = 24*60*60
+
+    ref = run_DES(copy.deepcopy(params), until=until, engine='native', columnar=True)
+    demand = ref['ControllerSim-0.Controller_0-heat_demand']
+    limit = demand.iloc[:40].sum()
+    abort = {'demand' : ['ControllerSim-0.Controller_0-heat_demand', 'sum', limit]}
+    run = run_DES(copy.deepcopy(params), until=until, engine='native', abort=abort)
+    assert isinstance(run, AbortedRun) and run.criterion == 'demand' and run.value > limit
+    step = run.time // 900
+    assert step >= 40 and demand.iloc[:step].sum() <= limit < demand.iloc[:step + 1].sum()
+    numeric = [col for col, dtype in ref.dtypes.items() if dtype == float]
+    data = run.data[numeric].to_numpy()
+    assert np.array_equal(data[:step], ref[numeric].to_numpy()[:step], equal_nan=True)
+    assert np.isnan(data[step + 1:]).all()
+
+    sims, errors = run_DES_batch([copy.deepcopy(params)], until=until, progress=False, abort=abort)
+    assert not errors and isinstance(sims[0], AbortedRun) and sims[0].time == run.time
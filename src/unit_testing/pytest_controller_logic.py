@@ -0,0 +1,198 @@
+import pytest
+import sys
+import os
+import json
+import copy
+import random
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models.controller import Controller
+
+
+@pytest.fixture
+def params():
+    with open(os.path.join(project_root, 'data', 'inputs', 'input_params.json'), 'r') as f:
+        input_params = json.load(f)
+    params_ctrl = copy.deepcopy(input_params['ctrl'])
+    params_ctrl['tank'] = input_params['tank']
+    return params_ctrl
+
+def make_ctrl(params, temps, T_amb=5):
+    ctrl = Controller(params)
+    ctrl.step_size = 900
+    ctrl.hwt_mass = 1000
+    ctrl.T_amb = T_amb
+    for tank, layers in temps.items():
+        ctrl.tank_temps[tank].update(layers)
+    return ctrl
+
+def test_default_rules(params):
+
+    ctrl = make_ctrl(params, {'tank1' : {'sensor_1' : 45}, 'tank2' : {'sensor_2' : 70}})
+    ctrl.apply_rules()
+
+    assert ctrl.generators['hp_status'] == 'on'
+    assert ctrl.generators['hp_demand'] == pytest.approx(1000 * 4184 * (50 - 45) / 900)
+    assert ctrl.generators['boiler_status'] == 'off'
+    assert ctrl.generators['chp_status'] == 'off' # no rule for the chp
+
+def test_add_conditions_override(params):
+
+    ctrl = make_ctrl(params, {'tank1' : {'sensor_1' : 45}}, T_amb=-2)
+    ctrl.apply_rules()
+
+    assert ctrl.generators['hp_status'] == 'off'
+    assert ctrl.generators['hp_demand'] == 0
+
+def test_rules_from_params(params):
+    params['logic'] = {
+        'chp' : {
+            'turn_on' : {'tank' : 'tank2', 'layer' : 'sensor_0', 'turn_on_temp' : 55},
+            'add_conditions' : {'turn_on' : {'T_amb' : ['<', 10]}}
+        }
+    }
+    ctrl = make_ctrl(params, {'tank2' : {'sensor_0' : 58}})
+    ctrl.apply_rules()
+
+    assert ctrl.generators['chp_status'] == 'on'
+    assert ctrl.generators['hp_status'] == 'off'
+    assert '_rules' not in ctrl.get_init_attrs()
+
+def test_more_conditions(params):
+    # more than 2 additional conditions are evaluated as well (with a warning)
+    params['logic'] = {'hp' : {'turn_on' : {'tank' : 'tank1', 'layer' : 'sensor_1', 'turn_on_temp' : 50},
+                               'add_conditions' : {'turn_on' : {'T_amb' : -10, 'heat_demand' : -1, 'hwt_mass' : ['>', 500]}}}}
+    ctrl = make_ctrl(params, {'tank1' : {'sensor_1' : 52}}) # between the turn on and off temps
+    ctrl.heat_demand = 0
+    ctrl.apply_rules()
+
+    assert ctrl.generators['hp_status'] == 'on' # only the third condition is satisfied
+
+def test_invalid_rules(params):
+    params['logic'] = {'hp' : {'turn_on' : {'tank' : 'tank1', 'layer' : 'sensor_1', 'turn_on_temp' : 50},
+                               'add_conditions' : {'turn_off' : {'T_amb' : ['=<', 0]}}}}
+    with pytest.raises(ValueError):
+        Controller(params)
+
+    params['logic'] = {'pellet' : {'turn_on' : {'tank' : 'tank1', 'layer' : 'sensor_1', 'turn_on_temp' : 50}}}
+    with pytest.raises(RuntimeError):
+        Controller(params)
+
+
+def test_tank_port_views(params):
+    from src.utils import helpers
+
+    ctrl = Controller(params)
+    helpers.set_nested_attr(ctrl, 'tank_connections.tank1.heat_out2_F', -0.5)
+    ctrl.tank_connections['tank2']['heat_out_T'] = 60
+
+    assert ctrl._port_F[1, ctrl._port_index['heat_out2']] == -0.5
+    assert helpers.get_nested_attr(ctrl, 'tank_connections.tank2.heat_out_T') == 60.0
+    assert 'tank_connections.tank1.heat_out2_F' in ctrl.get_init_attrs()
+    assert list(ctrl.tank_connections['tank0'])[:2] == ['heat_in_T', 'heat_in_F']
+
+def test_tank_balancing(params):
+    # tank0.heat_out:tank1.hp_out, tank1.heat_out:tank2.hp_out
+    ctrl = Controller(params)
+    ports = ctrl.tank_connections
+    ports['tank0']['heat_in_F'] = 1.0 # return flow into tank0
+    ports['tank0']['heat_out_T'] = 30
+    ports['tank2']['heat_out_F'] = -1.0 # supply flow out of tank2
+    ports['tank2']['hp_out_T'] = 55
+    ctrl.balance_tanks()
+
+    assert ports['tank0']['heat_out_F'] == -1.0
+    assert ports['tank1']['hp_out_F'] == 1.0
+    assert ports['tank1']['hp_out_T'] == 30.0
+    assert ports['tank2']['hp_out_F'] == 1.0
+    assert ctrl.netflow == 0.0
+
+def test_simulator_get_data(params):
+    from src.models.controller_mosaik import ControllerSimulator
+
+    sim = ControllerSimulator()
+    sim.init('Ctrl', 1, 900, params)
+    sim.create(1, 'Controller', params)
+    sim.models['Controller_0'].T_amb = 4
+
+    outputs = {'Controller_0' : ['T_amb', 'tank_connections.tank1.heat_out2_F']}
+    assert sim.get_data(outputs) == {'time' : None, 'Controller_0' : {'T_amb' : 4, 'tank_connections.tank1.heat_out2_F' : 0.0}}
+    sim.models['Controller_0'].tank_connections['tank1']['heat_out2_F'] = -0.5
+    assert sim.get_data(outputs)['Controller_0']['tank_connections.tank1.heat_out2_F'] == -0.5
+    assert len(sim.plans) == 1
+
+    with pytest.raises(ValueError):
+        sim.get_data({'Controller_0' : ['unknown']})
+
+def test_controller_bank(params):
+    from src.models.controller import ControllerBank
+
+    random.seed(2)
+    chp_logic = {'chp' : {'turn_on' : {'tank' : 'tank2', 'layer' : 'sensor_0', 'turn_on_temp' : 55},
+                          'add_conditions' : {'turn_on' : {'T_amb' : ['<', 10]}}}}
+    pairs = []
+    for k in range(6):
+        config = copy.deepcopy(params)
+        config['logic']['boiler']['turn_on']['turn_on_temp'] = 55 + k
+        if k % 3 == 2:
+            config['logic'].update(chp_logic) # another rule table
+        pairs.append((Controller(config), Controller(config)))
+    ctrls, banked = zip(*pairs)
+    bank = ControllerBank(list(banked), vectorize=True)
+
+    seen = set() # netflow errors and generators switched on
+    for step in range(20):
+        for ctrl, other in pairs:
+            inputs = {'hwt_mass' : random.uniform(500, 1500), 'step_size' : 900, 'T_amb' : random.uniform(-5, 15)}
+            temps = {tank : {sensor : random.uniform(40, 75) for sensor in ctrl.sensors} for tank in ctrl.tanks}
+            flow = random.uniform(0, 2)
+            ports = {('tank0', 'heat_in_F') : flow, ('tank2', 'heat_out_F') : -flow if random.random() < 0.8 else 0.3,
+                     ('tank0', 'heat_out_T') : random.uniform(20, 40), ('tank1', 'hp_out_T') : random.uniform(40, 60)}
+            for model in (ctrl, other):
+                for attr, val in inputs.items():
+                    setattr(model, attr, val)
+                for tank, layers in temps.items():
+                    model.tank_temps[tank].update(layers)
+                for (tank, key), val in ports.items():
+                    model.tank_connections[tank][key] = val
+
+        expected = {}
+        for k, ctrl in enumerate(ctrls):
+            ctrl.apply_rules()
+            try:
+                ctrl.balance_tanks()
+            except ValueError as e:
+                expected[k] = str(e)
+        errors = {}
+        bank.apply_rules(errors)
+        bank.balance_tanks(errors)
+
+        assert {k : str(e) for k, e in errors.items()} == expected
+        for ctrl, other in pairs:
+            assert dict(other.generators) == dict(ctrl.generators)
+            assert (other._port_T == ctrl._port_T).all() and (other._port_F == ctrl._port_F).all()
+            assert other.netflow == ctrl.netflow and other.residual_flow == ctrl.residual_flow
+            seen.update(key for key, val in ctrl.generators.items() if val == 'on')
+        seen.update(expected.values())
+    assert {'tank2 netflow error!', 'chp_status', 'boiler_status', 'hp_status'} <= seen
+
+def test_controller_bank_views(params):
+    from src.models.controller import ControllerBank
+
+    ctrl = Controller(params)
+    ctrl.tank_temps['tank1']['sensor_1'] = 45
+    ctrl.generators['hp_status'] = 'on'
+    bank = ControllerBank([Controller(params), ctrl])
+
+    assert not bank.vectorized # fewer than ControllerBank.vectorize_from
+    assert bank.sensor_T[1, 1, 1] == 45 and bank.gen_status[1, 0] == 'on' # the state is kept when binding
+    ctrl.tank_connections['tank2']['heat_out_F'] = -1.0
+    assert bank.port_F[1, 2, ctrl._port_index['heat_out']] == -1.0
+
+    other = copy.deepcopy(params)
+    other['gens'] = ['hp', 'boiler']
+    with pytest.raises(ValueError):
+        ControllerBank([ctrl, Controller(other)])
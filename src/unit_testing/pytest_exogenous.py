@@ -0,0 +1,45 @@
+import pytest
+import sys
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models.exogenous import load_signals, HEATING_CURVES
+
+
+@pytest.fixture
+def heat_load_file(tmp_path):
+    path = tmp_path / 'heatload.csv'
+    path.write_text('HEATLOAD\n'
+                    'Time,Space heating (kW),Domestic hot water (kW),Heat Demand [kW],Timestamp,T_amb\n'
+                    '2022-05-31 23:30:00,10.0,2.0,12.0,2022-05-31 23:30:00,-12.0\n'
+                    '2022-06-01 00:00:00,-1.0,3.5,2.5,2022-06-01 00:00:00,0.0\n'
+                    '2022-06-01 08:00:00,4.0,0.0,4.0,2022-06-01 08:00:00,20.0\n')
+    return str(path)
+
+def test_signals(heat_load_file):
+    # 4 steps of 15 min from 23:30, the rows are held until the next timestamp (as in mosaik_csv)
+    signals = load_signals(heat_load_file, '2022-05-31 23:30:00', 4*900, 900)
+
+    assert signals.season == ['winter', 'winter', 'summer', 'summer']
+    assert signals.isday == [False, False, None, None] # hour 0 gives None, like Controller.step
+    assert signals.sh_demand == [10000.0, 10000.0, 0.0, 0.0]
+    assert signals.dhw_demand == [2000.0, 2000.0, 3500.0, 3500.0]
+    assert str(signals.timestamp[2]) == '2022-06-01 00:00:00'
+
+    curve = HEATING_CURVES['radiator_high_insulation']
+    assert signals.sh_supply_T[0] == curve['T_supply'][0] # below the curve
+    assert signals.sh_supply_T[2] == pytest.approx(np.interp(0.0, curve['T_out'], curve['T_supply']))
+    assert signals.sh_dT == curve['delta_T']
+
+def test_signals_cached(heat_load_file):
+
+    assert load_signals(heat_load_file, '2022-05-31 23:30:00', 900, 900) is load_signals(heat_load_file, '2022-05-31 23:30:00', 900, 900)
+
+def test_start_before_data(heat_load_file):
+
+    with pytest.raises(ValueError, match='2022-05-31 23:30:00'):
+        load_signals(heat_load_file, '2022-05-31 23:00:00', 4*900, 900)
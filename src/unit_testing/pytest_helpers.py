@@ -0,0 +1,74 @@
+import pytest
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.utils import helpers
+
+
+@pytest.fixture
+def entity():
+    return SimpleNamespace(T_amb=5, tank_connections={'tank1' : {'heat_out2_F' : 0, 'heat_out2_T' : 40}})
+
+def test_compile_path(entity):
+
+    path = helpers.compile_path(entity, 'tank_connections.tank1.heat_out2_F')
+    path.set(0.5)
+    assert entity.tank_connections['tank1']['heat_out2_F'] == 0.5
+    assert path.get() == helpers.get_nested_attr(entity, 'tank_connections.tank1.heat_out2_F')
+
+    top = helpers.compile_path(entity, 'T_amb')
+    entity.T_amb = -3
+    assert top.get() == -3
+    top.set(7)
+    assert entity.T_amb == 7
+
+def test_compile_path_missing(entity):
+
+    with pytest.raises(RuntimeError):
+        helpers.compile_path(entity, 'tank_connections.tank9.heat_out2_F')
+    with pytest.raises(RuntimeError):
+        helpers.compile_path(entity, 'tank_connections.tank1.hp_out_F').get()
+
+def test_tank_paths():
+    tank = SimpleNamespace(tankno=0, sensors={'sensor_00' : SimpleNamespace(T=35.0)},
+                           connections={'heat_out' : SimpleNamespace(F=1)}, heating_rods={})
+
+    assert helpers.compile_path(tank, 'sensor_00.T').get() == 35.0
+    flow = helpers.compile_path(tank, 'heat_out.F')
+    assert flow.get() == 1.0 and isinstance(flow.get(), float)
+    flow.set(-2)
+    assert tank.connections['heat_out'].F == -2
+
+def test_path_cache(entity):
+
+    paths = helpers.PathCache(entity)
+    assert paths['T_amb'] is paths['T_amb']
+    paths['tank_connections.tank1.heat_out2_T'].set(55)
+    assert entity.tank_connections['tank1']['heat_out2_T'] == 55
+
+def test_debug_tracer(entity, tmp_path, monkeypatch):
+    import csv
+    monkeypatch.chdir(tmp_path)
+    attrs = ['T_amb', 'tank_connections.tank1.heat_out2_F', 'tank_connections.tank1.heat_out2_T']
+    tracer = helpers.DebugTracer('ctrl_trace.csv', attrs, entity, every=2, sample={'T_amb' : 2},
+                                 include=['T_amb', '*heat_out2_F'], end=9*900, buffer_size=4)
+    assert tracer.attrs == ['T_amb', 'tank_connections.tank1.heat_out2_F']
+
+    for time in range(0, 10*900, 900):
+        entity.T_amb = time
+        tracer.record(time)
+        if time == 0:
+            tracer.record(time) # second iteration of the same time
+    with open('ctrl_trace.csv') as f:
+        assert len(list(csv.reader(f))) == 1 + 4 # header and one full buffer, appended
+    tracer.close()
+
+    with open('ctrl_trace.csv') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['time', 'cycle', 'T_amb', 'tank_connections.tank1.heat_out2_F']
+    assert [row[:3] for row in rows[1:]] == [['0', '0', '0'], ['0', '1', '0'], ['1800', '0', ''], ['3600', '0', '3600'],
+                                            ['5400', '0', ''], ['7200', '0', '7200']]
@@ -0,0 +1,44 @@
+import sys
+import json
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from mosaik_components.heatpump import Heat_Pump_Design, Heat_Pump_mosaik
+
+from src.models import hp_lookup
+
+
+def test_cached_json(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(hp_lookup.json, 'load', lambda f, **kwargs: calls.append(f.name) or {'a' : [1, 2]})
+    cache = hp_lookup.CachedJson()
+    path = tmp_path / 'data.json'
+    path.write_text('{}')
+    for _ in range(3):
+        with open(path) as f:
+            data = cache.load(f)
+    assert data == {'a' : [1, 2]} and calls == [str(path)]
+    with open(path) as f:
+        cache.load(f, parse_float=float) # other arguments are not cached
+    assert len(calls) == 2
+    assert cache.dumps({'b' : 1}) == '{"b": 1}'
+
+def test_cached():
+    import src.native_sim # no side effect on import
+    assert Heat_Pump_Design.json is json and Heat_Pump_mosaik.json is json
+    with hp_lookup.cached():
+        assert Heat_Pump_Design.json is hp_lookup._JSON and Heat_Pump_mosaik.json is hp_lookup._JSON
+    assert Heat_Pump_Design.json is json and Heat_Pump_mosaik.json is json
+
+def test_lookup_data(monkeypatch):
+    monkeypatch.setattr(Heat_Pump_Design, 'json', json) # restored after the test
+    monkeypatch.setattr(Heat_Pump_mosaik, 'json', json)
+    hp_lookup.preload()
+    assert Heat_Pump_Design.json is hp_lookup._JSON and Heat_Pump_mosaik.json is hp_lookup._JSON
+    with open(Heat_Pump_mosaik.JSON_COP_DATA) as f:
+        cop_data = json.load(f)
+    model = next(iter(cop_data))
+    assert hp_lookup.cop_data(model) == cop_data[model]
+    assert hp_lookup.cop_data(model) is hp_lookup.cop_data(model)
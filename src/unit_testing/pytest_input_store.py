@@ -0,0 +1,47 @@
+import pytest
+import sys
+import os
+import concurrent.futures
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.utils.input_store import InputStore
+
+
+@pytest.fixture
+def inputs():
+    demand = pd.Series([1.0, 2.5, 3.0], index=pd.date_range('2022-01-01', periods=3, freq='15min'), name='demand')
+    return {'scenario' : {'demand' : {'heat' : demand}, 'investment' : {'pipes' : {'2-runner' : 100}}, 'tax' : np.float64(0.5)},
+            'profile' : np.arange(4.0)}
+
+def worker_sum(path):
+    store = InputStore(path)
+    return float(store['scenario']['demand']['heat'].sum() + store['profile'].sum())
+
+def test_input_store(inputs, tmp_path):
+    store = InputStore.create(str(tmp_path / 'sweep'), inputs)
+    other = InputStore.create(str(tmp_path / 'sweep'), inputs) # a second sweep at the same time
+    path = store.path
+    assert os.path.dirname(path) == str(tmp_path / 'sweep') and path != other.path
+
+    scenario = store['scenario']
+    pd.testing.assert_series_equal(scenario['demand']['heat'], inputs['scenario']['demand']['heat'], check_freq=False)
+    assert scenario['investment']['pipes']['2-runner'] == 100 and scenario['tax'] == 0.5
+    assert store['scenario'] is scenario and 'profile' in store
+    profile = store['profile']
+    assert isinstance(profile, np.memmap) and not profile.flags.writeable
+    with pytest.raises(ValueError):
+        profile[0] = 1
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(worker_sum, [path, path])) == [12.5, 12.5]
+
+    store.close()
+    assert not os.path.exists(path)
+    assert other['profile'].sum() == 6.0
+    other.close()
@@ -0,0 +1,35 @@
+import pytest
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models.output_writer import OutputWriter
+from src.utils.run_file import RunFile, export_csv
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_output_writer(tmp_path, compression):
+    writer = OutputWriter()
+    writer.init('Output_writer-0', 1, start_date='2022-01-31 23:30:00', end=4*900, step_size=900,
+                output_dir=str(tmp_path / 'DES_data'), compression=compression)
+    eid = writer.create(1, 'OutputWriter')[0]['eid']
+    with pytest.raises(RuntimeError):
+        writer.create(1, 'OutputWriter')
+
+    for time in range(0, 4*900, 900):
+        writer.step(time, {eid : {'P_th' : {'Boiler-0.boiler_0' : time / 9}, 'on' : {'Boiler-0.boiler_0' : time > 0}}}, 4*900)
+    writer.finalize()
+
+    run = RunFile(str(tmp_path / 'DES_data'))
+    assert run.meta['compression'] == compression
+    assert run['Boiler-0.boiler_0-P_th'].tolist() == [0.0, 100.0, 200.0, 300.0]
+
+    export_csv(run, tmp_path / 'DES_data.csv', chunk_rows=3)
+    data = pd.read_csv(tmp_path / 'DES_data.csv', index_col='date')
+    assert list(data.columns) == ['Boiler-0.boiler_0-P_th', 'Boiler-0.boiler_0-on']
+    assert data.index.tolist() == ['2022-01-31 23:30:00', '2022-01-31 23:45:00', '2022-02-01 00:00:00', '2022-02-01 00:15:00']
+    assert data['Boiler-0.boiler_0-on'].tolist() == [False, True, True, True]
@@ -0,0 +1,56 @@
+import pytest
+import sys
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models import pvlib_model
+
+
+@pytest.fixture
+def params():
+    with open(project_root / 'data' / 'inputs' / 'input_params.json') as f:
+        return json.load(f)['pv']
+
+def test_profile_cache_scales_reference(params, tmp_path, monkeypatch):
+    monkeypatch.setattr(pvlib_model, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(pvlib_model, '_PROFILES', {})
+    ref = pvlib_model.profile(params, cache=False)
+
+    power = pvlib_model.profile(params)
+    assert np.array_equal(power.to_numpy(), ref.to_numpy())
+    assert power.index.equals(ref.index) and power.name == 'Power[w]'
+    assert len(list(tmp_path.glob('*.npz'))) == 1
+
+    # other nom_power and other process (empty memory): scaled from the file, pvlib is not run again
+    monkeypatch.setattr(pvlib_model, '_PROFILES', {})
+    monkeypatch.setattr(pvlib_model, 'run_model', lambda *args, **kwargs: pytest.fail('pvlib was run'))
+    small = pvlib_model.profile({**params, 'nom_power' : params['nom_power']/2})
+    assert np.allclose(small.to_numpy()*2, ref.to_numpy())
+
+    other = {**params, 'coordinates' : [50.0] + params['coordinates'][1:]}
+    assert pvlib_model.profile_key(other) != pvlib_model.profile_key(params)
+
+def test_sam_records(params, tmp_path, monkeypatch):
+    import pvlib
+    monkeypatch.setattr(pvlib_model, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(pvlib_model, '_RECORDS', {})
+    ref = pvlib_model.profile(params, cache=False) # records taken from the SAM libraries
+    assert len(os.listdir(tmp_path / 'sam')) == 2
+
+    monkeypatch.setattr(pvlib_model, '_RECORDS', {})
+    monkeypatch.setattr(pvlib.pvsystem, 'retrieve_sam', lambda *args, **kwargs: pytest.fail('SAM library parsed'))
+    module = pvlib_model.sam_record(*pvlib_model.MODULE_INFO)
+    assert module['Material'] == 'c-Si' and type(module['Cells_in_Series']) is int
+    assert np.array_equal(pvlib_model.profile(params, cache=False).to_numpy(), ref.to_numpy())
+
+def test_lazy_import():
+    import subprocess
+    code = 'import sys; from src.models import pvlib_model; print("pvlib" in sys.modules)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=project_root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == 'False'
@@ -0,0 +1,60 @@
+import pytest
+import sys
+import json
+import copy
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.utils import result_cache
+from src.utils.result_cache import ResultCache, canonical_params, config_key
+
+
+@pytest.fixture
+def params():
+    with open(project_root / 'data' / 'inputs' / 'input_params.json') as f:
+        return json.load(f)
+
+def test_canonical_params(params):
+    assert max(params['params_chp']['heat_out']) == 0
+    other = copy.deepcopy(params)
+    other['params_chp'].update({'efficiency' : 0.9, 'startup_limit' : 3, 'step_size' : 900})
+    other['ctrl']['signals'] = {'datafile' : 'heat_load.csv'} # added by run_DES
+    assert canonical_params(other) == canonical_params(params)
+    assert config_key(other) == config_key(params)
+
+    flow = copy.deepcopy(params)
+    flow['params_chp']['set_flow'] = 8 # changes the flows also without capacity
+    assert config_key(flow) != config_key(params)
+
+    chp = copy.deepcopy(params)
+    chp['params_chp']['heat_out'] = [0, 50000]
+    other_chp = copy.deepcopy(chp)
+    other_chp['params_chp']['efficiency'] = 0.9
+    assert config_key(other_chp) != config_key(chp)
+    assert 'efficiency' in canonical_params(chp)['params_chp']
+
+def test_key_inputs_and_code(params, tmp_path, monkeypatch):
+    data = tmp_path / 'input.csv'
+    data.write_text('a\n1\n')
+    key = config_key(params, [str(data)], extra={'until' : 900})
+    assert config_key(params, [str(data)], extra={'until' : 1800}) != key
+
+    data.write_text('a\n2\n')
+    assert config_key(params, [str(data)], extra={'until' : 900}) != key
+
+    key = config_key(params)
+    monkeypatch.setattr(result_cache, 'code_version', lambda: 'other') # changed source files
+    assert config_key(params) != key
+
+def test_result_cache(params, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = config_key(params)
+    assert cache.get(key) is None and key not in cache
+
+    cache.put(key, {'costs' : 1.5, 'co2' : float('nan')}, run='a1b2', params=params)
+    entry = cache.get(key)
+    assert key in cache and entry['kpis']['costs'] == 1.5 and entry['run'] == 'a1b2'
+    assert entry['params'] == canonical_params(params)
+    assert result_cache.code_version() == result_cache.code_version()
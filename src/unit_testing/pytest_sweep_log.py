@@ -0,0 +1,35 @@
+import pytest
+import sys
+import math
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.utils.sweep_log import SweepLog
+
+
+def test_resume(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    log = SweepLog(path)
+    log.append({'config' : 'a', 'status' : 'ok', 'runtime' : 1.5, 'costs' : 10.0})
+    log.append({'config' : 'b', 'status' : 'error', 'runtime' : 0.1, 'costs' : float('nan')})
+    with open(path, 'a') as f:
+        f.write('{"config" : "c", "stat') # interrupted while writing
+
+    log = SweepLog(path, resume=True)
+    assert list(log.done()) == ['a']
+    log.append({'config' : 'b', 'status' : 'ok', 'runtime' : 0.2, 'costs' : 12.0})
+    entries = log.entries()
+    assert [entry['config'] for entry in entries] == ['a', 'b', 'b']
+    assert math.isnan(entries[1]['costs'])
+
+    frame = log.frame()
+    assert list(frame['config']) == ['a', 'b']
+    assert list(frame['costs']) == [10.0, 12.0]
+
+    log.append({'config' : 'a', 'status' : 'error', 'runtime' : 0.1, 'costs' : float('nan')})
+    assert list(log.done()) == ['b'] # the last entry counts
+    assert list(log.done(status=('ok', 'error'))) == ['b', 'a']
+
+    assert SweepLog(path).entries() == [] # a new sweep clears the log
@@ -0,0 +1,134 @@
+import pytest
+import sys
+import copy
+import math
+import random
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models.EnTransformer import TransformerBank
+from src.models.boiler_model_v2 import Gboiler
+from src.models.chp_model_v2 import CHP
+
+STEP_SIZE = 900
+
+unit_params = [
+    {'heat_out': [0, 200000], 'set_temp': 75, 'efficiency': 0.8},
+    {'heat_out': [0, 50000, 100000], 'set_temp': 80, 'efficiency': 0.9},
+    {'heat_out': [0, 90000], 'set_flow': 4, 'efficiency': 0.5, 'elec_share': 0.5,
+     'startup_coeff': [-2.63, 3.9, 0.57], 'startup_limit': 11},
+    {'heat_out': [0, 30000], 'set_flow': 2, 'efficiency': 0.5, 'elec_share': 0.4,
+     'startup_coeff': [-2.63, 3.9, 0.57], 'startup_limit': 20, 'startup_eta_coeff': [0.1, 0.05]},
+    {'heat_out': [0, 90000], 'set_flow': 4, 'efficiency': 0.5, 'P_el': 45000},
+]
+
+def make_units(vectorize=True):
+    models, bank, units = [], TransformerBank(vectorize), []
+    for i, params in enumerate(unit_params * 4):
+        params = {**params, 'step_size': STEP_SIZE}
+        cls = CHP if i % 2 else Gboiler
+        models.append(cls(params))
+        units.append(bank.add(cls(params)))
+    return models, bank, units
+
+@pytest.mark.parametrize('vectorize', [True, False])
+def test_bank_equals_models(vectorize):
+    random.seed(1)
+    models, bank, units = make_units(vectorize)
+
+    for time in range(0, 200*STEP_SIZE, STEP_SIZE):
+        for model, unit in zip(models, units):
+            inputs = {'status' : random.choice(['on', 'on', 'off', None]),
+                      'Q_demand' : random.choice([0, 20000, 50000, 75000, 150000, 300000]),
+                      'temp_in' : random.uniform(20, 60),
+                      'step_size' : STEP_SIZE}
+            for attr, val in inputs.items():
+                setattr(model, attr, val)
+                setattr(unit, attr, val)
+            model.step(time)
+        bank.step(time)
+        assert bank.vectorized == vectorize
+
+        for model, unit in zip(models, units):
+            for attr in model.get_init_attrs():
+                expected = getattr(model, attr)
+                if isinstance(expected, (float, int)) and not isinstance(expected, bool):
+                    assert getattr(unit, attr) == pytest.approx(expected), (attr, time)
+                else:
+                    assert getattr(unit, attr) == expected, (attr, time)
+
+def test_unit_forwards_params():
+    _, bank, units = make_units()
+
+    assert units[3].heat_out_caps == [0, 30000] # odd units are CHPs
+    assert units[3].get_init_attrs() == CHP({**unit_params[3], 'step_size': STEP_SIZE}).get_init_attrs()
+    assert units[0].P_th is None
+
+    with pytest.raises(TypeError):
+        units[0].step(0)
+
+def test_vectorize_from():
+    def add(bank):
+        unit = bank.add(Gboiler(unit_params[0]))
+        unit.status, unit.Q_demand, unit.temp_in, unit.step_size = 'on', 100000, 40, STEP_SIZE
+        return unit
+
+    bank = TransformerBank()
+    for i in range(bank.vectorize_from - 1):
+        add(bank)
+    bank.step(0)
+    assert not bank.vectorized
+
+    unit = add(bank)
+    bank.step(STEP_SIZE)
+    assert bank.vectorized
+    assert unit.P_th == 200000
+
+    add(bank) # the state goes back into the models
+    assert not bank.vectorized
+    assert unit.model.P_th == 200000 and unit.model.lag_status == 'on'
+
+@pytest.mark.parametrize('vectorize', [True, False])
+def test_getter_forwards_nan(vectorize):
+    bank = TransformerBank(vectorize)
+    boiler = bank.add(Gboiler(unit_params[0]))
+    chp = bank.add(CHP({**unit_params[4], 'step_size': STEP_SIZE}))
+    boiler.step_size = STEP_SIZE
+    P_el, temp_out = boiler.getter('P_el'), chp.getter('temp_out', missing='skip')
+    assert P_el() is None and temp_out() == 'skip' # not computed yet
+
+    for unit in (boiler, chp):
+        unit.status, unit.Q_demand, unit.temp_in = 'on', 100000, float('nan')
+    bank.step(0)
+    assert math.isnan(temp_out())
+    assert boiler.getter('mdot')() == 0 # max(0, nan)
+    assert P_el() is None # a boiler has no electrical output
+    assert boiler.getter('status')() is None
+
+    chp.setter('Q_demand')(None)
+    assert bank.getter(chp.index, 'Q_demand')() is None
+
+@pytest.mark.parametrize('vectorize', [True, None])
+def test_simulator_get_data(vectorize):
+    from src.models.boiler_model_v2 import TransformerSimulator
+
+    sim = TransformerSimulator()
+    sim.bank.vectorize = vectorize
+    sim.init('Boiler', 1, STEP_SIZE, {**unit_params[0], 'eid_prefix' : 'boiler_'})
+    sim.create(2, 'Transformer', {**unit_params[0], 'step_size' : STEP_SIZE})
+    sim.step(0, {'boiler_0' : {'status' : {'ctrl' : 'on'}, 'Q_demand' : {'ctrl' : 100000}, 'temp_in' : {'ctrl' : 40}},
+                 'boiler_1' : {'temp_in' : {'ctrl' : 40}}}, None)
+
+    outputs = {'boiler_0' : ['P_th', 'status', 'heat_out_caps'], 'boiler_1' : ['P_th', 'set_temp']}
+    data = sim.get_data(outputs)
+    assert data == {'time' : 0, 'boiler_0' : {'P_th' : 200000.0}, 'boiler_1' : {'P_th' : 0.0, 'set_temp' : 75.0}}
+    assert len(sim.plans) == 1
+
+    sim.step(STEP_SIZE, {'boiler_1' : {'status' : {'ctrl' : 'on'}, 'Q_demand' : {'ctrl' : 100000}, 'temp_in' : {'ctrl' : 40}}}, None)
+    assert sim.get_data(outputs)['boiler_1']['P_th'] == 200000.0 # replayed plan reads the current arrays
+    assert len(sim.plans) == 1
+
+    with pytest.raises(ValueError):
+        sim.get_data({'boiler_0' : ['unknown']})
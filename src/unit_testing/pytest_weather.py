@@ -0,0 +1,43 @@
+import pytest
+import sys
+import os
+from pathlib import Path
+
+import pandas as pd
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.models import weather
+
+
+@pytest.fixture
+def datafile(tmp_path):
+    path = tmp_path / 'weather.csv'
+    lines = ['Time;Air temperature (°C);Wind speed (m/s);Global horizontal irradiance (W/m²);'
+             'Direct normal irradiance (W/m²);Horizontal infrared radiation (W/m²)']
+    for i, time in enumerate(['28.02. 22:00', '28.02. 23:00', '01.03. 00:00', '01.03. 01:00']):
+        lines.append(f'{time};{i - 1.5};{2*i};{10*i};{20*i};{250 + i}')
+    path.write_bytes('\n'.join(lines).encode('cp1252'))
+    return str(path)
+
+def test_read_weather(datafile):
+    data = weather.read_weather(datafile, 'Etc/GMT-1')
+    assert list(data.columns) == ['ghi', 'dni', 'dhi', 'temp_air', 'wind_speed']
+    assert data.index[0] == pd.Timestamp('2022-02-28 22:00', tz='Etc/GMT-1')
+    assert len(data) == 13 and data['ghi'].iloc[1] == 2.5 # 15 min, interpolated
+
+    leap = weather.read_weather(datafile, 'Etc/GMT-1', resolution='1h', year=2024)
+    assert leap.index[2] == pd.Timestamp('2024-02-29 00:00', tz='Etc/GMT-1') # the file has no 29.02., resampled
+
+def test_cache(datafile, tmp_path, monkeypatch):
+    monkeypatch.setattr(weather, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(weather, '_FRAMES', {})
+    ref = weather.read_weather(datafile, 'Etc/GMT-1')
+    pd.testing.assert_frame_equal(weather.load_weather(datafile, 'Etc/GMT-1'), ref, check_freq=False)
+
+    monkeypatch.setattr(weather, '_FRAMES', {}) # other process: loaded from the cache file
+    monkeypatch.setattr(weather, 'read_weather', lambda *args, **kwargs: pytest.fail('file parsed again'))
+    pd.testing.assert_frame_equal(weather.load_weather(datafile, 'Etc/GMT-1'), ref, check_freq=False)
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    assert weather.weather_key(datafile, 'Etc/GMT-1', '1h') != weather.weather_key(datafile, 'Etc/GMT-1')
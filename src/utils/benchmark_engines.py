@@ -0,0 +1,49 @@
+'''
+Compares the run time of the mosaik and the native engine of run_DES for the same parameters.
+
+Run from the repo root:
+    python src/utils/benchmark_engines.py --days 30
+'''
+from pathlib import Path
+import sys
+import os
+import json
+import copy
+import time
+import argparse
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))  # so 'src' is importable
+
+from src.main_sim import run_DES
+
+
+def benchmark(params, until, engines=('mosaik', 'native'), repeat=1):
+    '''
+    Returns the best wall time (in seconds) of `repeat` runs per engine.
+    '''
+    timings = {}
+    for engine in engines:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_DES(copy.deepcopy(params), engine=engine, until=until)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[engine] = best
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=30, help='simulated days per run')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--params', default=os.path.join(project_root, 'data', 'inputs', 'input_params.json'))
+    args = parser.parse_args()
+
+    with open(args.params, 'r') as f:
+        params = json.load(f)
+
+    timings = benchmark(params, args.days*24*60*60, repeat=args.repeat)
+    for engine, elapsed in timings.items():
+        print(f'{engine:>8} : {elapsed:8.2f} s')
+    print(f'speedup  : {timings["mosaik"]/timings["native"]:8.2f} x')
@@ -2,6 +2,8 @@
 This file will have a few helper functions, used accros this repo.
 '''
 import csv
+from collections.abc import Mapping
+from fnmatch import fnmatch
 import os
 import numpy as np
 import pandas as pd
@@ -48,7 +50,7 @@ def get_nested_attr(entity, attr): #Inspired from mosaik HWT model
     #The actual stuff:
     for level in attr_parts:
         try:
-            val = val[level] if isinstance(val, dict) else getattr(val, level)
+            val = val[level] if isinstance(val, Mapping) else getattr(val, level)
         except (KeyError, AttributeError) as e:
             raise RuntimeError(f'Missing {level} in {val}') from e
     
@@ -73,21 +75,114 @@ def set_nested_attr(entity, attr, val):
     attr_parts = attr.split('.')
     for level in attr_parts[:-1]:
         try:
-            entity = entity[level] if isinstance(entity, dict) else getattr(entity, level)
+            entity = entity[level] if isinstance(entity, Mapping) else getattr(entity, level)
         except (KeyError, AttributeError) as e:
             raise RuntimeError(f'Missing {level} in {entity}') from e
-    if isinstance(entity, dict):
+    if isinstance(entity, Mapping):
         entity[attr_parts[-1]] = val
     else:
         setattr(entity, attr_parts[-1], val)
 
+class AttrPath():
+    """
+    A dotted path (e.g. "tank_connections.tank1.heat_out2_F"), resolved once by compile_path to the final
+    container and key. get()/set(val) then access the value directly, without splitting the path and walking
+    the levels again.
+
+    Note: the intermediate levels are bound when compiling, if one of them is replaced by a new object later,
+    the path has to be compiled again.
+    """
+    __slots__ = ('attr', 'container', 'key')
+
+    def __init__(self, attr, container, key):
+        self.attr = attr
+        self.container = container
+        self.key = key
+
+    def get(self):
+        try:
+            return getattr(self.container, self.key)
+        except AttributeError as e:
+            raise RuntimeError(f'Missing {self.key} in {self.container}') from e
+
+    def set(self, val):
+        setattr(self.container, self.key, val)
+
+class DictPath(AttrPath):
+    """Path ending in a dictionary key."""
+    __slots__ = ()
+
+    def get(self):
+        try:
+            return self.container[self.key]
+        except KeyError as e:
+            raise RuntimeError(f'Missing {self.key} in {self.container}') from e
+
+    def set(self, val):
+        self.container[self.key] = val
+
+class TankConnectionPath(AttrPath):
+    """Property of a hot water tank connection, returned as float (like get_nested_attr)."""
+    __slots__ = ()
+
+    def get(self):
+        return float(getattr(self.container, self.key))
+
+def compile_path(entity, attr):
+    """
+    Resolves a dotted attribute path once, with the same lookup as get_nested_attr/set_nested_attr
+    (including the hot water tank special case).
+
+    Args:
+        entity (object | dict): The root object or dictionary.
+        attr (str): A dot-separated string representing the path.
+
+    Returns:
+        AttrPath: object with get() and set(val), holding the final container and key.
+
+    Raises:
+        RuntimeError: If any part of the path (except the last) is missing in the object/dict.
+    """
+    attr_parts = attr.split('.')
+
+    if hasattr(entity, 'tankno') and len(attr_parts) == 2: #checking if it's a tank
+        if attr_parts[0] in entity.sensors:
+            return AttrPath(attr, entity.sensors[attr_parts[0]], attr_parts[1])
+        elif attr_parts[0] in entity.connections:
+            return TankConnectionPath(attr, entity.connections[attr_parts[0]], attr_parts[1])
+        elif attr_parts[0] in entity.heating_rods:
+            return AttrPath(attr, entity.heating_rods[attr_parts[0]], attr_parts[1])
+
+    for level in attr_parts[:-1]:
+        try:
+            entity = entity[level] if isinstance(entity, Mapping) else getattr(entity, level)
+        except (KeyError, AttributeError) as e:
+            raise RuntimeError(f'Missing {level} in {entity}') from e
+    if isinstance(entity, Mapping):
+        return DictPath(attr, entity, attr_parts[-1])
+    return AttrPath(attr, entity, attr_parts[-1])
+
+class PathCache(dict):
+    """
+    Compiled paths of one entity, each path is compiled on first access:
+        paths = PathCache(model)
+        paths['tank_connections.tank1.heat_out2_F'].set(0.5)
+    """
+    def __init__(self, entity):
+        super().__init__()
+        self.entity = entity
+
+    def __missing__(self, attr):
+        path = self[attr] = compile_path(self.entity, attr)
+        return path
+
 def flatten_attrs(entity, attrs):
     flat_keys = []
     for attr in attrs:
             value = getattr(entity, attr)   # get the actual object
-            if isinstance(value, dict):
+            if isinstance(value, Mapping):
                 for key, val in value.items():
-                    if isinstance(val, dict):  # nested dict case
+                    if isinstance(val, Mapping):  # nested dict case
                         for subkey in val.keys():
                             flat_keys.append(f"{attr}.{key}.{subkey}")
                     else:
@@ -98,64 +193,87 @@ def flatten_attrs(entity, attrs):
     return flat_keys
 
 
-def debug_trace(time, attrs, entity, filename = 'debug_Log.csv', debug_log = {}, print_csv  = True, keyword = '', cycle = 0):
-    # Instead of passing debug_log each time, we can make it persistent using function attribute
-    
-    step_size = 900
-    print_freq = 50 # After how many steps, debug csv printed
+class DebugTracer():
+    """
+    Trace of attributes of one entity (e.g. a controller) to a csv file, one row per call of record():
 
-    model = filename.strip('_trace.csv')
-     # initialize persistent variable
-    if not hasattr(debug_trace, "last_time"):
-        debug_trace.last_time = time  # first call initializes it  
-    
+        tracer = DebugTracer('Controller_0_trace.csv', ['heat_demand', 'generators.hp_demand'], model)
+        tracer.record(time)   # per step (several calls at the same time are numbered in the cycle column)
+        tracer.close()        # writes the remaining rows
 
-    if not debug_log:
-        debug_log = {}
-        debug_log[model+'time'] = []
-        debug_log[model+'cycle'] = [] # to keep track of subcycles in event-based sim
-    # inputs received in form of a dict, with attr name and val
-    if isinstance(attrs, dict):
-        for attr, v in attrs.items():
-            for _, val in v.items():
-                if attr+keyword not in debug_log.keys():
-                    debug_log[attr+keyword] = []
-                debug_log[model+'time'].append(time)
-                debug_log[model+'cycle'].append(cycle)
-                debug_log[attr+keyword].append(val)
-    
-    elif isinstance(attrs, list):
-        for attr in attrs:
-            # attr = attr+keyword #to distinguish input and output
-            if attr+keyword not in debug_log.keys():
-                debug_log[attr+keyword] = []
-
-            debug_log[model+'time'].append(time)
-            debug_log[model+'cycle'].append(cycle)
-            debug_log[attr+keyword].append(get_nested_attr(entity, attr))
-            if not print_csv:
-                if time != debug_trace.last_time:
-                    tqdm.write(f'Clearing screen -----\n---------------------------------\n')
-                    # os.system('cls' if os.name == 'nt' else 'clear')
-                tqdm.write(f'time:{time}, last_time:{debug_trace.last_time}')
-                tqdm.write(f'attr: {attr}, val : {get_nested_attr(entity, attr)}')
-            debug_trace.last_time = time
-    # print(debug_log)
-            
-
-    path = os.getcwd()     
-    filepath = os.path.join(os.getcwd(), filename)
-    if print_csv:
-        if time % (step_size*print_freq) == 0 or time > 7560000:
-            # tqdm.write('printing debug csv')
-            with open(filepath, "w", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=debug_log.keys())
-                writer.writeheader()
-                for row in zip(*debug_log.values()):
-                    writer.writerow(dict(zip(debug_log.keys(), row)))
-
-
-    return debug_log
+    The rows are kept in preallocated column buffers and appended to the file every buffer_size rows, the file
+    is never rewritten. The columns are time, cycle and the attributes.
+
+    Args:
+        filename (str): csv file, relative to the working directory.
+        attrs (list): dotted attribute paths (see compile_path).
+        entity (object | dict): the traced entity.
+        every (int): record only every n-th time step.
+        sample (dict): attr : n, the attribute is written only every n-th recorded step (empty otherwise).
+        include (list): fnmatch patterns, only matching attrs are traced.
+        start, end (int): time window of the trace in seconds, end excluded (None: until the end).
+        buffer_size (int): rows kept in memory between two writes.
+    """
+    def __init__(self, filename, attrs, entity, every=1, sample=None, include=None, start=0, end=None, buffer_size=1024):
+        if include is not None:
+            attrs = [attr for attr in attrs if any(fnmatch(attr, pattern) for pattern in include)]
+        sample = sample or {}
+        paths = PathCache(entity)
+        self.filepath = os.path.join(os.getcwd(), filename)
+        self.attrs = list(attrs)
+        self.getters = [(paths[attr].get, sample.get(attr, 1)) for attr in self.attrs]
+        self.every = every
+        self.start = start
+        self.end = end
+        self.buffer_size = buffer_size
+        self.times = np.empty(buffer_size, dtype=np.int64)
+        self.cycles = np.empty(buffer_size, dtype=np.int32)
+        self.columns = [np.empty(buffer_size, dtype=object) for _ in self.attrs]
+        self.n_rows = 0
+        self.last_time = None
+        self.steps = 0 # recorded time steps
+        self.cycle = 0
+        self.record_step = False
+
+        with open(self.filepath, "w", newline="") as f:
+            csv.writer(f).writerow(['time', 'cycle'] + self.attrs)
+
+    def record(self, time):
+        if time < self.start or (self.end is not None and time >= self.end):
+            return
+        if time != self.last_time:
+            self.record_step = self.steps % self.every == 0
+            self.steps += 1
+            self.last_time = time
+            self.cycle = 0
+        else:
+            self.cycle += 1
+        if not self.record_step:
+            return
+
+        row = self.n_rows
+        self.times[row] = time
+        self.cycles[row] = self.cycle
+        step = (self.steps - 1) // self.every
+        for column, (get, n) in zip(self.columns, self.getters):
+            column[row] = get() if step % n == 0 else ''
+        self.n_rows += 1
+        if self.n_rows == self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered rows to the file."""
+        n = self.n_rows
+        if not n:
+            return
+        with open(self.filepath, "a", newline="") as f:
+            csv.writer(f).writerows(zip(self.times[:n].tolist(), self.cycles[:n].tolist(), *(column[:n] for column in self.columns)))
+        for column in self.columns:
+            column[:n] = None # release the references
+        self.n_rows = 0
+
+    def close(self):
+        self.flush()
 
 def calc_energy(vars, step_size): 
 
@@ -186,7 +304,7 @@ def flatten_keys(obj, attr_list):
         value = getattr(obj, attr)   # get the actual object
         if isinstance(value, dict):
                 for key, val in value.items():
-                    if isinstance(val, dict):  # nested dict case
+                    if isinstance(val, Mapping):  # nested dict case
                         for subkey in val.keys():
                             flat_keys.append(f"{attr}.{key}.{subkey}")
                     else:
@@ -0,0 +1,85 @@
+'''
+Read-only inputs of a sweep, shared by the worker processes.
+
+The parent process publishes the inputs once (InputStore.create) in a new directory of its own, so sweeps running
+at the same time do not touch each other's inputs: arrays and pandas Series (e.g. the demand series of scenario.pkl,
+the pv reference profiles) are written as .npy files, everything else (numbers, strings, nested dicts) to meta.json.
+The workers attach to the directory (InputStore(store.path)) and memory map the arrays read-only, so all processes
+share the same pages of the page cache instead of holding private copies.
+
+    store = InputStore.create('data/cache/sweep', {'scenario' : scenario})   # parent, e.g. data/cache/sweep/sweep-1234-ab12cd
+    scenario = InputStore(store.path)['scenario']                           # worker
+'''
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+
+
+class InputStore():
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.cache = {}
+
+    @classmethod
+    def create(cls, parent, inputs):
+        '''
+        Publishes inputs (a dict) in a new directory in parent and returns the attached store (the directory is
+        store.path).
+        '''
+        os.makedirs(parent, exist_ok=True)
+        path = tempfile.mkdtemp(prefix='sweep-%d-' % os.getpid(), dir=parent)
+        files = []
+
+        def save(values):
+            file = 'a%d.npy' % len(files)
+            files.append(file)
+            np.save(os.path.join(path, file), np.ascontiguousarray(values))
+            return file
+
+        def encode(obj):
+            if isinstance(obj, dict):
+                return {'dict' : {str(key) : encode(val) for key, val in obj.items()}}
+            if isinstance(obj, pd.Series):
+                index = obj.index.values.astype('datetime64[ns]') if isinstance(obj.index, pd.DatetimeIndex) else obj.index.to_numpy()
+                return {'series' : save(obj.to_numpy()), 'index' : save(index), 'name' : obj.name}
+            if isinstance(obj, np.ndarray):
+                return {'array' : save(obj)}
+            return {'value' : obj}
+
+        meta = {'inputs' : encode(inputs)}
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=4, default=lambda val: val.item()) # numpy scalars
+        return cls(path)
+
+    def _load(self, file):
+        return np.load(os.path.join(self.path, file), mmap_mode='r') # read-only
+
+    def _decode(self, item):
+        if 'dict' in item:
+            return {key : self._decode(val) for key, val in item['dict'].items()}
+        if 'series' in item:
+            return pd.Series(self._load(item['series']), index=pd.Index(self._load(item['index'])), name=item['name'], copy=False)
+        if 'array' in item:
+            return self._load(item['array'])
+        return item['value']
+
+    def __getitem__(self, name):
+        if name not in self.cache:
+            self.cache[name] = self._decode(self.meta['inputs']['dict'][name])
+        return self.cache[name]
+
+    def __contains__(self, name):
+        return name in self.meta['inputs']['dict']
+
+    def close(self):
+        '''Removes the directory of the published files (parent process, after the sweep).'''
+        self.cache.clear()
+        shutil.rmtree(self.path, ignore_errors=True)
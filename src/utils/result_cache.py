@@ -0,0 +1,109 @@
+'''
+Content addressed cache of simulation results.
+
+The key of a configuration (config_key) is the hash of
+* the canonical params (canonical_params: a copy without the keys run_DES derives from the others, and with
+  equivalent configurations normalized, e.g. the parameters of a CHP without capacity),
+* the digests of the input files (heat load, weather, scenario, ...),
+* the code version (code_version: hash of the source files in src and the versions of the model packages).
+
+ResultCache stores the KPIs of a key (and optionally the id of a run file with the time series) as json in
+data/cache/results/<key>.json; callers of run_DES look up the key before simulating:
+
+    cache = ResultCache()
+    key = config_key(params, [HEAT_LOAD_DATA, scenario_path])
+    result = cache.get(key)
+    if result is None:
+        ...
+        cache.put(key, {'costs' : cost, ...}, params=params)
+'''
+import copy
+import hashlib
+import json
+import os
+from functools import lru_cache
+from importlib.metadata import version, PackageNotFoundError
+
+from src.models import cached_csv
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cache', 'results'))
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PACKAGES = ['mosaik', 'mosaik-api-v3', 'mosaik-heatpump', 'mosaik-csv', 'pvlib', 'numpy', 'pandas']
+# parameters of the CHP that have no effect on the results if it has no capacity (set_flow has)
+CHP_ZERO_CAPACITY = ['elec_share', 'efficiency', 'startup_coeff', 'startup_limit', 'heating_value']
+
+@lru_cache(maxsize=None)
+def code_version():
+    '''Hash of the python files in src (without the tests) and of the versions of the model packages.'''
+    sha = hashlib.sha256()
+    for root, dirs, files in os.walk(SRC_DIR):
+        dirs[:] = sorted(d for d in dirs if d not in ('unit_testing', '__pycache__'))
+        for file in sorted(files):
+            if file.endswith('.py'):
+                sha.update(os.path.relpath(os.path.join(root, file), SRC_DIR).encode())
+                with open(os.path.join(root, file), 'rb') as f:
+                    sha.update(f.read())
+    for package in PACKAGES:
+        try:
+            sha.update(f'{package}=={version(package)}'.encode())
+        except PackageNotFoundError:
+            sha.update(f'{package}==None'.encode())
+    return sha.hexdigest()[:16]
+
+def canonical_params(params):
+    '''
+    Copy of params, which is equal for configurations with equal results:
+    * the keys run_DES adds (ctrl.tank, ctrl.signals, params_chp.step_size) are removed,
+    * a CHP without capacity (heat_out [0, 0]) has no CHP_ZERO_CAPACITY parameters.
+    '''
+    params = copy.deepcopy(params)
+    params.get('ctrl', {}).pop('tank', None)
+    params.get('ctrl', {}).pop('signals', None)
+    chp = params.get('params_chp')
+    if chp is not None:
+        chp.pop('step_size', None)
+        if max(chp.get('heat_out', [0])) == 0:
+            for key in CHP_ZERO_CAPACITY:
+                chp.pop(key, None)
+    return params
+
+def config_key(params, inputs=(), extra=None):
+    '''
+    Key of a configuration: canonical params, digests of the input files and code version.
+    extra (json serializable) is added to the key, e.g. the simulated period.
+    '''
+    key = {
+        'params' : canonical_params(params),
+        'inputs' : {os.path.basename(file) : cached_csv.digest(file) for file in inputs},
+        'code' : code_version(),
+        'extra' : extra,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class ResultCache():
+    def __init__(self, path=None):
+        self.path = path or CACHE_DIR
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, key):
+        '''The stored entry {'kpis' : {...}, 'run' : run id or None, 'params' : ...} of key, None if missing.'''
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, kpis, run=None, params=None):
+        '''Stores the KPIs (and the id of the run file) of key, written to a temporary file first and renamed.'''
+        os.makedirs(self.path, exist_ok=True)
+        entry = {'kpis' : kpis, 'run' : run, 'params' : canonical_params(params) if params is not None else None}
+        tmp = '%s.tmp%d' % (self._file(key), os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(entry, f, indent=4, default=str)
+        os.replace(tmp, self._file(key))
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
@@ -0,0 +1,222 @@
+'''
+Binary columnar files of the recorded time series of a run.
+
+A run file is a directory with one raw little endian file per column and meta.json, which holds the
+start, step size, number of rows and the type of every column:
+
+* 'f8' : float64, missing values are nan
+* 'b1' : bool as uint8
+* 'cat' : int32 codes into the list of categories in meta.json (strings, None; other objects are stored as str)
+
+RunFileWriter appends chunks of rows (e.g. one month, see collector.SpillingStore), meta.json is replaced
+after every chunk, so an interrupted run leaves a readable file. RunFile is a lightweight handle, which
+loads columns only when they are accessed (numeric columns are memory mapped).
+With compression='zlib', every chunk of a column is written as one zlib block (the sizes are listed in meta.json);
+compressed columns are decompressed when loaded instead of memory mapped.
+
+export_csv() writes a run file as csv (same layout as mosaik_csv_writer), also from the command line:
+
+    python -m src.utils.run_file data/outputs/DES_data data/outputs/DES_data.csv
+'''
+import argparse
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+DTYPES = {'f8' : '<f8', 'b1' : 'u1', 'cat' : '<i4'}
+COMPRESSIONS = (None, 'zlib')
+
+def kind_of(values):
+    if values.dtype == bool:
+        return 'b1'
+    if values.dtype == object:
+        return 'cat'
+    return 'f8'
+
+def merge_kinds(old, new):
+    if old == new:
+        return old
+    if 'cat' in (old, new):
+        return 'cat'
+    return 'f8' # bool and float
+
+
+class RunFileWriter():
+    def __init__(self, path, start, step_size, compression=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', use one of {COMPRESSIONS}.")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, META_FILE)):
+            os.remove(os.path.join(path, META_FILE)) # an earlier run in the same directory is overwritten
+        self.path = path
+        self.meta = {'start' : str(pd.Timestamp(start)), 'step_size' : step_size, 'n_rows' : 0, 'compression' : compression,
+                     'columns' : {}}
+
+    def _file(self, name):
+        return os.path.join(self.path, self.meta['columns'][name]['file'])
+
+    def _encode(self, name, values):
+        column = self.meta['columns'][name]
+        kind = column['kind']
+        if kind == 'cat':
+            categories = column['categories']
+            codes = {(type(cat), cat) : i for i, cat in enumerate(categories)} # keyed by type, True == 1
+            encoded = np.empty(len(values), dtype=DTYPES['cat'])
+            for i, val in enumerate(values):
+                if isinstance(val, float):
+                    val = None if val != val else float(val) # nan is missing
+                elif not (val is None or isinstance(val, (str, bool, int, float))):
+                    val = str(val)
+                code = codes.get((type(val), val))
+                if code is None:
+                    code = codes[(type(val), val)] = len(categories)
+                    categories.append(val)
+                encoded[i] = code
+            return encoded
+        return np.asarray(values, dtype=float if kind == 'f8' else bool).astype(DTYPES[kind])
+
+    def _write(self, name, values, mode='ab'):
+        encoded = self._encode(name, values)
+        with open(self._file(name), mode) as f:
+            if self.meta['compression'] is None:
+                encoded.tofile(f)
+                return
+            block = zlib.compress(encoded.tobytes())
+            column = self.meta['columns'][name]
+            column['blocks'] = (column.get('blocks', []) if mode == 'ab' else []) + [len(block)]
+            f.write(block)
+
+    def _missing(self, kind, n_rows):
+        return np.full(n_rows, np.nan if kind == 'f8' else None, dtype=float if kind == 'f8' else object)
+
+    def _rewrite(self, name, kind):
+        # the column changes its type, e.g. a string arrives in a float column: rewrite the rows written so far
+        values = read_column(self.path, self.meta['columns'][name], self.meta['n_rows'], compression=self.meta['compression'])
+        if kind == 'cat':
+            values = values.astype(object)
+        self.meta['columns'][name].update({'kind' : kind, 'categories' : []})
+        self._write(name, values, 'wb')
+
+    def append(self, columns, n_rows):
+        '''
+        Appends n_rows rows; columns maps the column names to arrays of length n_rows. Columns that are not
+        part of the chunk are filled with missing values, new columns are filled with missing values for the rows before.
+        '''
+        for name, values in columns.items():
+            kind = kind_of(values)
+            column = self.meta['columns'].get(name)
+            if column is None:
+                if self.meta['n_rows'] and kind == 'b1':
+                    kind = 'f8' # the earlier rows are missing
+                column = self.meta['columns'][name] = {'file' : 'c%d.bin' % len(self.meta['columns']), 'kind' : kind, 'categories' : []}
+                self._write(name, self._missing(kind, self.meta['n_rows']), 'wb')
+            elif merge_kinds(column['kind'], kind) != column['kind']:
+                self._rewrite(name, merge_kinds(column['kind'], kind))
+
+        for name, column in self.meta['columns'].items():
+            values = columns.get(name)
+            if values is None:
+                if column['kind'] == 'b1':
+                    self._rewrite(name, 'f8')
+                values = self._missing(column['kind'], n_rows)
+            self._write(name, values)
+
+        self.meta['n_rows'] += n_rows
+        tmp = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=4)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        return RunFile(self.path)
+
+
+def read_column(path, column, n_rows, mmap=False, compression=None):
+    file = os.path.join(path, column['file'])
+    dtype = DTYPES[column['kind']]
+    if compression is not None:
+        with open(file, 'rb') as f:
+            blocks = [zlib.decompress(f.read(size)) for size in column.get('blocks', [])]
+        raw = np.frombuffer(b''.join(blocks), dtype=dtype)[:n_rows]
+    elif mmap and n_rows:
+        raw = np.memmap(file, dtype=dtype, mode='r', shape=(n_rows,))
+    else:
+        raw = np.fromfile(file, dtype=dtype, count=n_rows)
+    if column['kind'] == 'b1':
+        return raw.astype(bool)
+    if column['kind'] == 'cat':
+        categories = np.empty(len(column['categories']), dtype=object)
+        categories[:] = column['categories']
+        return categories[raw]
+    return raw
+
+
+class RunFile():
+    '''
+    Handle of a run file, reads meta.json only; the columns are loaded when accessed:
+
+        run = RunFile(path)
+        run.columns                       # column names, '<full_id>-<attr>'
+        run['Boilersim_v2-0.boiler_0-P_th'] # pd.Series with DatetimeIndex
+        run.frame(numeric=True)           # DataFrame of all (numeric) columns
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+
+    @property
+    def columns(self):
+        return list(self.meta['columns'])
+
+    @property
+    def index(self):
+        return pd.date_range(self.meta['start'], periods=self.meta['n_rows'], freq=pd.Timedelta(seconds=self.meta['step_size']))
+
+    def values(self, name):
+        '''Values of one column as array, numeric columns are memory mapped (if not compressed).'''
+        return read_column(self.path, self.meta['columns'][name], self.meta['n_rows'], mmap=True,
+                           compression=self.meta.get('compression'))
+
+    def __getitem__(self, name):
+        return pd.Series(self.values(name), index=self.index, name=name)
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def frame(self, columns=None, numeric=False):
+        '''
+        DataFrame of the given columns (all by default), numeric=True skips the categorical columns.
+        '''
+        names = self.columns if columns is None else columns
+        if numeric:
+            names = [name for name in names if self.meta['columns'][name]['kind'] != 'cat']
+        return pd.DataFrame({name : np.array(self.values(name)) for name in names}, index=self.index)
+
+
+def export_csv(run, output_file, columns=None, date_format='%Y-%m-%d %H:%M:%S', nan_rep='NaN', chunk_rows=35040):
+    '''
+    Writes a run file (path or RunFile) as csv with a 'date' column and one column per recorded attribute,
+    like mosaik_csv_writer. The rows are written in chunks of chunk_rows.
+    '''
+    run = run if isinstance(run, RunFile) else RunFile(run)
+    names = run.columns if columns is None else columns
+    index = run.index
+    for start in range(0, max(len(run), 1), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        data = pd.DataFrame({name : np.array(run.values(name)[rows]) for name in names}, index=index[rows])
+        data.index.name = 'date'
+        data.to_csv(output_file, mode='w' if start == 0 else 'a', header=start == 0, date_format=date_format, na_rep=nan_rep)
+    return output_file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a run file as csv.')
+    parser.add_argument('run', help='directory of the run file')
+    parser.add_argument('output_file', help='csv file to write')
+    args = parser.parse_args()
+    export_csv(args.run, args.output_file)
@@ -0,0 +1,74 @@
+'''
+Append-only log of the results of a sweep (run_opti.py), one json line per finished configuration:
+
+    {"config" : "<hash of the params>", "status" : "ok", "runtime" : 12.3, "costs" : ..., "hp" : ..., ...}
+
+Every line is written with a single write to the file opened in append mode and synced to disk, so the results
+of the finished configurations survive an interruption of the sweep. A line cut off by a crash is not valid json,
+it is ignored when reading and removed when the log is opened with resume; the sweep then skips the configurations
+in done().
+'''
+import json
+import os
+
+import pandas as pd
+
+
+class SweepLog():
+    def __init__(self, path, resume=False):
+        '''Opens the log in path, which is cleared unless resume.'''
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if not resume or not os.path.exists(path):
+            open(path, 'w').close()
+        else:
+            self._truncate()
+
+    def _truncate(self):
+        '''Removes a line cut off by an interruption, so that the next entry starts on a new line.'''
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+    def entries(self):
+        '''All complete entries in the order they were written.'''
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
+
+    def last(self):
+        '''Last entry of every configuration, in the order of their last entries.'''
+        entries = {}
+        for entry in self.entries():
+            entries.pop(entry['config'], None)
+            entries[entry['config']] = entry
+        return entries
+
+    def done(self, status=('ok',)):
+        '''
+        Last entry of every configuration, if it has one of the given status (the others, e.g. an 'ok' followed by an
+        'error', are simulated again with resume).
+        '''
+        return {config : entry for config, entry in self.last().items() if entry.get('status') in status}
+
+    def append(self, entry):
+        line = (json.dumps(entry, default=str) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def frame(self):
+        '''Table of the last entry of every configuration.'''
+        return pd.DataFrame(list(self.last().values()))